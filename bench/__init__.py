@@ -0,0 +1,12 @@
+"""Micro-benchmarks behind the numbers quoted for the runtime changes.
+
+Each module runs on its own and prints a JSON summary:
+
+    python -m bench.router     # dispatch cost with 12 to 1200 routes
+    python -m bench.session    # pooled vs per-call requests to a stub server
+    python -m bench.outputs    # 1/10/100 outputs per input, buffered and pipelined
+    python -m bench.memory     # tracemalloc footprint at 100k users / 1M claims
+
+The rollup server is a local replay.stub.StubServer, so no Cartesi node
+is needed.
+"""
@@ -0,0 +1,97 @@
+"""tracemalloc footprint of the users and claims state.
+
+    python -m bench.memory [--users N] [--claims N]
+
+Builds the same state, every claim open and listed in its user's
+open_claims, three ways:
+
+- "baseline": the dict-backed model classes from before __slots__, keyed
+  by lowercase hex addresses;
+- "compact": model.User and model.Claim keyed by packed addresses;
+- "store": the compact classes in a ClaimStore, which adds its indexes.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+os.environ.setdefault("ROLLUP_HTTP_SERVER_URL", "http://bench.invalid")
+
+import model
+
+class BaselineUser:
+    def __init__(self):
+        self.open_claims = {}
+        self.open_disputes = {}
+        self.total_disputes = 0
+        self.won_disputes = 0
+        self.total_claims = 0
+        self.correct_claims = 0
+
+class BaselineClaim:
+    def __init__(self, user_address, disputing_user_address, value, last_edited, status, data_chunks):
+        self.user_address = user_address
+        self.disputing_user_address = disputing_user_address
+        self.value = value
+        self.last_edited = last_edited
+        self.status = status
+        self.data_chunks = data_chunks
+
+def addresses(count):
+    # Built outside the measurement, as they would come from inputs.
+    return ["0x" + n.to_bytes(20, "big").hex() for n in range(count)]
+
+def build_baseline(user_addresses, claims):
+    users = {address.lower(): BaselineUser() for address in user_addresses}
+    claim_map = {}
+    for claim_id in range(claims):
+        address = user_addresses[claim_id % len(user_addresses)].lower()
+        claim = BaselineClaim(address, None, claim_id, claim_id, model.Status.OPEN, None)
+        claim_map[claim_id] = claim
+        users[address].open_claims[claim_id] = claim
+    return users, claim_map
+
+def build_compact(user_addresses, claims, store=False):
+    users = {model.pack_address(address): model.User() for address in user_addresses}
+    claim_map = model.ClaimStore() if store else {}
+    for claim_id in range(claims):
+        address = model.pack_address(user_addresses[claim_id % len(user_addresses)])
+        claim = model.Claim(address, None, claim_id, claim_id, model.Status.OPEN, None)
+        if store:
+            claim_map.add(claim_id, claim)
+        else:
+            claim_map[claim_id] = claim
+        users[address].open_claims[claim_id] = claim
+    return users, claim_map
+
+def measure(build, *args):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        state = build(*args)
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del state
+    gc.collect()
+    return size
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.memory")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--claims", type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    user_addresses = addresses(args.users)
+    mib = 1024 * 1024
+    results = {"users": args.users, "claims": args.claims}
+    results["baseline_mib"] = round(measure(build_baseline, user_addresses, args.claims) / mib, 1)
+    results["compact_mib"] = round(measure(build_compact, user_addresses, args.claims) / mib, 1)
+    results["store_mib"] = round(measure(build_compact, user_addresses, args.claims, True) / mib, 1)
+    print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Output throughput for 1, 10 and 100 outputs per input.
+
+    python -m bench.outputs [--outputs N]
+
+Each input sends its notices to a local stub rollup server, then a
+/finish, in three ways:
+
+- "send_post": one blocking send_post per output, as before OutputBuffer;
+- "buffer": queued in an OutputBuffer flushed when the input ends;
+- "async": posted through handler.async_handler.AsyncRollupClient, which
+  pipelines them on one connection.
+
+The /finish of every input is part of the measurement, so with one output
+per input half the requests are finishes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("ROLLUP_HTTP_SERVER_URL", "http://bench.invalid")
+
+from handler.async_handler import AsyncRollupClient
+from replay.stub import RollupStub, StubServer
+from rollups import message
+
+PAYLOAD = "0x" + "00" * 64
+
+def run_send_post(url, inputs, outputs):
+    for _ in range(inputs):
+        for _ in range(outputs):
+            message.send_post("notice", {"payload": PAYLOAD})
+        message.send_post("finish", {"status": "accept"})
+
+def run_buffer(url, inputs, outputs):
+    for _ in range(inputs):
+        with message.OutputBuffer() as buffer:
+            for _ in range(outputs):
+                buffer.add_notice(PAYLOAD)
+        message.send_post("finish", {"status": "accept"})
+
+def run_async(url, inputs, outputs):
+    async def run():
+        client = AsyncRollupClient(url)
+        await client.connect()
+        try:
+            for _ in range(inputs):
+                await asyncio.gather(*[client.post("notice", {"payload": PAYLOAD}) for _ in range(outputs)])
+                await client.post("finish", {"status": "accept"})
+        finally:
+            await client.close()
+    asyncio.run(run())
+
+MODES = {"send_post": run_send_post, "buffer": run_buffer, "async": run_async}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.outputs")
+    parser.add_argument("--outputs", type=int, default=2000, help="outputs sent per measurement")
+    args = parser.parse_args(argv)
+
+    previous_url = message.rollup_server
+    results = []
+    with StubServer(RollupStub([])) as server:
+        message.rollup_server = server.url
+        message.close_session()
+        try:
+            for per_input in (1, 10, 100):
+                inputs = max(1, args.outputs // per_input)
+                row = {"outputs_per_input": per_input, "inputs": inputs}
+                for name, run in MODES.items():
+                    start = time.perf_counter()
+                    run(server.url, inputs, per_input)
+                    seconds = time.perf_counter() - start
+                    row[f"{name}_outputs_per_sec"] = round(inputs * per_input / seconds, 1)
+                results.append(row)
+        finally:
+            message.close_session()
+            message.rollup_server = previous_url
+    print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
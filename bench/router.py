@@ -0,0 +1,64 @@
+"""Advance dispatch cost as the number of registered routes grows.
+
+    python -m bench.router [--inputs N]
+
+Routes are split between sender, selector and method routes. Inputs hit
+the last registered method and selector routes, so a router trying
+routes one by one would get slower with every route added.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("ROLLUP_HTTP_SERVER_URL", "http://bench.invalid")
+
+from handler.handler import RoutesAdvanceHandler
+from rollups.message import Metadata
+from rollups.util import bin2hex, str2hex
+
+def build_router(routes):
+    router = RoutesAdvanceHandler()
+    handler = lambda metadata, payload: None
+    for n in range(routes // 3):
+        router.add_sender_route("0x" + n.to_bytes(20, "big").hex(), handler)
+        router.add_selector_route(n.to_bytes(4, "big"), handler)
+        router.add_method_route(f"method{n}", handler)
+    return router
+
+def measure(router, metadata, payloads, inputs):
+    handle = router.handle
+    start = time.perf_counter()
+    for _ in range(inputs // len(payloads)):
+        for payload in payloads:
+            handle(metadata, payload)
+    return (time.perf_counter() - start) / (inputs // len(payloads) * len(payloads))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.router")
+    parser.add_argument("--inputs", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    results = []
+    for routes in (12, 60, 120, 600, 1200):
+        router = build_router(routes)
+        last = routes // 3 - 1
+        metadata = Metadata("0x" + "ff" * 20, 0, 0, 0, 0)
+        # Distinct payload strings, so the decoded payload cache misses as
+        # it does for real inputs.
+        methods = [str2hex(json.dumps({"method": f"method{last}", "n": n})) for n in range(64)]
+        selectors = [bin2hex(last.to_bytes(4, "big") + n.to_bytes(32, "big")) for n in range(64)]
+        senders = [bin2hex(n.to_bytes(32, "big")) for n in range(64)]
+        sender = Metadata("0x" + last.to_bytes(20, "big").hex(), 0, 0, 0, 0)
+        results.append({
+            "routes": routes,
+            "method_us": round(measure(router, metadata, methods, args.inputs) * 1e6, 3),
+            "selector_us": round(measure(router, metadata, selectors, args.inputs) * 1e6, 3),
+            "sender_us": round(measure(router, sender, senders, args.inputs) * 1e6, 3),
+        })
+    print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Requests per second to a local stub rollup server, pooled vs per call.
+
+    python -m bench.session [--requests N]
+
+"per_call" sends every notice with requests.post, opening a connection
+each time as send_post did before the shared session; "pooled" goes
+through rollups.message.send_post and its keep-alive session.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("ROLLUP_HTTP_SERVER_URL", "http://bench.invalid")
+
+import requests
+
+from replay.stub import RollupStub, StubServer
+from rollups import message
+
+def per_call(url, payload):
+    requests.post(f"{url}/notice", json=payload).raise_for_status()
+
+def pooled(url, payload):
+    message.send_post("notice", payload)
+
+def measure(send, url, count):
+    payload = {"payload": "0x" + "00" * 64}
+    send(url, payload)
+    start = time.perf_counter()
+    for _ in range(count):
+        send(url, payload)
+    return count / (time.perf_counter() - start)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.session")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    previous_url = message.rollup_server
+    with StubServer(RollupStub([])) as server:
+        message.rollup_server = server.url
+        message.close_session()
+        try:
+            results = {"requests": args.requests}
+            for name, send in (("per_call", per_call), ("pooled", pooled)):
+                rates = [measure(send, server.url, args.requests) for _ in range(args.rounds)]
+                results[f"{name}_req_per_sec"] = round(max(rates), 1)
+        finally:
+            message.close_session()
+            message.rollup_server = previous_url
+    results["speedup"] = round(results["pooled_req_per_sec"] / results["per_call_req_per_sec"], 2)
+    print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
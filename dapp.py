@@ -1,22 +1,23 @@
 from os import environ
 import logging
-import requests
 
+from rollups import log
+from rollups.scheduler import RequestLoop
 from rollups.util import hex2str, str2hex
 
-logging.basicConfig(level="INFO")
+log.configure(log.LogLevel.INFO)
 logger = logging.getLogger(__name__)
 
 rollup_server = environ["ROLLUP_HTTP_SERVER_URL"]
-logger.info(f"HTTP rollup_server url is {rollup_server}")
+logger.info("HTTP rollup_server url is %s", rollup_server)
 
 def handle_advance(data):
-    logger.info(f"Received advance request data {data}")
+    logger.info("Received advance request data %s", log.payload(data))
     dataa = int(data)*5
     return dataa
 
 def handle_inspect(data):
-    logger.info(f"Received inspect request data {data}")
+    logger.info("Received inspect request data %s", log.payload(data))
     dataa = int(hex2str(data['payload']))**2
     return dataa
 
@@ -25,16 +26,6 @@ handlers = {
     "inspect_state": handle_inspect,
 }
 
-finish = {"status": "accept"}
-
-while True:
-    logger.info("Sending finish")
-    response = requests.post(rollup_server + "/finish", json=finish)
-    logger.info(f"Received finish status {response.status_code}")
-    if response.status_code == 202:
-        logger.info("No pending rollup request, trying again")
-    else:
-        rollup_request = response.json()
-        data = rollup_request["data"]
-        handler = handlers[rollup_request["request_type"]]
-        finish["status"] = handler(rollup_request["data"])
+if __name__ == "__main__":
+    loop = RequestLoop(handlers)
+    loop.run()
@@ -1,9 +1,12 @@
-import json
 import logging
 import os
 import re
 import model.model  # Assuming model.py is the Python equivalent of dapp/model
+import model.snapshot
 import processor.processor  # Assuming processor.py is the Python equivalent of dapp/processor
+from handler.cache import InspectCache, StateVersions
+from rollups import pager, util
+from rollups.message import MessageException, Report, send_report
 
 # Set up logging
 info_log = logging.getLogger('info')
@@ -14,31 +17,179 @@ logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 claim_timeout = 30  # Example value, adjust as needed
 dispute_timeout = 30  # Example value, adjust as needed
 users = {}
-claims = {}
+claims = model.ClaimStore()
+claim_list_page_size = 100  # Default number of claims per get_claim_list page
+deadlines = model.DeadlineQueue()
+# Decides the disputes that reach dispute_timeout: called with the claim id
+# and Claim, returns model.Status.VALIDATED or CONTRADICTED, or None to
+# leave the claim DISPUTING. The DApp sets it; until it does, disputes are
+# never decided by time, as before deadlines were tracked.
+dispute_resolver = None
+snapshots = None  # model.snapshot.SnapshotManager, see enable_snapshots
+# Inspect results are cached until an advance changes the users or claims
+# they were built from.
+state_versions = StateVersions()
+inspect_cache = InspectCache(state_versions)
 
 # Function definitions
 def get_user(address):
+    address = model.pack_address(address)
     user = users.get(address)
     if user is None:
-        new_user = model.User(open_claims={}, open_disputes={})
+        new_user = model.User()
         users[address] = new_user
         user = users[address]
+    if snapshots is not None:
+        snapshots.mark_user(address)
+    state_versions.bump(("user", address))
     return user
 
+def enable_snapshots(directory, every=1000, full_every=10):
+    """Restores the state from the snapshots in `directory` and keeps writing them.
+
+    Advance handling should call snapshots.after_input(metadata.input_index)
+    once each input has been applied.
+
+    Returns:
+        int: The input index covered by the restored state, or None if no
+        snapshot was found.
+    """
+    global snapshots
+    snapshots = model.snapshot.SnapshotManager(directory, users, claims, every, full_every)
+    input_index = snapshots.restore()
+    state_versions.bump_all()
+    for claim_id in claims:
+        schedule_claim_deadline(claim_id)
+    return input_index
+
+def _deadline_token(claim):
+    return (claim.status, claim.last_edited)
+
+def _is_current_deadline(claim_id, token):
+    claim = claims.get(claim_id)
+    return claim is not None and _deadline_token(claim) == token
+
+def schedule_claim_deadline(claim_id):
+    claim = claims[claim_id]
+    if claim.status == model.Status.OPEN:
+        timeout = claim_timeout
+    elif claim.status == model.Status.DISPUTING:
+        timeout = dispute_timeout
+    else:
+        return
+    deadlines.schedule(claim.last_edited + timeout, claim_id, _deadline_token(claim))
+
+def _claim_changed(claim_id, claim):
+    # Only the tags get_claim_list results are cached under.
+    state_versions.bump(("claims", claim.user_address), "claims")
+
+def add_claim(claim_id, claim):
+    claims.add(claim_id, claim)
+    _claim_changed(claim_id, claim)
+    schedule_claim_deadline(claim_id)
+    return claim
+
+def update_claim(claim_id, **changes):
+    """Changes a claim through the store and reschedules its deadline.
+
+    Any previous deadline of the claim is cancelled lazily by the queue.
+    Changes that keep its status and last_edited keep its deadline.
+    """
+    previous = claims[claim_id]
+    previous_user = previous.user_address
+    previous_token = _deadline_token(previous)
+    claim = claims.update(claim_id, **changes)
+    if previous_user != claim.user_address:
+        state_versions.bump(("claims", previous_user))
+    _claim_changed(claim_id, claim)
+    if _deadline_token(claim) != previous_token:
+        schedule_claim_deadline(claim_id)
+    return claim
+
+def resolve_dispute(claim_id, claim):
+    if dispute_resolver is None:
+        return None
+    status = dispute_resolver(claim_id, claim)
+    if status not in (None, model.Status.VALIDATED, model.Status.CONTRADICTED):
+        raise ValueError(f"Invalid dispute resolution {status!r} for claim {claim_id}")
+    return status
+
+def expire_claims(timestamp):
+    """Finalizes the claims whose timeout passed at block `timestamp`.
+
+    OPEN claims become FINALIZED and DISPUTING claims are resolved to
+    VALIDATED or CONTRADICTED by dispute_resolver; a dispute it leaves
+    undecided stays DISPUTING and is not visited again. Only expired claims
+    are visited. Meant to be called at the start of every advance with the
+    input's Metadata.timestamp.
+    """
+    expired = deadlines.pop_expired(timestamp, _is_current_deadline)
+    for claim_id in expired:
+        claim = claims[claim_id]
+        if claim.status == model.Status.OPEN:
+            update_claim(claim_id, status=model.Status.FINALIZED, last_edited=timestamp)
+        elif claim.status == model.Status.DISPUTING:
+            status = resolve_dispute(claim_id, claim)
+            if status is not None:
+                update_claim(claim_id, status=status, last_edited=timestamp)
+    return expired
+
+def _send_report_page(payload_hex):
+    if send_report(Report(payload=payload_hex)) is None:
+        raise MessageException("Report could not be sent")
+
+def send_json_report(route, payload_map, tags, document):
+    """Sends `document()` as JSON in hex report pages, through the inspect cache.
+
+    The document is streamed with rollups.pager, so it is never built as a
+    whole. The pages sent are kept for the cache as long as they fit in its
+    budget; a hit resends them without encoding anything.
+    """
+    key = inspect_cache.key(route, payload_map)
+    pages = inspect_cache.get(key)
+    if pages is not None:
+        for page in pages:
+            _send_report_page(page)
+        return
+    stamp = state_versions.clock
+    pages = []
+    size = 0
+
+    def send(page):
+        nonlocal size
+        _send_report_page(page)
+        size += len(page)
+        if size <= inspect_cache.max_bytes:
+            pages.append(page)
+
+    pager.send_json(document(), send)
+    if size <= inspect_cache.max_bytes:
+        inspect_cache.put(key, tags, tuple(pages), stamp)
+
 def get_claim_list(payload_map):
     info_log.info("Got claim list request")
-    claim_list = []
-    for k in claims:
-        simplified_claim = model.SimplifiedClaim(
-            id=k, 
-            status=claims[k].status, 
-            value=claims[k].value
+    status = payload_map.get("status")
+    if isinstance(status, str):
+        status = model.Status.from_name(status)
+    user_address = payload_map.get("user")
+    if user_address:
+        user_address = model.pack_address(user_address)
+    limit = int(payload_map.get("limit", claim_list_page_size))
+
+    def build():
+        claim_ids, cursor = claims.list(status=status, user=user_address, cursor=payload_map.get("cursor"), limit=limit)
+        simplified_claims = (
+            model.SimplifiedClaim(id=k, status=claims[k].status, value=claims[k].value)
+            for k in claim_ids
         )
-        claim_list.append(simplified_claim)
+        return {"claims": simplified_claims, "cursor": cursor}
 
-    claim_list_json = json.dumps(claim_list)
-    # The rest of the function would involve sending this data as a report
-    # Depends on the Python equivalent of rollups.SendReport
+    tags = [("claims", user_address)] if user_address else ["claims"]
+    try:
+        send_json_report("get_claim_list", payload_map, tags, build)
+    except MessageException as e:
+        error_log.error(f"GetClaimList: error making http request: {e}")
+        raise
     return None
 
 def show_user(payload_map):
@@ -47,7 +198,7 @@ def show_user(payload_map):
 
     if not user_address:
         message = "ShowUser: Not enough parameters, you must provide string 'id'"
-        report = Report(payload=message)
+        report = Report(payload=util.str2hex(message))
         try:
             send_report(report)
         except MessageException as e:
@@ -55,12 +206,16 @@ def show_user(payload_map):
             raise MessageException(message) from e
         raise MessageException(message)
 
-    user_address = user_address.lower()
     info_log.info(f"For user {user_address}")
 
+    try:
+        user_address = model.pack_address(user_address)
+    except ValueError:
+        user_address = None
+
     if user_address not in users:
         message = "ShowUser: User doesn't exist"
-        report = Report(payload=message)
+        report = Report(payload=util.str2hex(message))
         try:
             send_report(report)
         except MessageException as e:
@@ -71,11 +226,8 @@ def show_user(payload_map):
     user = users[user_address]
 
     try:
-        user_json = json.dumps(user.__dict__)  # Assuming User class has __dict__ for serialization
-        report = Report(payload=user_json)
-        response = send_report(report)
-        info_log.info(f"Received report status {response.status_code}")
-    except json.JSONDecodeError as e:
+        send_json_report("show_user", payload_map, [("user", user_address)], lambda: user)
+    except TypeError as e:
         error_log.error(f"Error in JSON serialization: {e}")
         raise
     except MessageException as e:
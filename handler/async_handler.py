@@ -0,0 +1,310 @@
+import asyncio
+import inspect
+import json
+from collections import deque
+from urllib.parse import urlsplit
+
+from rollups import log
+from rollups.message import Metadata, MessageException, rollup_server
+from rollups.scheduler import Backoff
+from handler.handler import LogLevel, RoutesAdvanceHandler, RoutesInspectHandler, ErrorLogger
+
+class _Request:
+    __slots__ = ("future", "data", "retries")
+
+    def __init__(self, future, data):
+        self.future = future
+        self.data = data
+        self.retries = 0
+
+class AsyncRollupClient:
+    """Non-blocking HTTP/1.1 client holding one keep-alive connection.
+
+    `post` writes the request to the connection as soon as it is called and
+    returns a future, so several requests can be in flight at once
+    (pipelined). The server answers them in order, which keeps outputs in
+    the order they were sent; responses are matched to requests by a
+    single reader task.
+
+    When the server closes the connection, the requests still waiting for
+    an answer are sent again, in order, on a new connection:
+    - after a response with "Connection: close", the server has not
+      handled the requests that followed it, so they are always resent;
+    - when the connection ends between two responses, e.g. a keep-alive
+      connection that timed out, a request is resent at most `retries`
+      times.
+    A connection lost in the middle of a response fails the waiting
+    requests, since the server may already have handled them.
+    """
+
+    def __init__(self, url=None, retries=1):
+        parts = urlsplit(url or rollup_server)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.retries = retries
+        self._writer = None
+        self._pending = deque()
+        self._read_task = None
+        self._connect_task = None
+
+    async def connect(self):
+        if self._writer is None:
+            await self._ensure_connection()
+        if self._writer is None:
+            raise MessageException(f"Could not connect to the rollup server at {self.host}:{self.port}")
+
+    def _ensure_connection(self):
+        if self._connect_task is None:
+            self._connect_task = asyncio.ensure_future(self._open())
+        return self._connect_task
+
+    async def _open(self):
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except OSError as e:
+            self._fail_pending(MessageException(f"HTTP request to {self.host}:{self.port} failed: {e}"))
+            return
+        finally:
+            self._connect_task = None
+        self._writer = writer
+        for request in self._pending:
+            writer.write(request.data)
+        self._read_task = asyncio.ensure_future(self._read_loop(reader, writer))
+
+    async def close(self):
+        if self._connect_task is not None:
+            self._connect_task.cancel()
+            self._connect_task = None
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending(MessageException("Connection closed"))
+
+    def _fail_pending(self, exc):
+        while self._pending:
+            future = self._pending.popleft().future
+            if not future.done():
+                future.set_exception(exc)
+
+    def _resend_pending(self, counted):
+        # Requests past their retries fail; the others keep their order.
+        pending, self._pending = self._pending, deque()
+        for request in pending:
+            if request.future.done():
+                continue
+            if counted:
+                if request.retries >= self.retries:
+                    request.future.set_exception(MessageException(f"HTTP request to {self.host}:{self.port} failed: connection closed by the server"))
+                    continue
+                request.retries += 1
+            self._pending.append(request)
+        if self._pending:
+            self._ensure_connection()
+
+    def post(self, endpoint, json_data):
+        """Sends a POST request right away, connecting first if needed.
+
+        Returns:
+            asyncio.Future: Resolves to (status code, response body bytes).
+        """
+        body = json.dumps(json_data).encode()
+        head = (
+            f"POST {self.prefix}/{endpoint} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json; charset=UTF-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        ).encode()
+        request = _Request(asyncio.get_running_loop().create_future(), head + body)
+        self._pending.append(request)
+        if self._writer is not None:
+            self._writer.write(request.data)
+        else:
+            self._ensure_connection()
+        return request.future
+
+    async def _read_loop(self, reader, writer):
+        error = None
+        counted = True
+        try:
+            while True:
+                status_line = await reader.readline()
+                if not status_line:
+                    # Closed between two responses.
+                    break
+                status, body, close = await self._read_response(reader, status_line)
+                if not self._pending:
+                    raise ConnectionError("Unexpected response from the server")
+                future = self._pending.popleft().future
+                if not future.done():
+                    future.set_result((status, body))
+                if close:
+                    counted = False
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        writer.close()
+        if self._writer is writer:
+            self._writer = None
+            self._read_task = None
+        if error is not None:
+            self._fail_pending(MessageException(f"HTTP request to {self.host}:{self.port} failed: {error}"))
+        else:
+            self._resend_pending(counted)
+
+    async def _read_response(self, reader, status_line):
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                parts.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(parts)
+        else:
+            body = await reader.readexactly(int(headers.get("content-length", "0")))
+        close = headers.get("connection", "").lower() == "close"
+        return status, body, close
+
+
+class AsyncHandler:
+    """asyncio counterpart of handler.Handler.
+
+    Advance and inspect handlers may be plain functions or coroutines. The
+    send_* methods put the output on the wire immediately and return a
+    future, so a handler can emit many outputs without waiting for each
+    round trip; their order is kept and they are all confirmed before the
+    input is finished.
+    """
+
+    def __init__(self, advance_handler=None, inspect_handler=None, log_level: LogLevel = LogLevel.INFO, client=None, backoff=None):
+        self.advance_handler = advance_handler if advance_handler is not None else RoutesAdvanceHandler()
+        self.inspect_handler = inspect_handler if inspect_handler is not None else RoutesInspectHandler()
+        self.log_level = log_level
+        self.client = client if client is not None else AsyncRollupClient()
+        self.backoff = backoff if backoff is not None else Backoff.from_env()
+        self._outputs = []
+
+    def set_debug(self):
+        self.set_log_level(LogLevel.DEBUG)
+
+    def set_log_level(self, log_level: LogLevel):
+        self.log_level = log_level
+        log.set_log_level(log_level)
+
+    def _send(self, endpoint, json_data, index):
+        future = self.client.post(endpoint, json_data)
+        result = asyncio.ensure_future(self._check(endpoint, future, index))
+        self._outputs.append(result)
+        return result
+
+    async def _check(self, endpoint, future, index):
+        status, body = await future
+        if status >= 400:
+            raise MessageException(f"HTTP request to {endpoint} failed with status {status}")
+        return json.loads(body)["index"] if index else None
+
+    def send_notice(self, payload_hex: str):
+        return self._send("notice", {"payload": payload_hex}, True)
+
+    def send_voucher(self, destination: str, payload_hex: str):
+        return self._send("voucher", {"destination": destination, "payload": payload_hex}, True)
+
+    def send_report(self, payload_hex: str):
+        return self._send("report", {"payload": payload_hex}, False)
+
+    def send_exception(self, payload_hex: str):
+        return self._send("exception", {"payload": payload_hex}, False)
+
+    async def _call(self, handle, *args):
+        # Outputs sent while handling one input are confirmed with it and
+        # never carried over to the next one, even if the handler raises.
+        try:
+            result = handle(*args)
+            if inspect.isawaitable(result):
+                result = await result
+        except BaseException:
+            outputs, self._outputs = self._outputs, []
+            await asyncio.gather(*outputs, return_exceptions=True)
+            raise
+        outputs, self._outputs = self._outputs, []
+        await asyncio.gather(*outputs)
+        return result
+
+    async def handle_advance(self, data):
+        metadata = Metadata(**data["metadata"])
+        try:
+            await self._call(self.advance_handler.handle, metadata, data["payload"])
+        except Exception as e:
+            ErrorLogger.error("Error handling advance input %d: %s", metadata.input_index, e)
+            return "reject"
+        return "accept"
+
+    async def handle_inspect(self, data):
+        try:
+            await self._call(self.inspect_handler.handle, data["payload"])
+        except Exception as e:
+            ErrorLogger.error("Error handling inspect request: %s", e)
+            return "reject"
+        return "accept"
+
+    async def poll(self, status):
+        """Finishes the previous input and handles the next one, if any.
+
+        Returns:
+            str: The finish status for the handled input, or None on an
+            idle poll.
+        """
+        code, body = await self.client.post("finish", {"status": status})
+        if code == 202:
+            delay = self.backoff.next_delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return None
+        if code >= 400:
+            raise MessageException(f"HTTP request to finish failed with status {code}")
+        self.backoff.reset()
+        rollup_request = json.loads(body)
+        if rollup_request["request_type"] == "advance_state":
+            return await self.handle_advance(rollup_request["data"])
+        return await self.handle_inspect(rollup_request["data"])
+
+    async def run_async(self, max_inputs=None):
+        await self.client.connect()
+        status = "accept"
+        processed = 0
+        try:
+            while max_inputs is None or processed < max_inputs:
+                result = await self.poll(status)
+                if result is not None:
+                    status = result
+                    processed += 1
+        finally:
+            await self.client.close()
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+def run(handler: AsyncHandler):
+    handler.run()
+
+def run_debug(handler: AsyncHandler):
+    handler.set_debug()
+    handler.run()
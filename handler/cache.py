@@ -0,0 +1,158 @@
+import json
+import os
+from collections import OrderedDict
+
+# Default memory budget of the inspect cache, counted over the cached
+# payloads only.
+cache_size = int(os.getenv("DAPP_INSPECT_CACHE_SIZE", str(8 * 1024 * 1024)))
+
+def _size(value):
+    # Results are str or bytes, or tuples of them for reports sent in pages.
+    return sum(map(len, value)) if isinstance(value, tuple) else len(value)
+
+class StateVersions:
+    """Version stamps for the parts of the state inspect results depend on.
+
+    Tags are any hashable values, e.g. ("user", address). Every `bump` takes
+    a new stamp from one increasing clock, so a result computed at stamp S
+    is still valid as long as none of its tags was bumped after S.
+
+    Tags are not kept for every user or claim ever changed: once there are
+    more than `min_prune` of them, the caches using these versions drop
+    their stale results and restamp the others with the current clock,
+    after which no tag bumped so far can invalidate anything and all of
+    them are forgotten.
+    """
+
+    min_prune = 1024
+
+    def __init__(self):
+        self.clock = 0
+        self._versions = {}
+        self._caches = []
+
+    def __len__(self):
+        return len(self._versions)
+
+    def bump(self, *tags):
+        self.clock += 1
+        for tag in tags:
+            self._versions[tag] = self.clock
+        if len(self._versions) > self.min_prune:
+            self.prune()
+
+    def prune(self):
+        """Forgets every tag, revalidating the cached results first."""
+        for cache in self._caches:
+            cache.restamp(self.clock)
+        self._versions.clear()
+
+    def bump_all(self):
+        """Invalidates every result, e.g. after the state is restored."""
+        self.clock += 1
+        self._versions.clear()
+        self._versions[None] = self.clock
+
+    def changed_since(self, tags, stamp):
+        versions = self._versions
+        if versions.get(None, 0) > stamp:
+            return True
+        for tag in tags:
+            if versions.get(tag, 0) > stamp:
+                return True
+        return False
+
+class InspectCache:
+    """LRU cache of serialized inspect results under a byte budget.
+
+    Entries are keyed by route and normalized payload and hold the result
+    together with the state tags it was computed from. An entry is served
+    only while none of its tags changed; stale entries are dropped when they
+    are looked up, and the least recently used ones when the budget is
+    exceeded.
+    """
+
+    def __init__(self, versions=None, max_bytes=None):
+        self.versions = versions if versions is not None else StateVersions()
+        self.versions._caches.append(self)
+        self.max_bytes = cache_size if max_bytes is None else max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(route, payload):
+        return (route, json.dumps(payload, sort_keys=True, separators=(",", ":")))
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            stamp, tags, value, _ = entry
+            if not self.versions.changed_since(tags, stamp):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._drop(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, tags, value, stamp=None):
+        """Stores a result computed at `stamp` (by default the current one)."""
+        if key in self._entries:
+            self._drop(key)
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        if stamp is None:
+            stamp = self.versions.clock
+        self._entries[key] = (stamp, tuple(tags), value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def cached(self, route, payload, tags, compute):
+        """Returns the cached result for the request or computes and stores it.
+
+        Args:
+            route (str): Inspect route name.
+            payload (dict): Request payload, normalized into the key.
+            tags (iterable): State tags the result depends on.
+            compute (callable): Returns the serialized result (str or bytes,
+                or a tuple of them).
+        """
+        key = self.key(route, payload)
+        value = self.get(key)
+        if value is None:
+            stamp = self.versions.clock
+            value = compute()
+            self.put(key, tags, value, stamp)
+        return value
+
+    def restamp(self, stamp):
+        """Drops the stale entries and marks the others as computed at `stamp`."""
+        for key, (entry_stamp, tags, value, size) in list(self._entries.items()):
+            if self.versions.changed_since(tags, entry_stamp):
+                self._drop(key)
+            else:
+                self._entries[key] = (stamp, tags, value, size)
+
+    def _drop(self, key):
+        self.size -= self._entries.pop(key)[3]
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
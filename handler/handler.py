@@ -1,18 +1,12 @@
 import json
 import logging
 import os
-from enum import Enum
 from typing import Callable, Optional
 
-# Adapt LogLevel enum
-class LogLevel(Enum):
-    NONE = 0
-    CRITICAL = 1
-    ERROR = 2
-    WARNING = 3
-    INFO = 4
-    DEBUG = 5
-    TRACE = 6
+from rollups import log, profile, util
+from rollups.log import LogLevel
+from rollups.message import Metadata, send_post
+from rollups.scheduler import RequestLoop
 
 # Define NetworkAddresses class
 class NetworkAddresses:
@@ -25,49 +19,233 @@ class NetworkAddresses:
         self.erc1155_batch_portal_address = erc1155_batch_portal_address
 
 # Handler function types
-AdvanceHandlerFunc = Callable[[Metadata, str], None]  # Assuming Metadata is a class
+AdvanceHandlerFunc = Callable[[Metadata, str], None]
 InspectHandlerFunc = Callable[[str], None]
 
 # Define Handlers classes
+def _stage_name(handler):
+    return "route." + getattr(handler, "__name__", type(handler).__name__)
+
 class AdvanceHandler:
     def __init__(self, handler: AdvanceHandlerFunc):
         self.handler = handler
+        self.stage = _stage_name(handler)
 
     def handle(self, metadata, p):
-        return self.handler(metadata, p)
+        with profile.stage(self.stage):
+            return self.handler(metadata, p)
 
-# Similar definitions for InspectHandler, RoutesAdvanceHandler, and RoutesInspectHandler
+class InspectHandler:
+    def __init__(self, handler: InspectHandlerFunc):
+        self.handler = handler
+        self.stage = _stage_name(handler)
+
+    def handle(self, p):
+        with profile.stage(self.stage):
+            return self.handler(p)
+
+class RoutesAdvanceHandler:
+    """Routes advance inputs to handlers with at most two dict lookups.
+
+    Routes are kept in a table keyed by `msg_sender` (lowercase hex, or None
+    for any sender) whose values map a route key to a handler:
+
+    - sender routes (key None) take every input from that sender, which is
+      how portal deposits and the DApp address relay are handled. The
+      handler gets the payload hex string.
+    - selector routes are keyed by the first 4 bytes of the payload. The
+      handler gets the decoded payload bytes.
+    - method routes are keyed by the "method" field of a JSON payload. The
+      payload is parsed once and the handler gets the resulting dict.
+
+    A route registered for a specific sender takes precedence over one
+    registered for any sender.
+    """
+
+    def __init__(self):
+        self.routes = {None: {}}
+        self.default = None
+
+    def _table(self, sender):
+        if sender is not None:
+            sender = sender.lower()
+        return self.routes.setdefault(sender, {})
+
+    def add_sender_route(self, sender: str, handler: AdvanceHandlerFunc):
+        self._table(sender)[None] = AdvanceHandler(handler)
+
+    def add_selector_route(self, selector, handler: AdvanceHandlerFunc, sender: Optional[str] = None):
+        if isinstance(selector, str):
+            selector = util.hex2bin(selector)
+        if len(selector) != 4:
+            raise ValueError(f"Invalid selector {selector!r}, expected 4 bytes")
+        self._table(sender)[bytes(selector)] = AdvanceHandler(handler)
+
+    def add_method_route(self, method: str, handler: AdvanceHandlerFunc, sender: Optional[str] = None):
+        self._table(sender)[method] = AdvanceHandler(handler)
+
+    def add_portal_routes(self, addresses: NetworkAddresses, ether=None, erc20=None, erc721=None, erc1155_single=None, erc1155_batch=None, dapp_address_relay=None):
+        for address, handler in (
+            (addresses.ether_portal_address, ether),
+            (addresses.erc20_portal_address, erc20),
+            (addresses.erc721_portal_address, erc721),
+            (addresses.erc1155_single_portal_address, erc1155_single),
+            (addresses.erc1155_batch_portal_address, erc1155_batch),
+            (addresses.dapp_address_relay, dapp_address_relay),
+        ):
+            if handler is not None:
+                self.add_sender_route(address, handler)
+
+    def set_default(self, handler: AdvanceHandlerFunc):
+        """Handler for inputs no route matches. It gets the payload hex string."""
+        self.default = AdvanceHandler(handler)
+
+    def handle(self, metadata, payload_hex):
+        sender_routes = self.routes.get(metadata.msg_sender.lower())
+        if sender_routes is not None:
+            route = sender_routes.get(None)
+            if route is not None:
+                return route.handle(metadata, payload_hex)
+
+        payload = util.payload_bytes(payload_hex)
+        if payload[:1] == b"{":
+            try:
+                payload = json.loads(payload)
+            except ValueError:
+                payload = None
+            key = payload.get("method") if isinstance(payload, dict) else None
+            if not isinstance(key, str):
+                # Only string methods are route keys; anything else, e.g.
+                # a list, goes to the default route.
+                key = None
+        else:
+            key = payload[:4]
+
+        if key is not None:
+            route = sender_routes.get(key) if sender_routes is not None else None
+            if route is None:
+                route = self.routes[None].get(key)
+            if route is not None:
+                return route.handle(metadata, payload)
+        if self.default is not None:
+            return self.default.handle(metadata, payload_hex)
+        raise ValueError(f"No route for input from {metadata.msg_sender}")
+
+class RoutesInspectHandler:
+    """Routes inspect requests by the "method" field of their JSON payload.
+
+    Handlers get the parsed payload dict.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.default = None
+
+    def add_route(self, method: str, handler: InspectHandlerFunc):
+        self.routes[method] = InspectHandler(handler)
+
+    def set_default(self, handler: InspectHandlerFunc):
+        """Handler for requests no route matches. It gets the payload hex string."""
+        self.default = InspectHandler(handler)
+
+    def handle(self, payload_hex):
+        try:
+            payload = json.loads(util.payload_bytes(payload_hex))
+        except ValueError:
+            payload = None
+        method = payload.get("method") if isinstance(payload, dict) else None
+        if isinstance(method, str):
+            route = self.routes.get(method)
+            if route is not None:
+                return route.handle(payload)
+        if self.default is not None:
+            return self.default.handle(payload_hex)
+        raise ValueError("No route for inspect request")
 
 class Handler:
-    def __init__(self, ...):  # Initialize all attributes
-        ...
+    def __init__(self, advance_handler=None, inspect_handler=None, log_level: LogLevel = LogLevel.INFO):
+        self.advance_handler = advance_handler if advance_handler is not None else RoutesAdvanceHandler()
+        self.inspect_handler = inspect_handler if inspect_handler is not None else RoutesInspectHandler()
+        self.log_level = log_level
 
     def set_debug(self):
-        self.log_level = LogLevel.DEBUG
+        self.set_log_level(LogLevel.DEBUG)
 
     def set_log_level(self, log_level: LogLevel):
         self.log_level = log_level
-
-    # Similar methods for handling different types of handlers
+        log.set_log_level(log_level)
+
+    def handle_advance(self, data):
+        metadata = Metadata(**data["metadata"])
+        if DebugLogger.isEnabledFor(logging.DEBUG):
+            DebugLogger.debug("Advance input %d from %s: %s", metadata.input_index, metadata.msg_sender, log.payload(data["payload"]))
+        try:
+            self.advance_handler.handle(metadata, data["payload"])
+        except Exception as e:
+            ErrorLogger.error("Error handling advance input %d: %s", metadata.input_index, e)
+            return "reject"
+        return "accept"
+
+    def handle_inspect(self, data):
+        if DebugLogger.isEnabledFor(logging.DEBUG):
+            DebugLogger.debug("Inspect request: %s", log.payload(data["payload"]))
+        try:
+            self.inspect_handler.handle(data["payload"])
+        except Exception as e:
+            ErrorLogger.error("Error handling inspect request: %s", e)
+            return "reject"
+        return "accept"
+
+    def add_profile_route(self, method: str = "profile"):
+        """Answers inspect requests for `method` with the profile as a JSON report.
+
+        A request with "reset": true also clears the collected stats.
+        Profiling itself is turned on with DAPP_PROFILE or profile.enable().
+        """
+        def report_profile(payload):
+            self.send_report(util.str2hex(profile.dump_json()))
+            if payload.get("reset"):
+                profile.reset()
+        self.inspect_handler.add_route(method, report_profile)
 
     def send_notice(self, payload_hex: str) -> int:
-        # Implement the logic to send a notice
-        pass
+        if TraceLogger.isEnabledFor(log.TRACE):
+            TraceLogger.log(log.TRACE, "Sending notice %s", log.payload(payload_hex))
+        return send_post("notice", {"payload": payload_hex}).json()["index"]
+
+    def send_voucher(self, destination: str, payload_hex: str) -> int:
+        if TraceLogger.isEnabledFor(log.TRACE):
+            TraceLogger.log(log.TRACE, "Sending voucher to %s: %s", destination, log.payload(payload_hex))
+        return send_post("voucher", {"destination": destination, "payload": payload_hex}).json()["index"]
 
-    # Similar methods for sending voucher, report, exception
+    def send_report(self, payload_hex: str):
+        if TraceLogger.isEnabledFor(log.TRACE):
+            TraceLogger.log(log.TRACE, "Sending report %s", log.payload(payload_hex))
+        send_post("report", {"payload": payload_hex})
+
+    def send_exception(self, payload_hex: str):
+        send_post("exception", {"payload": payload_hex})
+
+    def run(self):
+        RequestLoop({
+            "advance_state": self.handle_advance,
+            "inspect_state": self.handle_inspect,
+        }).run()
 
 def new_simple_handler() -> Handler:
-    # Initialize a simple handler
-    pass
+    return Handler()
 
-# Define other functions like RunDebug, Run, etc.
+def run(handler: Handler):
+    handler.run()
+
+def run_debug(handler: Handler):
+    handler.set_debug()
+    handler.run()
 
 # Global logger setup
 ErrorLogger = logging.getLogger("error")
 TraceLogger = logging.getLogger("trace")
 DebugLogger = logging.getLogger("debug")
 
-# Setup logger configurations
-logging.basicConfig(level=logging.ERROR)  # or other levels as needed
-
-# Other utility functions and classes
+# Setup logger configurations, see rollups.log for the environment variables
+log.configure(default_level=LogLevel.ERROR)
@@ -0,0 +1,3 @@
+from model.model import User, Claim, SimplifiedClaim, DataChunks, Chunk, Status, pack_address, unpack_address
+from model.store import ClaimStore
+from model.deadline import DeadlineQueue
@@ -0,0 +1,53 @@
+from heapq import heappop, heappush
+
+class DeadlineQueue:
+    """Min-heap of claim deadlines keyed by block timestamp.
+
+    Entries are never removed when a claim changes. Each one carries a token
+    (the claim's status and last_edited when it was scheduled) and
+    `pop_expired` skips entries whose token no longer matches the claim, so
+    disputing or editing a claim cancels its old deadline lazily. Expiring
+    claims costs O(log n) per expired or stale entry, independent of how
+    many claims are pending.
+    """
+
+    def __init__(self):
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, deadline, claim_id, token):
+        heappush(self._heap, (deadline, claim_id, token))
+
+    def next_deadline(self):
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now, is_current):
+        """Pops the entries whose deadline is at or before `now`.
+
+        Args:
+            now (int): Current block timestamp.
+            is_current (callable): Called with (claim_id, token), returns
+                whether the entry still matches the claim.
+
+        Returns:
+            list: Ids of the claims whose current deadline expired, in
+            deadline order.
+        """
+        heap = self._heap
+        expired = []
+        seen = set()
+        while heap and heap[0][0] <= now:
+            _, claim_id, token = heappop(heap)
+            # A claim scheduled twice with the same token, e.g. changed and
+            # then changed back, has identical entries; it expires once.
+            if claim_id not in seen and is_current(claim_id, token):
+                seen.add(claim_id)
+                expired.append(claim_id)
+        return expired
+
+    def compact(self, is_current):
+        """Drops stale entries, e.g. after many claims changed state."""
+        self._heap = [entry for entry in self._heap if is_current(entry[1], entry[2])]
+        self._heap.sort()
@@ -1,36 +1,104 @@
+import binascii
 import json
 
+# Addresses are kept as interned 20-byte strings instead of lowercase hex,
+# so every claim and index entry for the same user shares one small object.
+_addresses = {}
+
+def pack_address(address):
+    """Returns the interned 20-byte form of a hex address or packed address."""
+    if type(address) is bytes and len(address) == 20:
+        return _addresses.setdefault(address, address)
+    if isinstance(address, str):
+        if address[:2] in ("0x", "0X"):
+            address = address[2:]
+        try:
+            address = binascii.unhexlify(address)
+        except binascii.Error as e:
+            raise ValueError(f"Invalid address {address!r}") from e
+    else:
+        address = bytes(address)
+    if len(address) != 20:
+        raise ValueError(f"Invalid address length {len(address)}, expected 20 bytes")
+    return _addresses.setdefault(address, address)
+
+def unpack_address(address):
+    return "0x" + binascii.hexlify(address).decode()
+
+
 class User:
+    __slots__ = ("_open_claims", "_open_disputes", "total_disputes", "won_disputes", "total_claims", "correct_claims")
+
     def __init__(self):
-        self.open_claims = {}
-        self.open_disputes = {}
+        # Most users never open a claim or dispute, so their dicts are only
+        # created on first access.
+        self._open_claims = None
+        self._open_disputes = None
         self.total_disputes = 0
         self.won_disputes = 0
         self.total_claims = 0
         self.correct_claims = 0
 
+    @property
+    def open_claims(self):
+        if self._open_claims is None:
+            self._open_claims = {}
+        return self._open_claims
+
+    @property
+    def open_disputes(self):
+        if self._open_disputes is None:
+            self._open_disputes = {}
+        return self._open_disputes
+
+    def __json__(self):
+        return json.dumps({
+            "openClaims": list(self._open_claims or ()),
+            "openDisputes": list(self._open_disputes or ()),
+            "totalDisputes": self.total_disputes,
+            "wonDisputes": self.won_disputes,
+            "totalClaims": self.total_claims,
+            "correctClaims": self.correct_claims
+        })
+
 
 class Claim:
-    def __init__(self, user_address, disputing_user_address, value, last_edited, status, data_chunks):
+    __slots__ = ("user_address", "disputing_user_address", "value", "last_edited", "status", "data_chunks", "data_digest")
+
+    def __init__(self, user_address, disputing_user_address, value, last_edited, status, data_chunks, data_digest=None):
         self.user_address = user_address
         self.disputing_user_address = disputing_user_address
         self.value = value
         self.last_edited = last_edited
         self.status = status
         self.data_chunks = data_chunks
+        self.data_digest = data_digest  # Cached SHA-256 of the claim's data
 
 
 class SimplifiedClaim:
+    __slots__ = ("id", "status", "value")
+
     def __init__(self, id, status, value):
         self.id = id
         self.status = status
         self.value = value
 
+    def __json__(self):
+        return json.dumps({
+            "id": self.id,
+            "status": str(self.status if isinstance(self.status, Status) else Status(self.status)),
+            "value": self.value
+        })
+
 
 class DataChunks:
+    __slots__ = ("chunks_data", "total_chunks", "hasher", "applied")
+
     def __init__(self):
         self.chunks_data = {}
         self.total_chunks = 0
+        self.hasher = None  # Running hash of the data, see processor.DataHasher
+        self.applied = None  # {chunk index: processor.chunk_key} of the applied frames
 
     def __json__(self):
         size = sum(len(chunk.data) for chunk in self.chunks_data.values())
@@ -43,6 +111,8 @@ class DataChunks:
 
 
 class Chunk:
+    __slots__ = ("data",)
+
     def __init__(self, data):
         self.data = data
 
@@ -64,6 +134,14 @@ class Status:
     def __init__(self, value):
         self.value = value
 
+    @classmethod
+    def from_name(cls, name):
+        """Returns the status value for a name like "open", in any case."""
+        try:
+            return cls._statuses.index(name.lower())
+        except ValueError:
+            raise ValueError(f"Unknown claim status {name!r}") from None
+
     def __str__(self):
         return Status._statuses[self.value] if self.value < len(Status._statuses) else "unknown"
 
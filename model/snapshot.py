@@ -0,0 +1,229 @@
+import marshal
+import os
+import struct
+import zlib
+
+from model.model import User, Claim, DataChunks, Chunk, pack_address
+from processor.chunk_store import MemoryChunkStore, new_chunk_store
+
+# Snapshot files start with a fixed header followed by the zlib-compressed
+# marshal dump of the encoded users and claims:
+#   magic (4s) | schema version (H) | kind (B) | input index (Q)
+# Bump SCHEMA_VERSION whenever the encoded tuples below change.
+SNAPSHOT_MAGIC = b"SNAP"
+SCHEMA_VERSION = 3
+FULL = 0
+DELTA = 1
+
+_header = struct.Struct(">4sHBQ")
+
+class SnapshotException(Exception):
+    pass
+
+def _claim_ids(open_claims):
+    return None if open_claims is None else list(open_claims)
+
+def _unlinked(claim_ids):
+    return None if claim_ids is None else dict.fromkeys(claim_ids)
+
+def encode_user(user):
+    # Open claims and disputes map claim ids to the Claim objects, which are
+    # stored with the claims; only their ids are kept here.
+    return (_claim_ids(user._open_claims), _claim_ids(user._open_disputes), user.total_disputes, user.won_disputes, user.total_claims, user.correct_claims)
+
+def decode_user(values):
+    """Decodes a user; its open claims and disputes map ids to None until link_users."""
+    user = User()
+    open_claims, open_disputes, user.total_disputes, user.won_disputes, user.total_claims, user.correct_claims = values
+    user._open_claims = _unlinked(open_claims)
+    user._open_disputes = _unlinked(open_disputes)
+    return user
+
+def link_users(users, claims):
+    """Points the open claims and disputes of decoded users at the loaded claims."""
+    for user in users:
+        for open_claims in (user._open_claims, user._open_disputes):
+            if open_claims:
+                for claim_id in open_claims:
+                    open_claims[claim_id] = claims.get(claim_id)
+
+def encode_data_chunks(data_chunks):
+    if data_chunks is None:
+        return None
+    chunks = [(index, bytes(chunk.data)) for index, chunk in data_chunks.chunks_data.items()]
+    return (data_chunks.total_chunks, getattr(data_chunks.chunks_data, "chunk_size", None), chunks, data_chunks.applied)
+
+def decode_data_chunks(values):
+    if values is None:
+        return None
+    total_chunks, chunk_size, chunks, applied = values
+    data_chunks = DataChunks()
+    data_chunks.total_chunks = total_chunks
+    if chunk_size is None:
+        store = MemoryChunkStore()
+    else:
+        store = new_chunk_store(total_chunks, chunk_size)
+    for index, data in chunks:
+        store[index] = Chunk(data)
+    data_chunks.chunks_data = store
+    data_chunks.applied = applied
+    # The running hash is not persisted; verification rehashes the data
+    # once if it is needed after a restore.
+    return data_chunks
+
+def encode_claim(claim):
+    return (claim.user_address, claim.disputing_user_address, claim.value, claim.last_edited, claim.status, encode_data_chunks(claim.data_chunks), claim.data_digest)
+
+def _intern(address):
+    return address if address is None else pack_address(address)
+
+def decode_claim(values):
+    user_address, disputing_user_address, value, last_edited, status, data_chunks, data_digest = values
+    if data_chunks is not None:
+        data_chunks = decode_data_chunks(data_chunks)
+    return Claim(_intern(user_address), _intern(disputing_user_address), value, last_edited, status, data_chunks, data_digest)
+
+def write_snapshot(path, kind, input_index, users, claims, removed_users=(), removed_claims=()):
+    """Writes a snapshot file atomically.
+
+    Args:
+        path (str): Destination file.
+        kind (int): FULL or DELTA.
+        input_index (int): Index of the last input applied to the state.
+        users (iterable): (packed address, User) pairs to store.
+        claims (iterable): (claim id, Claim) pairs to store.
+        removed_users (iterable): Addresses removed since the previous
+            snapshot, only meaningful for deltas.
+        removed_claims (iterable): Claim ids removed since the previous
+            snapshot, only meaningful for deltas.
+    """
+    payload = (
+        [(address, encode_user(user)) for address, user in users],
+        [(claim_id, encode_claim(claim)) for claim_id, claim in claims],
+        list(removed_users),
+        list(removed_claims),
+    )
+    try:
+        body = zlib.compress(marshal.dumps(payload), 1)
+    except ValueError as e:
+        raise SnapshotException(f"Snapshot: state contains unsupported values: {e}") from e
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_header.pack(SNAPSHOT_MAGIC, SCHEMA_VERSION, kind, input_index))
+        f.write(body)
+    os.replace(tmp_path, path)
+
+def read_snapshot(path):
+    """Reads a snapshot file.
+
+    Returns:
+        tuple: kind, input index, and the decoded (users, claims,
+        removed_users, removed_claims) lists.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _header.size:
+        raise SnapshotException(f"Snapshot: {path} is truncated")
+    magic, version, kind, input_index = _header.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotException(f"Snapshot: {path} is not a snapshot file")
+    if version != SCHEMA_VERSION:
+        raise SnapshotException(f"Snapshot: {path} has schema version {version}, expected {SCHEMA_VERSION}")
+    try:
+        users, claims, removed_users, removed_claims = marshal.loads(zlib.decompress(data[_header.size:]))
+    except (ValueError, EOFError, TypeError, zlib.error) as e:
+        raise SnapshotException(f"Snapshot: {path} is corrupted: {e}") from e
+    users = [(_intern(address), decode_user(values)) for address, values in users]
+    claims = [(claim_id, decode_claim(values)) for claim_id, values in claims]
+    return kind, input_index, (users, claims, removed_users, removed_claims)
+
+class SnapshotManager:
+    """Writes periodic full and delta snapshots of the users and claims.
+
+    Every `every` inputs a snapshot is written to `directory`, named after
+    the Metadata.input_index it covers. Every `full_every`-th snapshot is a
+    full one; the others only contain the users and claims changed since
+    the previous snapshot. Changed claims are tracked by the ClaimStore and
+    changed users must be reported with `mark_user`.
+    """
+
+    def __init__(self, directory, users, claims, every=1000, full_every=10):
+        self.directory = directory
+        self.users = users
+        self.claims = claims
+        self.every = every
+        self.full_every = full_every
+        self.changed_users = set()
+        self.last_input_index = None
+        self.snapshots_since_full = None
+        claims.changed = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def mark_user(self, address):
+        self.changed_users.add(address)
+
+    def _path(self, kind, input_index):
+        suffix = "full" if kind == FULL else "delta"
+        return os.path.join(self.directory, f"{input_index:016d}.{suffix}")
+
+    def after_input(self, input_index):
+        """Writes a snapshot if `every` inputs passed since the last one."""
+        if self.last_input_index is not None and input_index - self.last_input_index < self.every:
+            return None
+        return self.write(input_index)
+
+    def write(self, input_index):
+        full = self.snapshots_since_full is None or self.snapshots_since_full + 1 >= self.full_every
+        if full:
+            path = self._path(FULL, input_index)
+            write_snapshot(path, FULL, input_index, self.users.items(), self.claims.items())
+            self.snapshots_since_full = 0
+        else:
+            users = [(address, self.users[address]) for address in self.changed_users if address in self.users]
+            removed_users = [address for address in self.changed_users if address not in self.users]
+            claims = [(claim_id, self.claims[claim_id]) for claim_id in self.claims.changed if claim_id in self.claims]
+            removed_claims = [claim_id for claim_id in self.claims.changed if claim_id not in self.claims]
+            path = self._path(DELTA, input_index)
+            write_snapshot(path, DELTA, input_index, users, claims, removed_users, removed_claims)
+            self.snapshots_since_full += 1
+        self.changed_users.clear()
+        self.claims.changed.clear()
+        self.last_input_index = input_index
+        return path
+
+    def restore(self):
+        """Loads the latest full snapshot and the deltas written after it.
+
+        Returns:
+            int: The input index the restored state covers, or None if
+            there is no snapshot to restore.
+        """
+        names = sorted(os.listdir(self.directory))
+        fulls = [name for name in names if name.endswith(".full")]
+        if not fulls:
+            return None
+        full = fulls[-1]
+        deltas = [name for name in names if name.endswith(".delta") and name > full]
+
+        kind, input_index, (users, claims, _, _) = read_snapshot(os.path.join(self.directory, full))
+        self.users.clear()
+        self.users.update(users)
+        self.claims.clear()
+        loaded = dict(claims)
+        for name in deltas:
+            kind, input_index, (users, claims, removed_users, removed_claims) = read_snapshot(os.path.join(self.directory, name))
+            self.users.update(users)
+            for address in map(_intern, removed_users):
+                self.users.pop(address, None)
+            loaded.update(claims)
+            for claim_id in removed_claims:
+                loaded.pop(claim_id, None)
+        self.claims.load(loaded.items())
+        link_users(self.users.values(), self.claims)
+
+        self.changed_users.clear()
+        self.claims.changed.clear()
+        self.last_input_index = input_index
+        self.snapshots_since_full = len(deltas)
+        return input_index
@@ -0,0 +1,233 @@
+from bisect import bisect_left, bisect_right, insort
+
+# Largest page returned by the list methods; larger limits are clamped.
+max_page_size = 1000
+
+def _status_key(status):
+    return getattr(status, "value", status)
+
+def _remove(index, item):
+    position = bisect_left(index, item)
+    if position < len(index) and index[position] == item:
+        del index[position]
+
+def _page_limit(limit):
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise ValueError(f"Invalid page limit {limit!r}, expected an integer >= 1")
+    return min(limit, max_page_size)
+
+def _page(index, cursor, limit):
+    """Returns up to `limit` items of a sorted index that come after `cursor`."""
+    start = 0 if cursor is None else bisect_right(index, cursor)
+    return index[start:start+limit]
+
+class ClaimStore:
+    """Claims by id, with secondary indexes kept up to date on every change.
+
+    Each index is a sorted list: claim ids by status, by user address and
+    by (status, user address), and (last_edited, id) pairs for the edit
+    time. Listing bisects to the
+    cursor and reads one page, so its cost depends on the page size and not
+    on the number of claims. New claims get increasing ids and timestamps,
+    so they are appended at the end of each index.
+
+    Claims must only be changed through `update`, otherwise the indexes go
+    stale. Changes that do not touch indexed fields (e.g. new data chunks)
+    should be reported with `mark_changed` so snapshots pick them up.
+
+    When `changed` is a set (see model.snapshot.SnapshotManager), the ids of
+    added, updated and removed claims are recorded in it.
+    """
+
+    def __init__(self):
+        self.claims = {}
+        self._ids = []
+        self._by_status = {}
+        self._by_user = {}
+        self._by_status_user = {}
+        self._by_last_edited = []
+        self.changed = None
+
+    def __len__(self):
+        return len(self.claims)
+
+    def __contains__(self, claim_id):
+        return claim_id in self.claims
+
+    def __getitem__(self, claim_id):
+        return self.claims[claim_id]
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def get(self, claim_id, default=None):
+        return self.claims.get(claim_id, default)
+
+    def items(self):
+        return ((claim_id, self.claims[claim_id]) for claim_id in self._ids)
+
+    def _index(self, claim_id, claim):
+        insort(self._by_status.setdefault(_status_key(claim.status), []), claim_id)
+        insort(self._by_user.setdefault(claim.user_address, []), claim_id)
+        insort(self._by_status_user.setdefault((_status_key(claim.status), claim.user_address), []), claim_id)
+        insort(self._by_last_edited, (claim.last_edited, claim_id))
+
+    def _unindex(self, claim_id, claim):
+        status = _status_key(claim.status)
+        _remove(self._by_status[status], claim_id)
+        if not self._by_status[status]:
+            del self._by_status[status]
+        _remove(self._by_user[claim.user_address], claim_id)
+        if not self._by_user[claim.user_address]:
+            del self._by_user[claim.user_address]
+        key = (status, claim.user_address)
+        _remove(self._by_status_user[key], claim_id)
+        if not self._by_status_user[key]:
+            del self._by_status_user[key]
+        _remove(self._by_last_edited, (claim.last_edited, claim_id))
+
+    def clear(self):
+        self.claims.clear()
+        self._ids.clear()
+        self._by_status.clear()
+        self._by_user.clear()
+        self._by_status_user.clear()
+        self._by_last_edited.clear()
+
+    def mark_changed(self, claim_id):
+        if self.changed is not None:
+            self.changed.add(claim_id)
+
+    def add(self, claim_id, claim):
+        if claim_id in self.claims:
+            raise KeyError(f"Claim {claim_id} already exists")
+        self.claims[claim_id] = claim
+        insort(self._ids, claim_id)
+        self._index(claim_id, claim)
+        self.mark_changed(claim_id)
+        return claim
+
+    def load(self, items):
+        """Adds or replaces many claims at once, sorting each index a single time."""
+        claims = self.claims
+        replaced = False
+        loaded = []
+        for claim_id, claim in items:
+            if claim_id in claims:
+                replaced = True
+            else:
+                self._ids.append(claim_id)
+            claims[claim_id] = claim
+            loaded.append((claim_id, claim))
+            if self.changed is not None:
+                self.changed.add(claim_id)
+        if replaced:
+            # The entries of replaced claims can't be found in the unsorted
+            # indexes, so they are rebuilt from all the claims.
+            self._by_status.clear()
+            self._by_user.clear()
+            self._by_status_user.clear()
+            self._by_last_edited.clear()
+            loaded = claims.items()
+        by_status = self._by_status
+        by_user = self._by_user
+        by_status_user = self._by_status_user
+        by_last_edited = self._by_last_edited
+        for claim_id, claim in loaded:
+            status = _status_key(claim.status)
+            if status in by_status:
+                by_status[status].append(claim_id)
+            else:
+                by_status[status] = [claim_id]
+            if claim.user_address in by_user:
+                by_user[claim.user_address].append(claim_id)
+            else:
+                by_user[claim.user_address] = [claim_id]
+            key = (status, claim.user_address)
+            if key in by_status_user:
+                by_status_user[key].append(claim_id)
+            else:
+                by_status_user[key] = [claim_id]
+            by_last_edited.append((claim.last_edited, claim_id))
+        self._ids.sort()
+        for index in self._by_status.values():
+            index.sort()
+        for index in self._by_user.values():
+            index.sort()
+        for index in self._by_status_user.values():
+            index.sort()
+        self._by_last_edited.sort()
+
+    def update(self, claim_id, **changes):
+        """Applies attribute changes to a claim and updates the indexes."""
+        claim = self.claims[claim_id]
+        self._unindex(claim_id, claim)
+        for name, value in changes.items():
+            setattr(claim, name, value)
+        self._index(claim_id, claim)
+        self.mark_changed(claim_id)
+        return claim
+
+    def remove(self, claim_id):
+        claim = self.claims.pop(claim_id)
+        _remove(self._ids, claim_id)
+        self._unindex(claim_id, claim)
+        self.mark_changed(claim_id)
+        return claim
+
+    def count(self, status=None, user=None):
+        if user is not None:
+            if status is None:
+                return len(self._by_user.get(user, ()))
+            return len(self._by_status_user.get((_status_key(status), user), ()))
+        if status is not None:
+            return len(self._by_status.get(_status_key(status), ()))
+        return len(self._ids)
+
+    def list(self, status=None, user=None, cursor=None, limit=100):
+        """Lists claim ids in id order, optionally filtered by status and user.
+
+        Returns:
+            tuple: The page of claim ids and the cursor for the next page,
+            which is None when there are no more claims.
+
+        Raises:
+            ValueError: If `limit` is not an integer >= 1. Limits above
+            max_page_size are clamped to it.
+        """
+        limit = _page_limit(limit)
+        if user is not None:
+            if status is not None:
+                index = self._by_status_user.get((_status_key(status), user), [])
+            else:
+                index = self._by_user.get(user, [])
+        elif status is not None:
+            index = self._by_status.get(_status_key(status), [])
+        else:
+            index = self._ids
+
+        page = _page(index, cursor, limit)
+        next_cursor = page[-1] if len(page) == limit else None
+        return page, next_cursor
+
+    def list_edited(self, since=None, until=None, cursor=None, limit=100):
+        """Lists (last_edited, claim id) pairs edited in [since, until).
+
+        The cursor is the last pair of the previous page. `limit` is
+        checked like in `list`.
+        """
+        limit = _page_limit(limit)
+        if cursor is not None:
+            position = bisect_right(self._by_last_edited, tuple(cursor))
+        elif since is not None:
+            position = bisect_left(self._by_last_edited, (since, ))
+        else:
+            position = 0
+
+        page = []
+        for item in self._by_last_edited[position:position+limit]:
+            if until is not None and item[0] >= until:
+                break
+            page.append(item)
+        next_cursor = page[-1] if len(page) == limit else None
+        return page, next_cursor
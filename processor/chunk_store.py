@@ -0,0 +1,92 @@
+import mmap
+import os
+import tempfile
+
+from model import Chunk
+
+# Uploads whose expected size is above this many bytes are spilled to a
+# memory-mapped file instead of being kept as bytes objects.
+spill_size = int(os.getenv("DAPP_CHUNK_SPILL_SIZE", str(4 * 1024 * 1024)))
+# Writable directory for the spill files.
+data_dir = os.getenv("DAPP_DATA_DIR", tempfile.gettempdir())
+
+class MemoryChunkStore(dict):
+    """Keeps the chunks of an upload in memory, keyed by chunk index."""
+
+    def __init__(self, chunk_size=None):
+        super().__init__()
+        self.chunk_size = chunk_size
+
+    def close(self):
+        self.clear()
+
+class MmapChunkStore:
+    """Keeps the chunks of an upload in a preallocated memory-mapped file.
+
+    Chunk i is stored at offset i * chunk_size, and reading a chunk returns
+    a Chunk whose data is a memoryview over the mapping, so composing the
+    upload does not copy it. The file is unlinked as soon as it is mapped,
+    so nothing is left behind if the DApp stops.
+    """
+
+    def __init__(self, total_chunks, chunk_size, directory=None):
+        self.total_chunks = total_chunks
+        self.chunk_size = chunk_size
+        self._lengths = {}
+        fd, path = tempfile.mkstemp(prefix="chunks-", dir=directory or data_dir)
+        try:
+            os.unlink(path)
+            os.ftruncate(fd, total_chunks * chunk_size)
+            self._mmap = mmap.mmap(fd, total_chunks * chunk_size)
+        finally:
+            os.close(fd)
+        self._view = memoryview(self._mmap)
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, chunk_index):
+        return chunk_index in self._lengths
+
+    def __setitem__(self, chunk_index, chunk):
+        data = chunk.data
+        if not 0 <= chunk_index < self.total_chunks:
+            raise ValueError("Inconsistent chunk index, greater than total")
+        if len(data) > self.chunk_size or (len(data) != self.chunk_size and chunk_index != self.total_chunks - 1):
+            raise ValueError(f"Inconsistent chunk size {len(data)}, expected {self.chunk_size}")
+        offset = chunk_index * self.chunk_size
+        self._view[offset:offset+len(data)] = data
+        self._lengths[chunk_index] = len(data)
+
+    def __getitem__(self, chunk_index):
+        offset = chunk_index * self.chunk_size
+        return Chunk(self._view[offset:offset+self._lengths[chunk_index]])
+
+    def get(self, chunk_index, default=None):
+        if chunk_index not in self._lengths:
+            return default
+        return self[chunk_index]
+
+    def keys(self):
+        return self._lengths.keys()
+
+    def values(self):
+        return (self[chunk_index] for chunk_index in self._lengths)
+
+    def items(self):
+        return ((chunk_index, self[chunk_index]) for chunk_index in self._lengths)
+
+    def close(self):
+        self._lengths.clear()
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Chunks handed out earlier still reference the mapping, it is
+            # released when they are garbage collected.
+            pass
+
+def new_chunk_store(total_chunks, chunk_size):
+    if total_chunks * chunk_size > spill_size:
+        return MmapChunkStore(total_chunks, chunk_size)
+    return MemoryChunkStore(chunk_size)
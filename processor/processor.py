@@ -1,51 +1,217 @@
+import codecs
 import csv
 import io
 import gzip
-import hex
+import hashlib
+import itertools
 import struct
-from ipfs_cid import cid_sha256_hash, cid_sha256_unwrap_digest
-from model import Chunk
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from ipfs_cid import cid_sha256_hash, cid_sha256_unwrap_digest, cid_sha256_wrap_digest
+from model import Chunk, pack_address
+from rollups import profile, util
+from processor.chunk_store import MemoryChunkStore, new_chunk_store
 
-def csv_blank_cell_percentage(csv_string, nil_fields=None):
-    if nil_fields is None:
-        nil_fields = []
+class _BlankCellCounter:
+    """Counts cells and blank/nil cells per column, skipping the header row."""
 
-    nil_fields_map = {field.lower(): True for field in nil_fields}
+    def __init__(self, nil_fields):
+        self.nil_fields = {field.lower() for field in nil_fields}
+        self.nil_fields_bytes = {field.encode() for field in self.nil_fields}
+        self.header = True
+        self.total_cells = 0
+        self.empty_cells = 0
+        self.column_blanks = []
 
-    total_cells = 0
-    empty_cells = 0
+    def count_fields(self, fields, blanks):
+        # Most rows have no blank cell, which a single set operation detects.
+        self.total_cells += len(fields)
+        if blanks.isdisjoint(fields):
+            return
+        column_blanks = self.column_blanks
+        if len(column_blanks) < len(fields):
+            column_blanks.extend([0] * (len(fields) - len(column_blanks)))
+        for i, value in enumerate(fields):
+            if value in blanks:
+                self.empty_cells += 1
+                column_blanks[i] += 1
 
-    reader = csv.reader(io.StringIO(csv_string))
-    first_row = True
-    for record in reader:
-        if first_row:
-            first_row = False
-            continue
+    def count_lines(self, block):
+        """Counts a block of complete, unquoted lines ending with a newline."""
+        if not self.nil_fields:
+            blanks = {b""}
+        elif block.isascii():
+            block = block.lower()
+            blanks = {b""} | self.nil_fields_bytes
+        else:
+            block = block.decode("utf-8").lower()
+            blanks = {""} | self.nil_fields
+        newline, comma, cr = ("\n", ",", "\r") if isinstance(block, str) else (b"\n", b",", b"\r")
+
+        if cr in block:
+            block = block.replace(cr + newline, newline)
+        if self.header:
+            self.header = False
+            block = block[block.find(newline)+1:]
+        body = block[:-1]
+        if not body:
+            return
+
+        lines = body.split(newline)
+        widths = set(map(type(body).count, lines, itertools.repeat(comma)))
+        if len(widths) != 1 or newline + newline in block or body[:1] == newline:
+            for line in lines:
+                if line:
+                    self.count_fields(line.split(comma), blanks)
+            return
+
+        # Every row has the same width: split all cells at once and count
+        # the blanks of each column on a strided slice.
+        width = widths.pop() + 1
+        self.total_cells += width * len(lines)
+        if len(blanks) == 1 and comma + comma not in body and comma + newline not in body \
+                and newline + comma not in body and body[:1] != comma and body[-1:] != comma:
+            return
+        cells = body.replace(newline, comma).split(comma)
+        column_blanks = self.column_blanks
+        if len(column_blanks) < width:
+            column_blanks.extend([0] * (width - len(column_blanks)))
+        for i in range(width):
+            column = cells[i::width]
+            n = sum(column.count(blank) for blank in blanks)
+            self.empty_cells += n
+            column_blanks[i] += n
+
+    def count_records(self, records):
+        blanks = {""} | self.nil_fields
+        for record in records:
+            if self.header:
+                self.header = False
+                continue
+            if self.nil_fields:
+                record = [value.lower() for value in record]
+            self.count_fields(record, blanks)
+
+def _unquoted(block):
+    # Lines without quotes, NULs or stray carriage returns split exactly
+    # like csv.reader splits them.
+    return b'"' not in block and b"\0" not in block and block.count(b"\r") == block.count(b"\r\n")
 
-        for value in record:
-            total_cells += 1
-            if value == "" or nil_fields_map.get(value.lower()):
-                empty_cells += 1
+def _text_lines(pieces):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    for piece in pieces:
+        lines = (tail + decoder.decode(piece)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def _slices(pieces, size):
+    for piece in pieces:
+        if len(piece) <= size:
+            yield bytes(piece)
+        else:
+            for offset in range(0, len(piece), size):
+                yield bytes(piece[offset:offset+size])
+
+@profile.timed("csv.score")
+def csv_blank_cell_stats(data, nil_fields=None, block_size=1 << 20):
+    """Scores how complete a CSV is, streaming from its bytes.
+
+    Args:
+        data: The CSV as bytes, or an iterable of bytes pieces such as the
+            output of ChunkReassembler.pieces().
+        nil_fields (list): Values, compared case-insensitively, that also
+            count as blank.
+        block_size (int): Number of bytes scanned at a time.
+
+    Returns:
+        tuple: The number of non-blank cells per million cells, excluding
+        the header row (0 when there are no data cells), and the blank cell
+        count of each column.
+    """
+    if nil_fields is None:
+        nil_fields = []
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = [data]
+
+    counter = _BlankCellCounter(nil_fields)
+    pieces = _slices(data, block_size)
+    tail = b""
+    for piece in pieces:
+        buffer = tail + piece
+        cut = buffer.rfind(b"\n") + 1
+        block, tail = buffer[:cut], buffer[cut:]
+        if not block:
+            continue
+        if not _unquoted(block):
+            # Quoted fields may span lines, so csv.reader handles the rest.
+            counter.count_records(csv.reader(_text_lines(itertools.chain([block + tail], pieces))))
+            tail = b""
+            break
+        counter.count_lines(block)
+    if tail:
+        if _unquoted(tail):
+            counter.count_lines(tail + b"\n")
+        else:
+            counter.count_records(csv.reader(_text_lines([tail])))
 
-    n_data_cells = total_cells - empty_cells
-    value = 1000000 * n_data_cells // total_cells
+    if counter.total_cells == 0:
+        return 0, counter.column_blanks
+    n_data_cells = counter.total_cells - counter.empty_cells
+    return 1000000 * n_data_cells // counter.total_cells, counter.column_blanks
 
+def csv_blank_cell_percentage(csv_string, nil_fields=None):
+    value, _ = csv_blank_cell_stats(csv_string.encode("utf-8"), nil_fields)
     return value
 
 def get_data_cid(data):
     return cid_sha256_hash(data.encode())
 
-def compare_cid_with_string(data_cid, marshaled_string):
+@lru_cache(maxsize=1024)
+def _unwrap_digest(cid):
     try:
-        cid_digest = cid_sha256_unwrap_digest(data_cid)
-        return cid_digest == cid_sha256_unwrap_digest(marshaled_string)
-    except AttributeError:
-        return False
+        return cid_sha256_unwrap_digest(cid)
+    except (AttributeError, ValueError):
+        return None
+
+def compare_cid_with_string(data_cid, marshaled_string):
+    cid_digest = _unwrap_digest(data_cid)
+    return cid_digest is not None and cid_digest == _unwrap_digest(marshaled_string)
+
+def get_data_chunks_digest(data_chunks):
+    """Returns the SHA-256 digest of the decompressed data of an upload.
+
+    The running hash kept while the chunks arrived is used when it covers
+    the whole upload; otherwise the data is composed and hashed.
+    """
+    hasher = data_chunks.hasher
+    if hasher is not None and hasher.complete:
+        return hasher.digest()
+    return hashlib.sha256(compose_data_from_chunks(data_chunks)).digest()
+
+def get_data_chunks_cid(data_chunks):
+    return cid_sha256_wrap_digest(get_data_chunks_digest(data_chunks))
 
-def compress_data(data):
+def verify_claim_cid(claim, cid):
+    """Checks the data uploaded for a claim against a CID string.
+
+    The data digest is cached on the claim, so only the first call may
+    have to hash the data.
+    """
+    if claim.data_digest is None:
+        claim.data_digest = get_data_chunks_digest(claim.data_chunks)
+    return claim.data_digest == _unwrap_digest(cid)
+
+def compress_data(data, level=9):
     try:
         buffer = io.BytesIO()
-        with gzip.GzipFile(fileobj=buffer, mode="wb") as gzip_file:
+        with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=level) as gzip_file:
             gzip_file.write(data)
         return buffer.getvalue()
     except Exception as e:
@@ -58,12 +224,38 @@ def decompress_data(data):
     except Exception as e:
         raise Exception(f"DecompressData: error decompressing data: {e}")
 
-def prepare_data_to_send(data, max_size):
+def compress_data_parallel(data, workers=None, level=9, block_size=4 * 1024 * 1024):
+    """Compresses independent blocks on a thread pool into multi-member gzip.
+
+    zlib releases the GIL while compressing, so blocks compress on all
+    cores. The members are concatenated in order, which decompress_data and
+    ChunkReassembler read like a single gzip stream. Blocks use mtime 0 so
+    the output is deterministic.
+    """
+    try:
+        view = memoryview(data)
+        blocks = [view[offset:offset+block_size] for offset in range(0, len(view), block_size)]
+        compress = lambda block: gzip.compress(block, compresslevel=level, mtime=0)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return b''.join(executor.map(compress, blocks))
+    except Exception as e:
+        raise Exception(f"CompressData: error compressing data: {e}")
+
+def iter_prepared_data(data, max_size, workers=1, level=9, block_size=4 * 1024 * 1024):
+    """Yields the hex chunk frames of `data`, one at a time.
+
+    With workers=1 the data is compressed as a single gzip stream, as
+    compress_data does. Otherwise it is compressed in parallel with
+    compress_data_parallel. Both use the gzip compression `level`.
+    """
     if not data:
         raise ValueError("PrepareData: Invalid empty data")
 
     try:
-        compressed = compress_data(data)
+        if workers == 1:
+            compressed = compress_data(data, level)
+        else:
+            compressed = compress_data_parallel(data, workers, level, block_size)
     except Exception as e:
         raise Exception(f"PrepareData: error compressing data: {e}")
 
@@ -72,39 +264,255 @@ def prepare_data_to_send(data, max_size):
     if size_data % max_size == 0:
         total_chunks -= 1
 
-    prepared_data = []
+    compressed = memoryview(compressed)
     for chunk_index in range(total_chunks + 1):
         metadata = struct.pack(">II", chunk_index, total_chunks)
         top = (chunk_index + 1) * max_size
         top = min(top, size_data)
         all_data = metadata + compressed[chunk_index * max_size:top]
-        all_data_hex = "0x" + hex.encode(all_data)
-        prepared_data.append(all_data_hex)
+        yield util.bin2hex(all_data)
 
-    return prepared_data
+@profile.timed("compress")
+def prepare_data_to_send(data, max_size, workers=1, level=9):
+    return list(iter_prepared_data(data, max_size, workers, level))
 
-def update_data_chunks(data_chunks, chunk_hex):
-    chunk = bytes.fromhex(chunk_hex[2:])
+def parse_chunk(chunk_hex):
+    # The chunk data is returned as a view over the decoded payload.
+    chunk = util.decode_payload(chunk_hex)
     chunk_index = struct.unpack(">I", chunk[:4])[0]
     total_chunks = struct.unpack(">I", chunk[4:8])[0] + 1
     data = chunk[8:]
 
-    if chunk_index > total_chunks:
+    if chunk_index >= total_chunks:
         raise ValueError("Inconsistent chunk index, greater than total")
 
+    return chunk_index, total_chunks, data
+
+def chunk_key(sender, chunk_hex):
+    """Identifies a chunk frame by its sender and content, without decoding it."""
+    hasher = hashlib.sha256(pack_address(sender) if sender is not None else b"")
+    hasher.update(chunk_hex.encode("ascii"))
+    return hasher.digest()[:16]
+
+def _frame_index(chunk_hex):
+    # The chunk index is the first 4 bytes of the frame, read straight from
+    # the hex. Malformed frames give None and fail in parse_chunk.
+    start = 2 if chunk_hex[:2] in ("0x", "0X") else 0
+    try:
+        return int(chunk_hex[start:start + 8], 16)
+    except ValueError:
+        return None
+
+@profile.timed("chunks.update")
+def update_data_chunks(data_chunks, chunk_hex, sender=None):
+    """Stores one chunk frame of an upload.
+
+    The frames applied to `data_chunks` are recorded by chunk index with
+    their chunk_key, so a frame resent for the same upload is dropped
+    before it is decoded. The record is reset with the upload, and the
+    same data can be uploaded again into a new one.
+
+    Returns:
+        bool: False if the frame was a duplicate and nothing changed.
+    """
+    key = chunk_key(sender, chunk_hex)
+    chunk_index = _frame_index(chunk_hex)
+    applied = data_chunks.applied
+    if applied is not None and data_chunks.total_chunks and applied.get(chunk_index) == key:
+        return False
+    _apply_chunk(data_chunks, chunk_hex)
+    if data_chunks.applied is None:
+        data_chunks.applied = {}
+    data_chunks.applied[chunk_index] = key
+    return True
+
+def _apply_chunk(data_chunks, chunk_hex):
+    chunk_index, total_chunks, data = parse_chunk(chunk_hex)
+
     if data_chunks.total_chunks == 0:
-        data_chunks.chunks_data = {}
+        data_chunks.chunks_data = MemoryChunkStore()
         data_chunks.total_chunks = total_chunks
+        data_chunks.hasher = DataHasher(total_chunks)
+        data_chunks.applied = {}
     elif total_chunks != data_chunks.total_chunks:
         raise ValueError("Inconsistent number of chunks")
 
-    data_chunks.chunks_data[chunk_index] = Chunk(data)
+    store = data_chunks.chunks_data
+    if getattr(store, "chunk_size", None) is None and (chunk_index < total_chunks - 1 or total_chunks == 1):
+        # The first full chunk gives the chunk size, which decides whether
+        # the upload stays in memory or is spilled to a mapped file.
+        store = new_chunk_store(total_chunks, len(data))
+        for index, chunk in data_chunks.chunks_data.items():
+            store[index] = chunk
+        data_chunks.chunks_data = store
 
-def compose_data_from_chunks(data_chunks):
+    previous = store.get(chunk_index)
+    if previous is not None and previous.data == data:
+        # Already applied with the same content.
+        return
+    store[chunk_index] = Chunk(data)
+    if data_chunks.hasher is None:
+        return
+    if previous is not None:
+        # A chunk was replaced with different content, the running hash no
+        # longer matches and the data will be hashed in full if needed.
+        data_chunks.hasher = None
+        return
+    try:
+        # The stored copy is passed on, so chunks held back until they are
+        # in order stay in the mapped file of a spilled upload instead of
+        # keeping their input payloads alive.
+        data_chunks.hasher.add_chunk(chunk_index, store[chunk_index].data)
+    except ValueError:
+        # Not valid gzip: keep the chunk and report the error when the data
+        # is composed, as before.
+        data_chunks.hasher = None
+
+class ChunkReassembler:
+    """Streams the decompressed content of a chunked gzip upload.
+
+    In-order chunks are queued for the decompressor as they arrive, without
+    being joined, and only chunks received ahead of the next expected index
+    are held back. Consumers iterate over `pieces()` to get the decompressed
+    output available so far, at most `max_output` bytes at a time, so memory
+    stays bounded by the compressed chunks not consumed yet plus one output
+    piece. Multi-member gzip streams are supported.
+    """
+
+    feed_size = 64 * 1024
+
+    def __init__(self, total_chunks=0, max_output=256 * 1024):
+        self.total_chunks = total_chunks
+        self.max_output = max_output
+        self.next_index = 0
+        self.pending = {}
+        self._input = deque()
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._in_member = False
+        # Set after a member ends: NUL padding is skipped there, as gzip does.
+        self._padding = False
+
+    @property
+    def complete(self):
+        return self.total_chunks > 0 and self.next_index == self.total_chunks
+
+    def add_chunk_hex(self, chunk_hex):
+        chunk_index, total_chunks, data = parse_chunk(chunk_hex)
+        if self.total_chunks == 0:
+            self.total_chunks = total_chunks
+        elif total_chunks != self.total_chunks:
+            raise ValueError("Inconsistent number of chunks")
+        self.add_chunk(chunk_index, data)
+
+    def add_chunk(self, chunk_index, data):
+        if chunk_index >= self.total_chunks:
+            raise ValueError("Inconsistent chunk index, greater than total")
+        if chunk_index < self.next_index or chunk_index in self.pending:
+            raise ValueError(f"Chunk {chunk_index} already received")
+
+        if chunk_index != self.next_index:
+            self.pending[chunk_index] = data
+            return
+        self._queue(data)
+        while self.next_index in self.pending:
+            self._queue(self.pending.pop(self.next_index))
+
+    def _queue(self, data):
+        # Feeding the decompressor bounded slices keeps the copies it makes
+        # of its unconsumed input small.
+        view = memoryview(data)
+        for offset in range(0, len(view), self.feed_size):
+            self._input.append(view[offset:offset+self.feed_size])
+        self.next_index += 1
+
+    def pieces(self):
+        """Yields the decompressed output available from the queued chunks.
+
+        Raises:
+            ValueError: If the data is not valid gzip, or if the upload is
+            complete but the last gzip member is truncated.
+        """
+        while True:
+            decompressor = self._decompressor
+            if decompressor.unconsumed_tail:
+                data = decompressor.unconsumed_tail
+            elif self._input:
+                data = self._input.popleft()
+                if self._padding:
+                    data = bytes(data).lstrip(b"\0")
+                    if not data:
+                        continue
+                    self._padding = False
+            else:
+                break
+            try:
+                out = decompressor.decompress(data, self.max_output)
+            except zlib.error as e:
+                raise ValueError(f"DecompressData: error decompressing data: {e}") from e
+            self._in_member = True
+            if decompressor.eof:
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self._in_member = False
+                self._padding = True
+                if decompressor.unused_data:
+                    self._input.appendleft(decompressor.unused_data)
+            if out:
+                yield out
+        if self.complete and self._in_member:
+            raise ValueError("DecompressData: error decompressing data: truncated gzip stream")
+
+    def __iter__(self):
+        return self.pieces()
+
+class DataHasher:
+    """Running SHA-256 of the decompressed data of a chunked upload.
+
+    Chunks are decompressed as soon as they can be put in order and the
+    output is hashed and dropped, so the digest is ready when the last
+    chunk lands without keeping or rereading the decompressed data.
+    """
+
+    def __init__(self, total_chunks):
+        self.reassembler = ChunkReassembler(total_chunks)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    @property
+    def complete(self):
+        return self.reassembler.complete
+
+    def add_chunk(self, chunk_index, data):
+        self.reassembler.add_chunk(chunk_index, data)
+        for piece in self.reassembler.pieces():
+            self.sha256.update(piece)
+            self.size += len(piece)
+
+    def digest(self):
+        if not self.complete:
+            raise ValueError("Data is incomplete")
+        return self.sha256.digest()
+
+    def cid(self):
+        return cid_sha256_wrap_digest(self.digest())
+
+def iter_data_from_chunks(data_chunks, max_output=256 * 1024):
     if len(data_chunks.chunks_data) != data_chunks.total_chunks:
         raise ValueError("Wrong number of chunks")
 
-    ordered_chunks = [data_chunks.chunks_data[i].data for i in range(data_chunks.total_chunks)]
-    compressed_data = b''.join(ordered_chunks)
+    reassembler = ChunkReassembler(data_chunks.total_chunks, max_output)
+    for i in range(data_chunks.total_chunks):
+        reassembler.add_chunk(i, data_chunks.chunks_data[i].data)
+    return reassembler.pieces()
+
+@profile.timed("chunks.compose")
+def compose_data_from_chunks(data_chunks):
+    return b''.join(iter_data_from_chunks(data_chunks))
 
-    return decompress_data(compressed_data)
+def release_data_chunks(data_chunks):
+    """Frees the storage of an upload once it is no longer needed."""
+    if hasattr(data_chunks.chunks_data, "close"):
+        data_chunks.chunks_data.close()
+    data_chunks.chunks_data = {}
+    data_chunks.total_chunks = 0
+    data_chunks.hasher = None
+    data_chunks.applied = None
@@ -0,0 +1,2 @@
+from replay.engine import ReplayResult, compare_outputs, load_app, replay
+from replay.stub import RollupStub, StubAdapter, StubServer
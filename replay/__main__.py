@@ -0,0 +1,56 @@
+"""Offline replay of rollup inputs.
+
+    python -m replay generate deposits -n 10000 -o deposits.jsonl
+    python -m replay run deposits.jsonl --record golden.jsonl
+    python -m replay run deposits.jsonl --golden golden.jsonl [--http]
+
+`run` prints a JSON summary (inputs/sec, p50/p99 latency, peak RSS) and
+exits with status 1 if the outputs differ from the golden file.
+"""
+import argparse
+import json
+import sys
+
+from replay.engine import compare_outputs, load_app, replay
+from replay.workload import WORKLOADS, read_jsonl, write_jsonl
+from rollups import log
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m replay")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a synthetic workload")
+    generate.add_argument("workload", choices=sorted(WORKLOADS))
+    generate.add_argument("-n", "--count", type=int, default=1000, help="number of deposits, uploads or claims")
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("-o", "--output", required=True)
+
+    run = commands.add_parser("run", help="replay a workload")
+    run.add_argument("requests", help="JSONL file of /finish responses")
+    run.add_argument("--app", default="replay.apps:benchmark_handler", help="handlers to replay into, as module:attribute (e.g. dapp:handlers)")
+    run.add_argument("--http", action="store_true", help="go through a local HTTP stub instead of the in-process adapter")
+    run.add_argument("--golden", help="JSONL file of expected outputs")
+    run.add_argument("--record", help="write the outputs to this JSONL file")
+    run.add_argument("--log-level", default="ERROR")
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        write_jsonl(args.output, WORKLOADS[args.workload](args.count, seed=args.seed))
+        return 0
+
+    handlers = load_app(args.app)
+    log.set_log_level(args.log_level)
+    result = replay(read_jsonl(args.requests), handlers, http=args.http)
+    summary = result.summary()
+    status = 0
+    if args.record:
+        write_jsonl(args.record, result.outputs)
+    if args.golden:
+        mismatches = compare_outputs(result.outputs, read_jsonl(args.golden))
+        summary["golden"] = "match" if not mismatches else mismatches
+        status = 1 if mismatches else 0
+    print(json.dumps(summary, indent=2))
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
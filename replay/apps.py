@@ -0,0 +1,114 @@
+import json
+
+import dapp_asst
+import model
+from handler.handler import Handler
+from processor import processor
+from rollups import asset, util
+from rollups.ledger import Ledger
+from replay.workload import PORTALS, UPLOADER
+
+# Address the benchmark DApp pretends to be deployed at, used as the
+# sender of withdrawal vouchers.
+DAPP_ADDRESS = "0x" + "da" * 20
+
+def reset_state():
+    """Empties the module-level state of dapp_asst between replays."""
+    dapp_asst.users.clear()
+    dapp_asst.claims.clear()
+    dapp_asst.deadlines = model.DeadlineQueue()
+    dapp_asst.dispute_resolver = None
+    dapp_asst.inspect_cache.clear()
+    dapp_asst.state_versions.bump_all()
+
+def benchmark_handler():
+    """Handler covering the workloads in replay.workload.
+
+    - Portal deposits are decoded, credited to `handler.ledger` and
+      withdrawn right away with a voucher sending the assets back.
+    - Chunked uploads from UPLOADER are reassembled, dropping resent
+      chunks; a complete upload is scored as CSV and a notice with its
+      score and digest is emitted.
+    - "claim" and "dispute" inputs open and dispute claims through
+      dapp_asst, expiring timed out claims first.
+    - get_claim_list and show_user inspects are served by dapp_asst.
+    """
+    reset_state()
+    handler = Handler()
+    routes = handler.advance_handler
+
+    ledger = handler.ledger = Ledger()
+
+    def send(voucher):
+        handler.send_voucher(voucher["destination"], voucher["payload"])
+
+    def on_ether(metadata, payload_hex):
+        deposit = asset.decode_ether_deposit(payload_hex)
+        with ledger.transaction():
+            ledger.deposit(deposit)
+            send(ledger.withdraw_ether(DAPP_ADDRESS, deposit.depositor, deposit.amount))
+
+    def on_erc20(metadata, payload_hex):
+        deposit = asset.decode_erc20_deposit(payload_hex)
+        with ledger.transaction():
+            ledger.deposit(deposit)
+            send(ledger.withdraw_erc20(deposit.depositor, deposit.token_address, deposit.amount))
+
+    def on_erc721(metadata, payload_hex):
+        deposit = asset.decode_erc721_deposit(payload_hex)
+        with ledger.transaction():
+            ledger.deposit(deposit)
+            send(ledger.withdraw_erc721(DAPP_ADDRESS, deposit.depositor, deposit.token_address, deposit.token_id))
+
+    def on_erc1155_single(metadata, payload_hex):
+        deposit = asset.decode_erc1155_single_deposit(payload_hex)
+        with ledger.transaction():
+            ledger.deposit(deposit)
+            send(ledger.withdraw_erc1155(DAPP_ADDRESS, deposit.depositor, deposit.token_address, deposit.token_id, deposit.amount))
+
+    def on_erc1155_batch(metadata, payload_hex):
+        deposit = asset.decode_erc1155_batch_deposit(payload_hex)
+        with ledger.transaction():
+            ledger.deposit(deposit)
+            send(ledger.withdraw_erc1155_batch(DAPP_ADDRESS, deposit.depositor, deposit.token_address, deposit.token_ids, deposit.amounts))
+
+    routes.add_portal_routes(PORTALS, ether=on_ether, erc20=on_erc20, erc721=on_erc721, erc1155_single=on_erc1155_single, erc1155_batch=on_erc1155_batch)
+
+    upload = model.DataChunks()
+
+    def on_chunk(metadata, payload_hex):
+        if not processor.update_data_chunks(upload, payload_hex, metadata.msg_sender):
+            return
+        if len(upload.chunks_data) < upload.total_chunks:
+            return
+        score, _ = processor.csv_blank_cell_stats(processor.iter_data_from_chunks(upload))
+        digest = processor.get_data_chunks_digest(upload)
+        handler.send_notice(util.str2hex(json.dumps({"score": score, "sha256": digest.hex()})))
+        processor.release_data_chunks(upload)
+
+    routes.add_sender_route(UPLOADER, on_chunk)
+
+    def on_claim(metadata, payload):
+        dapp_asst.expire_claims(metadata.timestamp)
+        user = dapp_asst.get_user(metadata.msg_sender)
+        claim = model.Claim(model.pack_address(metadata.msg_sender), None, payload["value"], metadata.timestamp, model.Status.OPEN, None)
+        dapp_asst.add_claim(payload["id"], claim)
+        user.open_claims[payload["id"]] = claim
+        user.total_claims += 1
+
+    def on_dispute(metadata, payload):
+        dapp_asst.expire_claims(metadata.timestamp)
+        claim = dapp_asst.claims.get(payload["id"])
+        if claim is None or claim.status != model.Status.OPEN:
+            raise ValueError(f"Claim {payload['id']} can't be disputed")
+        dapp_asst.update_claim(payload["id"], status=model.Status.DISPUTING, disputing_user_address=model.pack_address(metadata.msg_sender), last_edited=metadata.timestamp)
+        user = dapp_asst.get_user(metadata.msg_sender)
+        user.open_disputes[payload["id"]] = claim
+        user.total_disputes += 1
+
+    routes.add_method_route("claim", on_claim)
+    routes.add_method_route("dispute", on_dispute)
+
+    handler.inspect_handler.add_route("get_claim_list", dapp_asst.get_claim_list)
+    handler.inspect_handler.add_route("show_user", dapp_asst.show_user)
+    return handler
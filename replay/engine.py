@@ -0,0 +1,124 @@
+import importlib
+import os
+import resource
+import time
+
+# rollups.message refuses to load without a server URL. Replays never reach
+# it: requests are answered by the stub adapter or sent to the stub server.
+os.environ.setdefault("ROLLUP_HTTP_SERVER_URL", "http://replay.invalid")
+
+from rollups import message
+from rollups.scheduler import Backoff, RequestLoop
+from replay.stub import RollupStub, StubAdapter, StubServer
+
+class ReplayResult:
+    def __init__(self, stub, seconds, errors):
+        self.outputs = stub.outputs
+        self.statuses = stub.statuses
+        self.latencies = sorted(stub.latencies)
+        self.inputs = len(stub.latencies)
+        self.seconds = seconds
+        self.errors = errors
+        # Peak RSS of the whole process so far, in KiB on Linux.
+        self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    @property
+    def inputs_per_sec(self):
+        return self.inputs / self.seconds if self.seconds else 0.0
+
+    def percentile(self, q):
+        if not self.latencies:
+            return 0.0
+        return self.latencies[min(len(self.latencies) - 1, int(q * len(self.latencies)))]
+
+    def summary(self):
+        return {
+            "inputs": self.inputs,
+            "seconds": round(self.seconds, 6),
+            "inputs_per_sec": round(self.inputs_per_sec, 1),
+            "p50_ms": round(self.percentile(0.5) * 1e3, 4),
+            "p99_ms": round(self.percentile(0.99) * 1e3, 4),
+            "max_ms": round(self.latencies[-1] * 1e3, 4) if self.latencies else 0.0,
+            "outputs": len(self.outputs),
+            "rejected": sum(1 for status in self.statuses if status == "reject"),
+            "errors": len(self.errors),
+            "peak_rss_kib": self.peak_rss,
+        }
+
+def compare_outputs(outputs, golden, limit=10):
+    """Returns descriptions of the first `limit` differences between two output lists."""
+    mismatches = []
+    for position in range(max(len(outputs), len(golden))):
+        got = outputs[position] if position < len(outputs) else None
+        expected = golden[position] if position < len(golden) else None
+        if got != expected:
+            mismatches.append(f"output {position}: expected {expected}, got {got}")
+            if len(mismatches) == limit:
+                break
+    return mismatches
+
+def load_app(spec):
+    """Loads the handlers to replay into from "module:attribute".
+
+    The attribute may be a dict of handlers by request type (like
+    dapp.handlers), an object with handle_advance/handle_inspect (like
+    handler.Handler), or a function returning one of them.
+    """
+    module_name, _, attribute = spec.partition(":")
+    app = getattr(importlib.import_module(module_name), attribute or "handlers")
+    if callable(app) and not hasattr(app, "handle_advance"):
+        app = app()
+    if isinstance(app, dict):
+        return app
+    return {"advance_state": app.handle_advance, "inspect_state": app.handle_inspect}
+
+def _guard(handler, errors, stub):
+    # A handler raising would stop the loop; record it and reject the input.
+    def guarded(data):
+        try:
+            return handler(data)
+        except Exception as e:
+            errors.append({"input": stub.position - 1, "error": repr(e)})
+            return "reject"
+    return guarded
+
+def replay(rollup_requests, handlers, http=False):
+    """Runs the handlers over recorded /finish responses.
+
+    The DApp's own RequestLoop and rollups.message session are used. By
+    default the session is answered in-process by a StubAdapter; with
+    `http` a StubServer is started on a local port instead, so the HTTP
+    round trips are part of the measurement.
+
+    Returns:
+        ReplayResult: Captured outputs, finish statuses, latencies and
+        errors.
+    """
+    stub = RollupStub(rollup_requests)
+    errors = []
+    guarded = {request_type: _guard(handler, errors, stub) for request_type, handler in handlers.items()}
+    server = None
+    previous_url = message.rollup_server
+    message.close_session()
+    if http:
+        server = StubServer(stub).start()
+        message.rollup_server = server.url
+    else:
+        adapter = StubAdapter(stub)
+        session = message.get_session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    loop = RequestLoop(guarded, backoff=Backoff(0, 0))
+    start = time.perf_counter()
+    try:
+        loop.run(len(stub.requests))
+        # Report the status of the last input, the stub answers 202.
+        message.send_post("finish", loop.finish)
+    finally:
+        seconds = time.perf_counter() - start
+        message.close_session()
+        message.rollup_server = previous_url
+        if server is not None:
+            server.stop()
+    return ReplayResult(stub, seconds, errors)
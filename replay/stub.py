@@ -0,0 +1,138 @@
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import BaseAdapter
+
+class RollupStub:
+    """In-memory stand-in for the rollup HTTP server.
+
+    /finish hands out the given requests one by one and answers 202 once
+    they are exhausted. Notices, vouchers, reports and exceptions are
+    recorded with the index of the input that produced them; notices and
+    vouchers get increasing indexes like on a node. The time between
+    handing out an input and receiving the next /finish is recorded as the
+    input's latency.
+    """
+
+    def __init__(self, rollup_requests):
+        self.requests = list(rollup_requests)
+        self.position = 0
+        self.outputs = []
+        self.statuses = []
+        self.latencies = []
+        self.output_indexes = {"notice": 0, "voucher": 0}
+        self._started = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.position >= len(self.requests) and self._started is None
+
+    def finish(self, body):
+        with self._lock:
+            now = time.perf_counter()
+            if self._started is not None:
+                self.latencies.append(now - self._started)
+                self.statuses.append(body.get("status"))
+                self._started = None
+            if self.position >= len(self.requests):
+                return 202, None
+            request = self.requests[self.position]
+            self.position += 1
+            self._started = time.perf_counter()
+            return 200, request
+
+    def output(self, kind, body):
+        with self._lock:
+            record = {"input": self.position - 1, "type": kind}
+            record.update(body)
+            self.outputs.append(record)
+            if kind in self.output_indexes:
+                index = self.output_indexes[kind]
+                self.output_indexes[kind] = index + 1
+                return 200, {"index": index}
+            return 200, None
+
+    def post(self, endpoint, body):
+        if endpoint == "finish":
+            return self.finish(body)
+        if endpoint in ("notice", "voucher", "report", "exception"):
+            return self.output(endpoint, body)
+        return 404, None
+
+class StubAdapter(BaseAdapter):
+    """requests transport adapter answering from a RollupStub in-process.
+
+    Mounted on the pooled session of rollups.message, it lets the DApp run
+    its normal request loop without sockets.
+    """
+
+    def __init__(self, stub):
+        super().__init__()
+        self.stub = stub
+
+    def send(self, request, **kwargs):
+        endpoint = request.path_url.rstrip("/").rsplit("/", 1)[-1]
+        status, body = self.stub.post(endpoint, json.loads(request.body or "{}"))
+        response = requests.Response()
+        response.status_code = status
+        response.request = request
+        response.url = request.url
+        response.encoding = "utf-8"
+        response._content = json.dumps(body).encode() if body is not None else b""
+        response.raw = io.BytesIO(response._content)
+        return response
+
+    def close(self):
+        pass
+
+class StubServer:
+    """Serves a RollupStub over HTTP on a local port."""
+
+    def __init__(self, stub, host="127.0.0.1", port=0):
+        self.stub = stub
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+                status, response = stub.post(self.path.rstrip("/").rsplit("/", 1)[-1], body)
+                data = json.dumps(response).encode() if response is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
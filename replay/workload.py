@@ -0,0 +1,195 @@
+import csv
+import gzip
+import io
+import json
+import random
+import struct
+
+from handler.handler import NetworkAddresses
+from rollups.util import bin2hex, str2hex
+
+# Portal and relay addresses of the Cartesi Rollups 1.x deployments, which
+# the workloads send deposits from.
+PORTALS = NetworkAddresses(
+    dapp_address_relay="0xf5de34d6bbc0446e2a45719e718efebaae179dae",
+    ether_portal_address="0xffdbe43d4c855bf7e0f105c400a50857f53ab044",
+    erc20_portal_address="0x9c21aeb2093c32ddbc53eef24b873bdcd1ada1db",
+    erc721_portal_address="0x237f8dd094c0e47f4236f12b4fa01d6dae89fb87",
+    erc1155_single_portal_address="0x7cfb0193ca87eb6e48056885e026552c3a941fc4",
+    erc1155_batch_portal_address="0xedb53860a6b52bbb7561ad596416ee9965b055aa",
+)
+# Sender of the chunked uploads.
+UPLOADER = "0x" + "0f" * 20
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def write_jsonl(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")))
+            f.write("\n")
+
+class Inputs:
+    """Builds /finish responses with consecutive input indexes and blocks.
+
+    Each input is one block later than the previous one and blocks are
+    `block_time` seconds apart, so timestamps are deterministic.
+    """
+
+    def __init__(self, start_index=0, start_time=1700000000, block_time=12):
+        self.input_index = start_index
+        self.start_time = start_time
+        self.block_time = block_time
+
+    @property
+    def timestamp(self):
+        return self.start_time + self.input_index * self.block_time
+
+    def advance(self, sender, payload_hex):
+        request = {
+            "request_type": "advance_state",
+            "data": {
+                "metadata": {
+                    "msg_sender": sender,
+                    "epoch_index": 0,
+                    "input_index": self.input_index,
+                    "block_number": self.input_index,
+                    "timestamp": self.timestamp,
+                },
+                "payload": payload_hex,
+            },
+        }
+        self.input_index += 1
+        return request
+
+    def inspect(self, payload_hex):
+        return {"request_type": "inspect_state", "data": {"payload": payload_hex}}
+
+def _address(rng):
+    return bytes(rng.getrandbits(8) for _ in range(20))
+
+def _word(value):
+    return value.to_bytes(32, byteorder="big")
+
+def _abi_bytes(data):
+    return _word(len(data)) + data + b"\0" * (-len(data) % 32)
+
+def _abi_uints(values):
+    return _word(len(values)) + b"".join(_word(value) for value in values)
+
+def portal_deposits(count, seed=0, inputs=None, users=100, tokens=10):
+    """Deposits through every portal, in random order.
+
+    Ether, ERC-20, ERC-721, ERC-1155 single and batch deposits are encoded
+    like the portals do, from `users` depositors and `tokens` token
+    contracts.
+    """
+    rng = random.Random(seed)
+    inputs = inputs or Inputs()
+    depositors = [_address(rng) for _ in range(users)]
+    token_addresses = [_address(rng) for _ in range(tokens)]
+    requests = []
+    for _ in range(count):
+        depositor = rng.choice(depositors)
+        token = rng.choice(token_addresses)
+        kind = rng.randrange(5)
+        if kind == 0:
+            portal = PORTALS.ether_portal_address
+            payload = depositor + _word(rng.randrange(1, 10**20))
+        elif kind == 1:
+            portal = PORTALS.erc20_portal_address
+            payload = b"\x01" + token + depositor + _word(rng.randrange(1, 10**24))
+        elif kind == 2:
+            portal = PORTALS.erc721_portal_address
+            payload = token + depositor + _word(rng.randrange(10**6))
+        elif kind == 3:
+            portal = PORTALS.erc1155_single_portal_address
+            base_layer, exec_layer = b"", rng.randbytes(rng.randrange(64))
+            head = _word(64) + _word(64 + len(_abi_bytes(base_layer)))
+            payload = token + depositor + _word(rng.randrange(100)) + _word(rng.randrange(1, 1000)) + head + _abi_bytes(base_layer) + _abi_bytes(exec_layer)
+        else:
+            portal = PORTALS.erc1155_batch_portal_address
+            size = rng.randrange(1, 32)
+            ids = _abi_uints([rng.randrange(100) for _ in range(size)])
+            amounts = _abi_uints([rng.randrange(1, 1000) for _ in range(size)])
+            base_layer, exec_layer = b"", b""
+            head_size = 4 * 32
+            head = _word(head_size) + _word(head_size + len(ids)) + _word(head_size + len(ids) + len(amounts)) + _word(head_size + len(ids) + len(amounts) + len(_abi_bytes(base_layer)))
+            payload = token + depositor + head + ids + amounts + _abi_bytes(base_layer) + _abi_bytes(exec_layer)
+        requests.append(inputs.advance(portal, bin2hex(payload)))
+    return requests
+
+def csv_data(rng, rows, columns, blank_rate=0.1):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([f"column{column}" for column in range(columns)])
+    for _ in range(rows):
+        writer.writerow(["" if rng.random() < blank_rate else str(rng.randrange(10**6)) for _ in range(columns)])
+    return buffer.getvalue().encode()
+
+def chunked_uploads(uploads, rows=1000, columns=8, chunk_size=4096, seed=0, inputs=None, shuffle=False, resend=0.0):
+    """Gzipped CSV files sent by UPLOADER in chunk frames, one upload after the other.
+
+    Frames use the layout of processor.iter_prepared_data: chunk index and
+    last chunk index as big-endian uint32, then the compressed bytes. With
+    `shuffle` the chunks of each upload arrive out of order, and each chunk
+    is sent a second time with probability `resend`, as a retrying client
+    would.
+    """
+    rng = random.Random(seed)
+    # Resends draw from their own generator, so the uploads are the same
+    # with or without them.
+    resends = random.Random(f"{seed}-resend")
+    inputs = inputs or Inputs()
+    requests = []
+    for _ in range(uploads):
+        compressed = gzip.compress(csv_data(rng, rows, columns), mtime=0)
+        last = (len(compressed) - 1) // chunk_size
+        order = list(range(last + 1))
+        if shuffle:
+            rng.shuffle(order)
+        for chunk_index in order:
+            frame = struct.pack(">II", chunk_index, last) + compressed[chunk_index * chunk_size:(chunk_index + 1) * chunk_size]
+            requests.append(inputs.advance(UPLOADER, bin2hex(frame)))
+            if resend and resends.random() < resend:
+                requests.append(inputs.advance(UPLOADER, bin2hex(frame)))
+    return requests
+
+def claim_lifecycle(claims, users=50, dispute_rate=0.2, inspect_every=10, seed=0, inputs=None):
+    """Claims opened by random users, some disputed by others, with polling.
+
+    Advance payloads are JSON {"method": "claim"|"dispute", ...}. Disputes
+    come in the block right after the claim, before it times out; the
+    other claims are finalized as block timestamps advance. Every
+    `inspect_every` claims a get_claim_list or show_user inspect is added,
+    as a frontend polling the DApp would.
+    """
+    rng = random.Random(seed)
+    inputs = inputs or Inputs()
+    addresses = ["0x" + _address(rng).hex() for _ in range(users)]
+    requests = []
+    claimants = []
+    for claim_id in range(claims):
+        user = rng.choice(addresses)
+        requests.append(inputs.advance(user, str2hex(json.dumps({"method": "claim", "id": claim_id, "value": rng.randrange(1000)}))))
+        claimants.append(user)
+        if rng.random() < dispute_rate:
+            disputer = rng.choice([address for address in addresses if address != user])
+            requests.append(inputs.advance(disputer, str2hex(json.dumps({"method": "dispute", "id": claim_id}))))
+        if claim_id % inspect_every == inspect_every - 1:
+            if rng.random() < 0.5:
+                query = {"method": "get_claim_list"}
+                if rng.random() < 0.5:
+                    query["user"] = rng.choice(claimants)
+            else:
+                query = {"method": "show_user", "id": rng.choice(claimants)}
+            requests.append(inputs.inspect(str2hex(json.dumps(query))))
+    return requests
+
+WORKLOADS = {
+    "deposits": portal_deposits,
+    "uploads": chunked_uploads,
+    "claims": claim_lifecycle,
+}
@@ -1,14 +1,18 @@
-import util
+from rollups import profile, util
 import binascii
 from decimal import Decimal
 
 class EtherDeposit:
+    __slots__ = ("depositor", "amount", "data")
+
     def __init__(self, depositor, amount, data):
         self.depositor = depositor
         self.amount = amount
         self.data = data
 
 class Erc20Deposit:
+    __slots__ = ("depositor", "token_address", "amount", "data")
+
     def __init__(self, depositor, token_address, amount, data):
         self.depositor = depositor
         self.token_address = token_address
@@ -16,6 +20,8 @@ class Erc20Deposit:
         self.data = data
 
 class Erc721Deposit:
+    __slots__ = ("depositor", "token_address", "token_id", "data")
+
     def __init__(self, depositor, token_address, token_id, data):
         self.depositor = depositor
         self.token_address = token_address
@@ -23,6 +29,8 @@ class Erc721Deposit:
         self.data = data
 
 class Erc1155SingleDeposit:
+    __slots__ = ("depositor", "token_address", "token_id", "amount", "base_layer_data", "exec_layer_data")
+
     def __init__(self, depositor, token_address, token_id, amount, base_layer_data, exec_layer_data):
         self.depositor = depositor
         self.token_address = token_address
@@ -32,6 +40,8 @@ class Erc1155SingleDeposit:
         self.exec_layer_data = exec_layer_data
 
 class Erc1155BatchDeposit:
+    __slots__ = ("depositor", "token_address", "token_ids", "amounts", "base_layer_data", "exec_layer_data")
+
     def __init__(self, depositor, token_address, token_ids, amounts, base_layer_data, exec_layer_data):
         self.depositor = depositor
         self.token_address = token_address
@@ -40,113 +50,249 @@ class Erc1155BatchDeposit:
         self.base_layer_data = base_layer_data
         self.exec_layer_data = exec_layer_data
 
+class Erc1155BatchColumns:
+    """Erc1155BatchDeposit with the token ids and amounts left as columns.
+
+    token_ids and amounts are util.Uint256Column views of the payload words,
+    so large batches are summed, grouped and applied to balances without
+    building a list of ints first.
+    """
+
+    __slots__ = ("depositor", "token_address", "token_ids", "amounts", "base_layer_data", "exec_layer_data")
+
+    def __init__(self, depositor, token_address, token_ids, amounts, base_layer_data, exec_layer_data):
+        self.depositor = depositor
+        self.token_address = token_address
+        self.token_ids = token_ids
+        self.amounts = amounts
+        self.base_layer_data = base_layer_data
+        self.exec_layer_data = exec_layer_data
+
+    def totals(self):
+        """Returns the deposited amount per token id, merging repeated ids."""
+        return util.group_sums(self.token_ids, self.amounts)
+
+    def credit(self, balances):
+        """Adds the deposited amounts to `balances`, a dict keyed by token id."""
+        totals = self.totals()
+        if balances.keys().isdisjoint(totals):
+            balances.update(totals)
+            return balances
+        get = balances.get
+        for token_id, amount in totals.items():
+            balances[token_id] = get(token_id, 0) + amount
+        return balances
+
+# ABI decoding helpers. Dynamic fields are read at absolute offsets in the
+# decoded payload (`base` is where the ABI-encoded section starts) instead
+# of slicing out the tail first, so every 32-byte word is read exactly once
+# and the payload is never copied as a whole. Slicing 32 bytes out of a
+# bytes object is cheaper in CPython than creating a memoryview slice, so
+# words are read from the bytes directly. Every offset is checked so a
+# malformed payload fails instead of being silently truncated.
+
+def _check_size(data, size, name):
+    if len(data) < size:
+        raise ValueError(f"{name}: payload too short, expected at least {size} bytes, got {len(data)}")
+
+def _read_word(data, offset):
+    if offset + 32 > len(data):
+        raise ValueError(f"ABI word at offset {offset} is out of bounds ({len(data)} bytes)")
+    return int.from_bytes(data[offset:offset+32], byteorder='big')
+
+def _read_position(data, base, head):
+    """Returns the absolute offset of the dynamic field referenced at `head`."""
+    position = base + _read_word(data, base + head)
+    if position + 32 > len(data):
+        raise ValueError(f"ABI offset {position - base} is out of bounds ({len(data) - base} bytes)")
+    return position
+
+def _read_dynamic_bytes(data, base, head):
+    position = _read_position(data, base, head)
+    size = _read_word(data, position)
+    start = position + 32
+    if start + size > len(data):
+        raise ValueError(f"ABI bytes of size {size} at offset {position - base} are out of bounds ({len(data) - base} bytes)")
+    return data[start:start+size]
+
+def _read_uint256_array(data, base, head):
+    position = _read_position(data, base, head)
+    size = _read_word(data, position)
+    start = position + 32
+    end = start + 32 * size
+    if end > len(data):
+        raise ValueError(f"ABI array of size {size} at offset {position - base} is out of bounds ({len(data) - base} bytes)")
+    return util.words2ints(data, start, size)
+
+def _read_uint256_column(data, base, head):
+    position = _read_position(data, base, head)
+    size = _read_word(data, position)
+    start = position + 32
+    end = start + 32 * size
+    if end > len(data):
+        raise ValueError(f"ABI array of size {size} at offset {position - base} is out of bounds ({len(data) - base} bytes)")
+    return util.Uint256Column(data[start:end])
+
+@profile.timed("abi.decode_ether_deposit")
 def decode_ether_deposit(payload_hex):
-    bin_data = util.hex2bin(payload_hex)
+    bin_data = util.payload_bytes(payload_hex)
+    _check_size(bin_data, 52, "EtherDeposit")
+    depositor, = util.addresses2hex(bin_data, 0, 1)
     amount = int.from_bytes(bin_data[20:52], byteorder='big')
-    return EtherDeposit(util.bin2hex(bin_data[:20]), amount, bin_data[52:])
+    return EtherDeposit(depositor, amount, bin_data[52:])
 
+@profile.timed("abi.decode_erc20_deposit")
 def decode_erc20_deposit(payload_hex):
-    bin_data = util.hex2bin(payload_hex)
+    bin_data = util.payload_bytes(payload_hex)
+    _check_size(bin_data, 73, "Erc20Deposit")
+    token_address, depositor = util.addresses2hex(bin_data, 1, 2)
     amount = int.from_bytes(bin_data[41:73], byteorder='big')
-    return Erc20Deposit(util.bin2hex(bin_data[21:41]), util.bin2hex(bin_data[1:21]), amount, bin_data[73:])
+    return Erc20Deposit(depositor, token_address, amount, bin_data[73:])
 
+@profile.timed("abi.decode_erc721_deposit")
 def decode_erc721_deposit(payload_hex):
-    bin_data = util.hex2bin(payload_hex)
+    bin_data = util.payload_bytes(payload_hex)
+    _check_size(bin_data, 72, "Erc721Deposit")
+    token_address, depositor = util.addresses2hex(bin_data, 0, 2)
     token_id = int.from_bytes(bin_data[40:72], byteorder='big')
-    return Erc721Deposit(util.bin2hex(bin_data[20:40]), util.bin2hex(bin_data[:20]), token_id, bin_data[72:])
+    return Erc721Deposit(depositor, token_address, token_id, bin_data[72:])
 
+@profile.timed("abi.decode_erc1155_single_deposit")
 def decode_erc1155_single_deposit(payload_hex):
-    bin_data = util.hex2bin(payload_hex)
+    bin_data = util.payload_bytes(payload_hex)
+    _check_size(bin_data, 168, "Erc1155SingleDeposit")
+    token_address, depositor = util.addresses2hex(bin_data, 0, 2)
     token_id = int.from_bytes(bin_data[40:72], byteorder='big')
     amount = int.from_bytes(bin_data[72:104], byteorder='big')
 
-    all_data = bin_data[104:]
-    bl_data_position = int.from_bytes(all_data[0:32], byteorder='big')
-    bl_data_size = int.from_bytes(all_data[bl_data_position:bl_data_position+32], byteorder='big')
-    bl_data = all_data[bl_data_position+32:bl_data_position+32+bl_data_size]
-
-    el_data_position = int.from_bytes(all_data[32:64], byteorder='big')
-    el_data_size = int.from_bytes(all_data[el_data_position:el_data_position+32], byteorder='big')
-    el_data = all_data[el_data_position+32:el_data_position+32+el_data_size]
+    bl_data = _read_dynamic_bytes(bin_data, 104, 0)
+    el_data = _read_dynamic_bytes(bin_data, 104, 32)
 
-    return Erc1155SingleDeposit(util.bin2hex(bin_data[20:40]), util.bin2hex(bin_data[:20]), token_id, amount, bl_data, el_data)
+    return Erc1155SingleDeposit(depositor, token_address, token_id, amount, bl_data, el_data)
 
+@profile.timed("abi.decode_erc1155_batch_deposit")
 def decode_erc1155_batch_deposit(payload_hex):
-    bin_data = util.hex2bin(payload_hex)
-    token_address = util.bin2hex(bin_data[:20])
-    depositor = util.bin2hex(bin_data[20:40])
+    bin_data = util.payload_bytes(payload_hex)
+    _check_size(bin_data, 168, "Erc1155BatchDeposit")
+    token_address, depositor = util.addresses2hex(bin_data, 0, 2)
 
-    all_data = bin_data[40:]
-    ids_position = int.from_bytes(all_data[0:32], byteorder='big')
-    ids_size = int.from_bytes(all_data[ids_position:ids_position+32], byteorder='big')
-    token_ids = [int.from_bytes(all_data[ids_position+32*(i+1):ids_position+32*(i+2)], byteorder='big') for i in range(ids_size)]
+    token_ids = _read_uint256_array(bin_data, 40, 0)
+    amounts = _read_uint256_array(bin_data, 40, 32)
+    if len(token_ids) != len(amounts):
+        raise ValueError(f"Erc1155BatchDeposit: {len(token_ids)} token ids but {len(amounts)} amounts")
 
-    amounts_position = int.from_bytes(all_data[32:64], byteorder='big')
-    amounts_size = int.from_bytes(all_data[amounts_position:amounts_position+32], byteorder='big')
-    amounts = [int.from_bytes(all_data[amounts_position+32*(i+1):amounts_position+32*(i+2)], byteorder='big') for i in range(amounts_size)]
+    bl_data = _read_dynamic_bytes(bin_data, 40, 64)
+    el_data = _read_dynamic_bytes(bin_data, 40, 96)
 
-    bl_data_position = int.from_bytes(all_data[64:96], byteorder='big')
-    bl_data_size = int.from_bytes(all_data[bl_data_position:bl_data_position+32], byteorder='big')
-    bl_data = all_data[bl_data_position+32:bl_data_position+32+bl_data_size]
+    return Erc1155BatchDeposit(depositor, token_address, token_ids, amounts, bl_data, el_data)
 
-    el_data_position = int.from_bytes(all_data[96:128], byteorder='big')
-    el_data_size = int.from_bytes(all_data[el_data_position:el_data_position+32], byteorder='big')
-    el_data = all_data[el_data_position+32:el_data_position+32+el_data_size]
+@profile.timed("abi.decode_erc1155_batch_deposit_columns")
+def decode_erc1155_batch_deposit_columns(payload_hex):
+    """Like decode_erc1155_batch_deposit, returning Erc1155BatchColumns."""
+    bin_data = util.payload_bytes(payload_hex)
+    _check_size(bin_data, 168, "Erc1155BatchDeposit")
+    token_address, depositor = util.addresses2hex(bin_data, 0, 2)
 
-    return Erc1155BatchDeposit(depositor, token_address, token_ids, amounts, bl_data, el_data)
+    token_ids = _read_uint256_column(bin_data, 40, 0)
+    amounts = _read_uint256_column(bin_data, 40, 32)
+    if len(token_ids) != len(amounts):
+        raise ValueError(f"Erc1155BatchDeposit: {len(token_ids)} token ids but {len(amounts)} amounts")
 
-def ether_withdrawal_voucher(sender, receiver, amount):
-    payload = "0x522f6815" + util.bin2hex(util.address2bin(receiver) + util.pad_bytes(amount.to_bytes(32, byteorder='big'), 32))
-    return {"destination": sender, "payload": payload}
+    bl_data = _read_dynamic_bytes(bin_data, 40, 64)
+    el_data = _read_dynamic_bytes(bin_data, 40, 96)
 
-def erc20_transfer_voucher(receiver, token_address, amount):
-    payload = "0xa9059cbb" + util.bin2hex(util.address2bin(receiver) + util.pad_bytes(amount.to_bytes(32, byteorder='big'), 32))
-    return {"destination": token_address, "payload": payload}
+    return Erc1155BatchColumns(depositor, token_address, token_ids, amounts, bl_data, el_data)
 
-def erc721_safe_transfer_voucher(sender, receiver, token_address, token_id):
-    payload_bytes = util.address2bin(sender) + util.address2bin(receiver) + util.pad_bytes(token_id.to_bytes(32, byteorder='big'), 32)
-    payload = "0x42842e0e" + util.bin2hex(payload_bytes)
-    return {"destination": token_address, "payload": payload}
+# ABI encoding. Voucher payloads are written into a single preallocated
+# buffer whose size is computed up front, then hex-encoded once.
 
-def erc1155_safe_transfer_from_voucher(sender, receiver, token_address, token_id, amount, data):
-    data_position = 160
-    len_data = len(data)
-    slots = len_data // 32 + (1 if len_data % 32 > 0 else 0)
+class _AbiWriter:
+    __slots__ = ("buffer", "offset")
 
-    payload_bytes = util.address2bin(sender) + util.address2bin(receiver)
-    payload_bytes += util.pad_bytes(token_id.to_bytes(32, byteorder='big'), 32)
-    payload_bytes += util.pad_bytes(amount.to_bytes(32, byteorder='big'), 32)
-    payload_bytes += util.pad_bytes(data_position.to_bytes(32, byteorder='big'), 32)
-    payload_bytes += util.pad_bytes(len_data.to_bytes(32, byteorder='big'), 32)
-    payload_bytes += util.pad_bytes_right(data, slots)
+    def __init__(self, selector, size):
+        self.buffer = bytearray(4 + size)
+        self.buffer[:4] = selector
+        self.offset = 4
 
-    payload = "0xf242432a" + util.bin2hex(payload_bytes)
-    return {"destination": token_address, "payload": payload}
+    def uint(self, value):
+        self.buffer[self.offset:self.offset+32] = value.to_bytes(32, byteorder='big')
+        self.offset += 32
 
-def erc1155_safe_batch_transfer_from_voucher(sender, receiver, token_address, token_ids, amounts, data):
-    len_ids = len(token_ids)
-    len_amounts = len(amounts)
-    len_data = len(data)
+    def uints(self, values):
+        # Converting all words first and copying them in one slice
+        # assignment is several times faster than assigning each slice.
+        words = util.ints2words(values)
+        self.buffer[self.offset:self.offset+len(words)] = words
+        self.offset += len(words)
 
-    ids_position = 160
-    amounts_position = ids_position + 32 + len_ids * 32
-    data_position = amounts_position + 32 + len_amounts * 32
+    def address(self, address):
+        address_bin = util.hex2bin(address)
+        if len(address_bin) > 32:
+            raise ValueError(f"Invalid address {address}")
+        end = self.offset + 32
+        self.buffer[end-len(address_bin):end] = address_bin
+        self.offset = end
 
-    payload_bytes = util.address2bin(sender) + util.address2bin(receiver)
-    payload_bytes += util.pad_bytes(ids_position.to_bytes(32, byteorder='big'), 32)
-    payload_bytes += util.pad_bytes(amounts_position.to_bytes(32, byteorder='big'), 32)
-    payload_bytes += util.pad_bytes(data_position.to_bytes(32, byteorder='big'), 32)
+    def bytes(self, data):
+        self.uint(len(data))
+        self.buffer[self.offset:self.offset+len(data)] = data
+        self.offset += _padded_size(len(data))
 
-    payload_bytes += util.pad_bytes(len_ids.to_bytes(32, byteorder='big'), 32)
-    for id in token_ids:
-        payload_bytes += util.pad_bytes(id.to_bytes(32, byteorder='big'), 32)
+    def hex(self):
+        return util.bin2hex(self.buffer)
 
-    payload_bytes += util.pad_bytes(len_amounts.to_bytes(32, byteorder='big'), 32)
-    for amount in amounts:
-        payload_bytes += util.pad_bytes(amount.to_bytes(32, byteorder='big'), 32)
+def _padded_size(size):
+    return (size + 31) // 32 * 32
 
-    payload_bytes += util.pad_bytes(len_data.to_bytes(32, byteorder='big'), 32)
-    payload_bytes += util.pad_bytes_right(data, len_data // 32 + (1 if len_data % 32 > 0 else 0))
+@profile.timed("abi.ether_withdrawal_voucher")
+def ether_withdrawal_voucher(sender, receiver, amount):
+    writer = _AbiWriter(b"\x52\x2f\x68\x15", 64)
+    writer.address(receiver)
+    writer.uint(amount)
+    return {"destination": sender, "payload": writer.hex()}
+
+@profile.timed("abi.erc20_transfer_voucher")
+def erc20_transfer_voucher(receiver, token_address, amount):
+    writer = _AbiWriter(b"\xa9\x05\x9c\xbb", 64)
+    writer.address(receiver)
+    writer.uint(amount)
+    return {"destination": token_address, "payload": writer.hex()}
+
+@profile.timed("abi.erc721_safe_transfer_voucher")
+def erc721_safe_transfer_voucher(sender, receiver, token_address, token_id):
+    writer = _AbiWriter(b"\x42\x84\x2e\x0e", 96)
+    writer.address(sender)
+    writer.address(receiver)
+    writer.uint(token_id)
+    return {"destination": token_address, "payload": writer.hex()}
+
+@profile.timed("abi.erc1155_safe_transfer_from_voucher")
+def erc1155_safe_transfer_from_voucher(sender, receiver, token_address, token_id, amount, data):
+    data_position = 160
+    writer = _AbiWriter(b"\xf2\x42\x43\x2a", data_position + 32 + _padded_size(len(data)))
+    writer.address(sender)
+    writer.address(receiver)
+    writer.uint(token_id)
+    writer.uint(amount)
+    writer.uint(data_position)
+    writer.bytes(data)
+    return {"destination": token_address, "payload": writer.hex()}
+
+@profile.timed("abi.erc1155_safe_batch_transfer_from_voucher")
+def erc1155_safe_batch_transfer_from_voucher(sender, receiver, token_address, token_ids, amounts, data):
+    ids_position = 160
+    amounts_position = ids_position + 32 + len(token_ids) * 32
+    data_position = amounts_position + 32 + len(amounts) * 32
 
-    payload = "0x2eb2c2d6" + util.bin2hex(payload_bytes)
-    return {"destination": token_address, "payload": payload}
+    writer = _AbiWriter(b"\x2e\xb2\xc2\xd6", data_position + 32 + _padded_size(len(data)))
+    writer.address(sender)
+    writer.address(receiver)
+    writer.uint(ids_position)
+    writer.uint(amounts_position)
+    writer.uint(data_position)
+    writer.uint(len(token_ids))
+    writer.uints(token_ids)
+    writer.uint(len(amounts))
+    writer.uints(amounts)
+    writer.bytes(data)
+    return {"destination": token_address, "payload": writer.hex()}
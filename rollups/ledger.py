@@ -0,0 +1,207 @@
+from contextlib import contextmanager
+
+from model import pack_address as _pack_address, unpack_address as _hex
+from rollups import asset
+
+# Ether is kept under the zero address.
+ETHER = bytes(20)
+
+class LedgerException(Exception):
+    pass
+
+def pack_address(address):
+    """model.pack_address, raising LedgerException for invalid addresses."""
+    try:
+        return _pack_address(address)
+    except ValueError as e:
+        raise LedgerException(str(e)) from e
+
+def balance_key(owner, asset_address, token_id=None):
+    """Packs a balance key: owner and asset addresses, then the token id.
+
+    Fungible balances (ether, ERC-20) have no token id, so their keys are 40
+    bytes; ERC-721 and ERC-1155 keys end with the 32-byte big-endian id.
+    """
+    key = pack_address(owner) + pack_address(asset_address)
+    if token_id is not None:
+        key += token_id.to_bytes(32, "big")
+    return key
+
+class Ledger:
+    """Balances per (owner, asset, token id), for assets held by the DApp.
+
+    Balances live in one dict from packed keys (see balance_key) to ints,
+    which marshals as-is for snapshots; zero balances are removed. Every
+    change is recorded in a journal while a transaction is open, so all the
+    changes made while handling an input can be rolled back together:
+
+        with ledger.transaction():
+            ledger.transfer(a, b, token, 10)
+            ledger.transfer(b, c, token, 5)  # raising undoes both
+
+    Transactions nest; an inner one that fails only undoes its own changes.
+    """
+
+    def __init__(self):
+        self.balances = {}
+        self._journal = None
+
+    def __len__(self):
+        return len(self.balances)
+
+    def clear(self):
+        self.balances.clear()
+
+    def load(self, balances):
+        """Replaces the balances, e.g. with a dict restored from a snapshot."""
+        self.balances = dict(balances)
+
+    def balance(self, owner, asset_address=ETHER, token_id=None):
+        return self.balances.get(balance_key(owner, asset_address, token_id), 0)
+
+    def owner_balances(self, owner):
+        """Returns {(asset address, token id): amount} for one owner."""
+        prefix = pack_address(owner)
+        return {
+            (_hex(key[20:40]), int.from_bytes(key[40:], "big") if len(key) > 40 else None): amount
+            for key, amount in self.balances.items() if key[:20] == prefix
+        }
+
+    def _set(self, key, value, previous):
+        if self._journal is not None:
+            self._journal.append((key, previous))
+        if value:
+            self.balances[key] = value
+        else:
+            self.balances.pop(key, None)
+
+    def credit_key(self, key, amount):
+        if amount < 0:
+            raise LedgerException(f"Invalid amount {amount}")
+        previous = self.balances.get(key, 0)
+        self._set(key, previous + amount, previous)
+
+    def debit_key(self, key, amount):
+        if amount < 0:
+            raise LedgerException(f"Invalid amount {amount}")
+        previous = self.balances.get(key, 0)
+        if previous < amount:
+            raise LedgerException(f"Insufficient balance: {previous} < {amount}")
+        self._set(key, previous - amount, previous)
+
+    def credit(self, owner, asset_address, amount, token_id=None):
+        self.credit_key(balance_key(owner, asset_address, token_id), amount)
+
+    def debit(self, owner, asset_address, amount, token_id=None):
+        self.debit_key(balance_key(owner, asset_address, token_id), amount)
+
+    def transfer(self, sender, receiver, asset_address, amount, token_id=None):
+        token = pack_address(asset_address)
+        suffix = token if token_id is None else token + token_id.to_bytes(32, "big")
+        receiver_key = pack_address(receiver) + suffix
+        # The debit is checked before anything changes and the credit can't
+        # fail after it, so a single transfer needs no transaction.
+        self.debit_key(pack_address(sender) + suffix, amount)
+        self.credit_key(receiver_key, amount)
+
+    def transfer_many(self, legs):
+        """Applies (sender, receiver, asset, amount[, token id]) legs atomically."""
+        with self.transaction():
+            for leg in legs:
+                self.transfer(*leg)
+
+    @contextmanager
+    def transaction(self):
+        """Commits the changes made in the block, or undoes them if it raises."""
+        outer = self._journal
+        if outer is None:
+            self._journal = []
+        savepoint = len(self._journal)
+        try:
+            yield self
+        except BaseException:
+            self._rollback(savepoint)
+            raise
+        finally:
+            if outer is None:
+                self._journal = None
+
+    def _rollback(self, savepoint):
+        journal = self._journal
+        balances = self.balances
+        while len(journal) > savepoint:
+            key, previous = journal.pop()
+            if previous:
+                balances[key] = previous
+            else:
+                balances.pop(key, None)
+
+    # Portal deposits
+
+    def deposit(self, deposit):
+        """Credits a deposit decoded by one of the rollups.asset decoders."""
+        apply = _deposits.get(type(deposit))
+        if apply is None:
+            raise LedgerException(f"Unsupported deposit {type(deposit).__name__}")
+        apply(self, deposit)
+
+    def _deposit_ether(self, deposit):
+        self.credit(deposit.depositor, ETHER, deposit.amount)
+
+    def _deposit_erc20(self, deposit):
+        self.credit(deposit.depositor, deposit.token_address, deposit.amount)
+
+    def _deposit_erc721(self, deposit):
+        self.credit(deposit.depositor, deposit.token_address, 1, deposit.token_id)
+
+    def _deposit_erc1155_single(self, deposit):
+        self.credit(deposit.depositor, deposit.token_address, deposit.amount, deposit.token_id)
+
+    def _deposit_erc1155_batch(self, deposit):
+        prefix = pack_address(deposit.depositor) + pack_address(deposit.token_address)
+        with self.transaction():
+            for token_id, amount in zip(deposit.token_ids, deposit.amounts):
+                self.credit_key(prefix + token_id.to_bytes(32, "big"), amount)
+
+    def _deposit_erc1155_columns(self, deposit):
+        prefix = pack_address(deposit.depositor) + pack_address(deposit.token_address)
+        with self.transaction():
+            for token_id, amount in deposit.totals().items():
+                self.credit_key(prefix + token_id.to_bytes(32, "big"), amount)
+
+    # Withdrawals. Each debits the owner and returns the voucher that sends
+    # the assets out, as built by rollups.asset.
+
+    def withdraw_ether(self, dapp_address, owner, amount):
+        self.debit(owner, ETHER, amount)
+        return asset.ether_withdrawal_voucher(dapp_address, owner, amount)
+
+    def withdraw_erc20(self, owner, token_address, amount):
+        self.debit(owner, token_address, amount)
+        return asset.erc20_transfer_voucher(owner, token_address, amount)
+
+    def withdraw_erc721(self, dapp_address, owner, token_address, token_id):
+        self.debit(owner, token_address, 1, token_id)
+        return asset.erc721_safe_transfer_voucher(dapp_address, owner, token_address, token_id)
+
+    def withdraw_erc1155(self, dapp_address, owner, token_address, token_id, amount, data=b""):
+        self.debit(owner, token_address, amount, token_id)
+        return asset.erc1155_safe_transfer_from_voucher(dapp_address, owner, token_address, token_id, amount, data)
+
+    def withdraw_erc1155_batch(self, dapp_address, owner, token_address, token_ids, amounts, data=b""):
+        if len(token_ids) != len(amounts):
+            raise LedgerException(f"{len(token_ids)} token ids but {len(amounts)} amounts")
+        prefix = pack_address(owner) + pack_address(token_address)
+        with self.transaction():
+            for token_id, amount in zip(token_ids, amounts):
+                self.debit_key(prefix + token_id.to_bytes(32, "big"), amount)
+        return asset.erc1155_safe_batch_transfer_from_voucher(dapp_address, owner, token_address, token_ids, amounts, data)
+
+_deposits = {
+    asset.EtherDeposit: Ledger._deposit_ether,
+    asset.Erc20Deposit: Ledger._deposit_erc20,
+    asset.Erc721Deposit: Ledger._deposit_erc721,
+    asset.Erc1155SingleDeposit: Ledger._deposit_erc1155_single,
+    asset.Erc1155BatchDeposit: Ledger._deposit_erc1155_batch,
+    asset.Erc1155BatchColumns: Ledger._deposit_erc1155_columns,
+}
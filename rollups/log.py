@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import sys
+from enum import Enum
+
+class LogLevel(Enum):
+    NONE = 0
+    CRITICAL = 1
+    ERROR = 2
+    WARNING = 3
+    INFO = 4
+    DEBUG = 5
+    TRACE = 6
+
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+_levels = {
+    LogLevel.NONE: logging.CRITICAL + 10,
+    LogLevel.CRITICAL: logging.CRITICAL,
+    LogLevel.ERROR: logging.ERROR,
+    LogLevel.WARNING: logging.WARNING,
+    LogLevel.INFO: logging.INFO,
+    LogLevel.DEBUG: logging.DEBUG,
+    LogLevel.TRACE: TRACE,
+}
+
+# Payloads passed through `payload` are cut to this many characters when a
+# record is formatted, and only one record out of `payload_sample` carrying
+# payloads is emitted (1 emits all of them).
+payload_limit = int(os.getenv("DAPP_LOG_PAYLOAD_LIMIT", "256"))
+payload_sample = max(1, int(os.getenv("DAPP_LOG_PAYLOAD_SAMPLE", "1")))
+
+def to_logging_level(level):
+    """Accepts a LogLevel, a logging level number or a level name.
+
+    Names are LogLevel or logging level names in any case, or numbers, as
+    DAPP_LOG_LEVEL may give e.g. "debug" or "10".
+    """
+    if isinstance(level, LogLevel):
+        return _levels[level]
+    if isinstance(level, str):
+        name = level.strip().upper()
+        if name.lstrip("-").isdigit():
+            return int(name)
+        if name in LogLevel.__members__:
+            return _levels[LogLevel[name]]
+        number = logging.getLevelName(name)
+        if isinstance(number, int):
+            return number
+        raise ValueError(f"Unknown log level {level!r}")
+    return level
+
+def _truncate(value, limit):
+    if isinstance(value, (str, bytes, bytearray)):
+        if len(value) > limit:
+            return f"{value[:limit]}...(+{len(value) - limit})"
+        return value
+    if isinstance(value, dict):
+        return {key: _truncate(item, limit) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_truncate(item, limit) for item in value]
+    return value
+
+class Payload:
+    """Log argument that truncates large payloads, only when it is formatted.
+
+    Strings and bytes longer than the limit are cut, also inside dicts and
+    lists, so a request can be logged as-is. Nothing is copied or formatted
+    if the record is dropped by its level.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        value = _truncate(self.value, payload_limit if self.limit is None else self.limit)
+        return value if isinstance(value, str) else str(value)
+
+    def __json__(self):
+        return _truncate(self.value, payload_limit if self.limit is None else self.limit)
+
+def payload(value, limit=None):
+    return Payload(value, limit)
+
+class PayloadSampler(logging.Filter):
+    """Lets through one out of `every` records that carry a Payload."""
+
+    def __init__(self, every=None):
+        super().__init__()
+        self.every = every
+        self.seen = 0
+
+    def filter(self, record):
+        every = payload_sample if self.every is None else self.every
+        if every <= 1 or not isinstance(record.args, tuple):
+            return True
+        if not any(isinstance(arg, Payload) for arg in record.args):
+            return True
+        self.seen += 1
+        return self.seen % every == 1
+
+class CompactFormatter(logging.Formatter):
+    """One JSON object per line with short keys: time, level, logger, message.
+
+    Payload arguments are kept as structured (truncated) values under "p"
+    instead of being rendered into the message.
+    """
+
+    def format(self, record):
+        entry = {
+            "t": round(record.created, 3),
+            "l": record.levelname[0],
+            "n": record.name,
+        }
+        args = record.args if isinstance(record.args, tuple) else ()
+        payloads = [arg.__json__() for arg in args if isinstance(arg, Payload)]
+        if payloads:
+            record.args = tuple("<p>" if isinstance(arg, Payload) else arg for arg in args)
+            entry["m"] = record.getMessage()
+            record.args = args
+            entry["p"] = payloads if len(payloads) > 1 else payloads[0]
+        else:
+            entry["m"] = record.getMessage()
+        if record.exc_info:
+            entry["e"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+TEXT_FORMAT = "[%(levelname)s] %(name)s: %(message)s"
+
+_handler = None
+
+def configure(level=None, compact=None, stream=None, default_level=None):
+    """Sets up the root logger used by the DApp.
+
+    The first call installs a single handler on the root logger, or reuses
+    the one installed by logging.basicConfig; later calls only change what
+    they are given.
+
+    Args:
+        level: LogLevel, logging level or level name. DAPP_LOG_LEVEL takes
+            precedence over it.
+        compact (bool): Use CompactFormatter instead of plain text. Defaults
+            to DAPP_LOG_FORMAT=compact.
+        stream: Where records are written, stderr by default.
+        default_level: Level used if no level is given and this call is
+            the one setting up logging.
+    """
+    global _handler
+    root = logging.getLogger()
+    level = os.getenv("DAPP_LOG_LEVEL") or level
+    if _handler is None:
+        if root.handlers and stream is None:
+            _handler = root.handlers[0]
+        else:
+            _handler = logging.StreamHandler(stream or sys.stderr)
+            _handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+            root.addHandler(_handler)
+            if level is None:
+                level = default_level
+        _handler.addFilter(PayloadSampler())
+        if compact is None and os.getenv("DAPP_LOG_FORMAT") == "compact":
+            compact = True
+    elif stream is not None:
+        _handler.setStream(stream)
+    if compact is not None:
+        _handler.setFormatter(CompactFormatter() if compact else logging.Formatter(TEXT_FORMAT))
+    if level is not None:
+        set_log_level(level)
+
+def set_log_level(level):
+    logging.getLogger().setLevel(to_logging_level(level))
+
+def set_debug():
+    set_log_level(LogLevel.DEBUG)
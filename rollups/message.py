@@ -1,6 +1,12 @@
 import json
+import logging
 import os
 import requests
+from requests.adapters import HTTPAdapter
+
+from rollups import profile
+
+logger = logging.getLogger(__name__)
 
 class MessageException(Exception):
     """Custom exception for handling messaging related errors."""
@@ -65,9 +71,67 @@ rollup_server = os.getenv("ROLLUP_HTTP_SERVER_URL")
 if not rollup_server:
     raise MessageException("ROLLUP_HTTP_SERVER_URL environment variable is not set.")
 
+# Connection pool settings for the rollup server client. They can be tuned
+# through environment variables; timeouts are given in seconds and an empty
+# read timeout means waiting forever (the /finish call may block until an
+# input is available).
+pool_size = int(os.getenv("ROLLUP_HTTP_POOL_SIZE", "4"))
+connect_timeout = float(os.getenv("ROLLUP_HTTP_CONNECT_TIMEOUT", "5"))
+read_timeout = os.getenv("ROLLUP_HTTP_READ_TIMEOUT", "")
+read_timeout = float(read_timeout) if read_timeout else None
+
+_session = None
+
+def configure_session(size=None, connect=None, read=None):
+    """Configure the pooled HTTP session used to talk to the rollup server.
+
+    Any previously created session is closed, so the next request opens a
+    new pool with the given settings. Arguments left as None keep their
+    current value.
+
+    Args:
+        size (int): Maximum number of keep-alive connections kept in the pool.
+        connect (float): Connection timeout in seconds.
+        read (float): Read timeout in seconds, or 0 to wait forever.
+    """
+    global pool_size, connect_timeout, read_timeout
+    if size is not None:
+        pool_size = size
+    if connect is not None:
+        connect_timeout = connect
+    if read is not None:
+        read_timeout = read or None
+    close_session()
+
+def get_session() -> requests.Session:
+    """Return the shared keep-alive session, creating it on first use.
+
+    Returns:
+        requests.Session: The pooled session bound to the rollup server.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({"Content-Type": "application/json; charset=UTF-8"})
+        _session = session
+    return _session
+
+def close_session():
+    """Close the shared session and release its pooled connections."""
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
 def send_post(endpoint: str, json_data: dict) -> requests.Response:
     """Send a POST request to the specified endpoint with JSON data.
 
+    The request goes through the shared pooled session, so consecutive calls
+    reuse the same keep-alive connection to the rollup server.
+
     Args:
         endpoint (str): The endpoint to send the POST request to.
         json_data (dict): The JSON data to send in the request.
@@ -80,8 +144,10 @@ def send_post(endpoint: str, json_data: dict) -> requests.Response:
     """
     try:
         url = f"{rollup_server}/{endpoint}"
-        headers = {"Content-Type": "application/json; charset=UTF-8"}
-        response = requests.post(url, data=json.dumps(json_data), headers=headers)
+        body = json.dumps(json_data)
+        with profile.stage("http." + endpoint, len(body)) as timing:
+            response = get_session().post(url, data=body, timeout=(connect_timeout, read_timeout))
+            timing.bytes_out = len(response.content)
         response.raise_for_status()
         return response
     except requests.exceptions.RequestException as req_err:
@@ -106,7 +172,7 @@ def send_finish(finish):
     try:
         return send_post("finish", finish.__dict__)
     except MessageException as e:
-        print(f"Error sending finish: {e}")
+        logger.error("Error sending finish: %s", e)
         return None
 
 def send_report(report):
@@ -121,7 +187,7 @@ def send_report(report):
     try:
         return send_post("report", report.__dict__)
     except MessageException as e:
-        print(f"Error sending report: {e}")
+        logger.error("Error sending report: %s", e)
         return None
 
 def send_notice(notice):
@@ -136,7 +202,7 @@ def send_notice(notice):
     try:
         return send_post("notice", notice.__dict__)
     except MessageException as e:
-        print(f"Error sending notice: {e}")
+        logger.error("Error sending notice: %s", e)
         return None
 
 def send_voucher(voucher):
@@ -151,7 +217,7 @@ def send_voucher(voucher):
     try:
         return send_post("voucher", voucher.__dict__)
     except MessageException as e:
-        print(f"Error sending voucher: {e}")
+        logger.error("Error sending voucher: %s", e)
         return None
 
 def send_exception(exception):
@@ -166,5 +232,76 @@ def send_exception(exception):
     try:
         return send_post("exception", exception.__dict__)
     except MessageException as e:
-        print(f"Error sending Cartesi exception: {e}")
+        logger.error("Error sending Cartesi exception: %s", e)
         return None
+
+class OutputBuffer:
+    """Collects the outputs produced while handling one input.
+
+    Notices, vouchers and reports are queued in the order they are added and
+    sent to the rollup server when the buffer is flushed, reusing the pooled
+    keep-alive connection. Used as a context manager, the buffer is flushed
+    when the block ends and discarded if the block raises, so a rejected
+    input does not emit partial outputs.
+    """
+
+    _endpoints = {Notice: "notice", Voucher: "voucher", Report: "report"}
+
+    def __init__(self):
+        self.outputs = []
+        self.indexes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.outputs.clear()
+        return False
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def add(self, output):
+        """Queue a Notice, Voucher or Report to be sent on flush."""
+        if type(output) not in self._endpoints:
+            raise MessageException(f"Unsupported output type: {type(output).__name__}")
+        self.outputs.append(output)
+        return output
+
+    def add_notice(self, payload):
+        return self.add(Notice(payload))
+
+    def add_voucher(self, destination, payload):
+        return self.add(Voucher(destination, payload))
+
+    def add_report(self, payload):
+        return self.add(Report(payload))
+
+    def flush(self):
+        """Send the queued outputs in order.
+
+        Returns:
+            list: One entry per output sent, an IndexResponse for notices and
+            vouchers and None for reports.
+
+        Raises:
+            MessageException: If an output could not be sent. Outputs queued
+            after the failing one are kept in the buffer.
+        """
+        indexes = []
+        sent = 0
+        try:
+            for output in self.outputs:
+                response = send_post(self._endpoints[type(output)], output.__dict__)
+                if isinstance(output, Report):
+                    indexes.append(None)
+                else:
+                    indexes.append(IndexResponse(response.json()["index"]))
+                sent += 1
+        finally:
+            del self.outputs[:sent]
+            self.indexes.extend(indexes)
+        return indexes
@@ -0,0 +1,145 @@
+import json
+import os
+from json.encoder import encode_basestring_ascii
+
+# Largest report payload sent, in bytes before hex encoding. Larger
+# documents are split over several reports.
+report_page_size = int(os.getenv("DAPP_REPORT_PAGE_SIZE", str(1024 * 1024)))
+
+# Characters of JSON text joined before each write to the page buffer.
+_write_size = 16 * 1024
+
+_constants = {None: "null", True: "true", False: "false"}
+
+def _key(key):
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    if key is None or key is True or key is False:
+        return '"' + _constants[key] + '"'
+    if isinstance(key, (int, float)):
+        return '"' + json.dumps(key) + '"'
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+def iter_json(value):
+    """Yields the JSON text of `value` in fragments, like json.dumps would write it.
+
+    Objects with a `__json__` method (the model classes) are written with
+    the JSON text it returns. Bytes are written as "0x"-prefixed hex
+    strings, and any other iterable, e.g. a generator, as an array, so
+    large collections never have to be built as one list or string.
+    """
+    if isinstance(value, str):
+        yield encode_basestring_ascii(value)
+    elif value is None or value is True or value is False:
+        yield _constants[value]
+    elif isinstance(value, (int, float)):
+        yield json.dumps(value)
+    elif hasattr(type(value), "__json__"):
+        yield value.__json__()
+    elif isinstance(value, dict):
+        if not value:
+            yield "{}"
+            return
+        separator = "{"
+        for key, item in value.items():
+            yield separator + _key(key) + ": "
+            yield from iter_json(item)
+            separator = ", "
+        yield "}"
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        yield '"0x' + value.hex() + '"'
+    else:
+        try:
+            items = iter(value)
+        except TypeError:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable") from None
+        separator = "["
+        for item in items:
+            # Collections are usually lists of model objects, which are
+            # written without going through a nested generator.
+            if hasattr(type(item), "__json__"):
+                yield separator + item.__json__()
+            else:
+                yield separator
+                yield from iter_json(item)
+            separator = ", "
+        yield "[]" if separator == "[" else "]"
+
+class ReportPager:
+    """Splits text written to it into hex payloads of at most `page_size` bytes.
+
+    Written text is UTF-8 encoded into one reused page buffer; every time
+    the buffer fills up its hex form is passed to `send`, and close() sends
+    what is left. Pages are cut at byte boundaries, so a reader gets the
+    document back by concatenating the decoded payloads in order. Used as a
+    context manager, the last page is only sent if the block succeeds.
+    """
+
+    def __init__(self, send, page_size=None):
+        self.send = send
+        self.page_size = page_size or report_page_size
+        self.pages = 0
+        self.size = 0
+        self._buffer = bytearray(self.page_size)
+        self._view = memoryview(self._buffer)
+        self._position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        return False
+
+    def write(self, text):
+        data = text.encode() if isinstance(text, str) else text
+        length = len(data)
+        position = self._position
+        if position + length < self.page_size:
+            self._buffer[position:position + length] = data
+            self._position = position + length
+            self.size += length
+            return
+        data = memoryview(data)
+        offset = 0
+        while offset < length:
+            count = min(self.page_size - self._position, length - offset)
+            self._buffer[self._position:self._position + count] = data[offset:offset + count]
+            self._position += count
+            offset += count
+            if self._position == self.page_size:
+                self._send_page()
+        self.size += length
+
+    def _send_page(self):
+        page = "0x" + self._view[:self._position].hex()
+        self._position = 0
+        self.pages += 1
+        self.send(page)
+
+    def close(self):
+        """Sends the last partial page, if any."""
+        if self._position:
+            self._send_page()
+
+def send_json(value, send, page_size=None):
+    """Encodes `value` with iter_json and sends it as paged hex payloads.
+
+    Returns:
+        int: The number of pages sent.
+    """
+    with ReportPager(send, page_size) as pager:
+        # Fragments are mostly a few bytes long, so they are joined into
+        # larger pieces before being encoded into the page buffer.
+        pending = []
+        pending_size = 0
+        for fragment in iter_json(value):
+            pending.append(fragment)
+            pending_size += len(fragment)
+            if pending_size >= _write_size:
+                pager.write("".join(pending))
+                pending.clear()
+                pending_size = 0
+        pager.write("".join(pending))
+    return pager.pages
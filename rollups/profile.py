@@ -0,0 +1,238 @@
+import atexit
+import json
+import os
+from time import perf_counter
+import tracemalloc
+
+# Profiling is off unless DAPP_PROFILE is set. Allocation sampling is a
+# separate opt-in because tracemalloc slows down every allocation while it
+# is tracing: DAPP_PROFILE_ALLOC_EVERY=N traces one call out of N per stage.
+enabled = os.getenv("DAPP_PROFILE", "") not in ("", "0")
+alloc_every = int(os.getenv("DAPP_PROFILE_ALLOC_EVERY", "0"))
+# Every call is counted but, to keep the overhead low on stages that take a
+# few microseconds, only one call out of N is timed. By default N is picked
+# per stage so timing costs about 1% of the stage's time; DAPP_PROFILE_SAMPLE
+# fixes it for all stages instead (1 times every call).
+sample_every = int(os.getenv("DAPP_PROFILE_SAMPLE", "0"))
+MAX_SAMPLE_EVERY = 64
+_timer_cost = 1e-6  # Rough cost of timing one call, in seconds
+
+# Latencies go into power-of-two microsecond buckets: bucket i holds the
+# calls that took less than 2**i us (the last one holds everything slower).
+BUCKETS = 25
+
+_stats = {}
+
+class StageStats:
+    __slots__ = ("calls", "every", "timed", "total", "max", "buckets", "bytes_in", "bytes_out", "alloc_samples", "alloc_bytes", "alloc_peak")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.every = sample_every or 1
+        self.timed = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.alloc_samples = 0
+        self.alloc_bytes = 0
+        self.alloc_peak = 0
+
+    def add(self, elapsed):
+        self.timed += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[min(int(elapsed * 1e6).bit_length(), BUCKETS - 1)] += 1
+        if not self.timed & 255 and not sample_every:
+            mean = self.total / self.timed
+            self.every = min(MAX_SAMPLE_EVERY, int(_timer_cost / (0.01 * mean)) + 1) if mean else MAX_SAMPLE_EVERY
+
+    def percentile(self, q):
+        """Upper bound, in seconds, of the bucket holding the q-th percentile."""
+        rank = q * self.timed
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << index) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        mean = self.total / self.timed if self.timed else 0.0
+        return {
+            "calls": self.calls,
+            "timed_calls": self.timed,
+            "total_s": mean * self.calls,
+            "mean_us": mean * 1e6,
+            "p50_us": self.percentile(0.5) * 1e6,
+            "p99_us": self.percentile(0.99) * 1e6,
+            "max_us": self.max * 1e6,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "alloc_samples": self.alloc_samples,
+            "alloc_bytes_mean": self.alloc_bytes / self.alloc_samples if self.alloc_samples else 0,
+            "alloc_peak_max": self.alloc_peak,
+            "histogram_us": {str(1 << index): count for index, count in enumerate(self.buckets) if count},
+        }
+
+def get_stats(name):
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = StageStats()
+    return stats
+
+def record(name, elapsed, bytes_in=0, bytes_out=0):
+    """Adds one timed call of `elapsed` seconds to the stage `name`."""
+    stats = get_stats(name)
+    stats.calls += 1
+    stats.add(elapsed)
+    stats.bytes_in += bytes_in
+    stats.bytes_out += bytes_out
+
+def _alloc_start():
+    # Nested sampled stages reset the peak of the outer one, so its peak is
+    # only a lower bound.
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+def _alloc_end(stats, start):
+    current, peak = tracemalloc.get_traced_memory()
+    stats.alloc_samples += 1
+    stats.alloc_bytes += current - start
+    if peak - start > stats.alloc_peak:
+        stats.alloc_peak = peak - start
+
+class _Stage:
+    __slots__ = ("stats", "bytes_out", "start", "alloc_start")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.bytes_out = 0
+        self.start = None
+        self.alloc_start = None
+
+    def __enter__(self):
+        stats = self.stats
+        calls = stats.calls
+        stats.calls = calls + 1
+        if alloc_every and calls % alloc_every == 0 and tracemalloc.is_tracing():
+            self.alloc_start = _alloc_start()
+        elif calls % stats.every:
+            return self
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stats = self.stats
+        if self.start is not None:
+            stats.add(perf_counter() - self.start)
+        stats.bytes_out += self.bytes_out
+        if self.alloc_start is not None:
+            _alloc_end(stats, self.alloc_start)
+        return False
+
+class _NullStage:
+    """Stand-in returned while profiling is off; it ignores everything."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_null_stage = _NullStage()
+
+def stage(name, bytes_in=0):
+    """Context manager timing the block as one call of stage `name`.
+
+    `bytes_in` is the size of the data the stage consumes; the size of what
+    it produces can be reported by setting `bytes_out` on the returned
+    object inside the block.
+    """
+    if not enabled:
+        return _null_stage
+    stats = get_stats(name)
+    stats.bytes_in += bytes_in
+    return _Stage(stats)
+
+def timed(name):
+    """Decorator timing the calls of the function as stage `name`."""
+    stats = get_stats(name)
+
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            calls = stats.calls
+            stats.calls = calls + 1
+            alloc_start = None
+            if alloc_every and calls % alloc_every == 0 and tracemalloc.is_tracing():
+                alloc_start = _alloc_start()
+            elif calls % stats.every:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.add(perf_counter() - start)
+                if alloc_start is not None:
+                    _alloc_end(stats, alloc_start)
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+def enable(allocations=None):
+    """Turns profiling on.
+
+    Args:
+        allocations (int): Sample the allocations of one call out of this
+            many per stage, starting tracemalloc if needed. 0 disables
+            allocation sampling, None keeps the current setting.
+    """
+    global enabled, alloc_every
+    enabled = True
+    if allocations is not None:
+        alloc_every = allocations
+    if alloc_every and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    global enabled
+    enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def reset():
+    # Stats objects are held by the timed functions, so they are cleared in
+    # place.
+    for stats in _stats.values():
+        stats.reset()
+
+def snapshot():
+    return {name: stats.to_dict() for name, stats in sorted(_stats.items()) if stats.calls}
+
+def dump_json():
+    return json.dumps({"enabled": enabled, "stages": snapshot()})
+
+def dump(path):
+    with open(path, "w") as f:
+        f.write(dump_json())
+
+if enabled and alloc_every:
+    tracemalloc.start()
+
+# DAPP_PROFILE_DUMP names a file the profile is written to when the DApp exits.
+_dump_path = os.getenv("DAPP_PROFILE_DUMP")
+if _dump_path:
+    atexit.register(lambda: dump(_dump_path))
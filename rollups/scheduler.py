@@ -0,0 +1,113 @@
+import logging
+import os
+import random
+import time
+
+from rollups import profile
+from rollups.message import send_post
+
+logger = logging.getLogger(__name__)
+
+class Backoff:
+    """Exponential backoff with jitter for idle /finish polls.
+
+    The first idle poll waits `initial` seconds and every following one
+    multiplies the delay by `factor`, up to `maximum`. A random fraction of
+    the delay, up to `jitter`, is subtracted so several machines don't poll
+    in lockstep. `reset()` goes back to the initial delay.
+
+    An input that arrives while the loop sleeps waits for the rest of the
+    delay, so `maximum` bounds the latency added to the first input after
+    an idle period, while a larger value means fewer /finish requests on an
+    idle node (about 1/maximum per second). The default keeps that latency
+    under 100ms.
+    """
+
+    def __init__(self, initial=0.01, maximum=0.1, factor=2.0, jitter=0.5):
+        if initial < 0 or maximum < initial:
+            raise ValueError("Backoff: invalid delay bounds")
+        if factor < 1 or not 0 <= jitter <= 1:
+            raise ValueError("Backoff: invalid factor or jitter")
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.current = initial
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            initial=float(os.getenv("ROLLUP_IDLE_BACKOFF_INITIAL", "0.01")),
+            maximum=float(os.getenv("ROLLUP_IDLE_BACKOFF_MAX", "0.1")),
+            factor=float(os.getenv("ROLLUP_IDLE_BACKOFF_FACTOR", "2.0")),
+            jitter=float(os.getenv("ROLLUP_IDLE_BACKOFF_JITTER", "0.5")),
+        )
+
+    def next_delay(self):
+        delay = self.current
+        self.current = min(self.current * self.factor, self.maximum)
+        if self.jitter:
+            delay -= delay * self.jitter * random.random()
+        return delay
+
+    def reset(self):
+        self.current = self.initial
+
+
+class RequestLoop:
+    """Drives the /finish request loop and dispatches inputs to handlers.
+
+    `handlers` maps a request type ("advance_state", "inspect_state") to a
+    callable receiving the request data and returning the next finish
+    status. When the server has no pending input (HTTP 202) the loop sleeps
+    according to `backoff`, which is reset as soon as an input arrives so
+    the next idle period starts from the shortest delay again.
+    """
+
+    def __init__(self, handlers, backoff=None, sleep=time.sleep):
+        self.handlers = handlers
+        self.backoff = backoff if backoff is not None else Backoff.from_env()
+        self.sleep = sleep
+        self.finish = {"status": "accept"}
+        self.idle_polls = 0
+        self.processed_inputs = 0
+        self.processed_by_type = {}
+
+    def stats(self):
+        return {
+            "idlePolls": self.idle_polls,
+            "processedInputs": self.processed_inputs,
+            "processedByType": dict(self.processed_by_type),
+        }
+
+    def poll(self):
+        """Send one finish request and handle the input it returns, if any.
+
+        Returns:
+            bool: True if an input was processed, False on an idle poll.
+        """
+        response = send_post("finish", self.finish)
+        logger.debug("Received finish status %d", response.status_code)
+        if response.status_code == 202:
+            self.idle_polls += 1
+            delay = self.backoff.next_delay()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("No pending rollup request, retrying in %.3fs", delay)
+            if delay > 0:
+                self.sleep(delay)
+            return False
+
+        self.backoff.reset()
+        rollup_request = response.json()
+        request_type = rollup_request["request_type"]
+        handler = self.handlers[request_type]
+        with profile.stage("request." + request_type):
+            self.finish["status"] = handler(rollup_request["data"])
+        self.processed_inputs += 1
+        self.processed_by_type[request_type] = self.processed_by_type.get(request_type, 0) + 1
+        return True
+
+    def run(self, max_inputs=None):
+        """Poll forever, or until `max_inputs` inputs have been processed."""
+        while max_inputs is None or self.processed_inputs < max_inputs:
+            self.poll()
@@ -1,5 +1,9 @@
 # util.py
 import binascii
+import sys
+from array import array
+
+from rollups import profile
 
 def hex2bin(hx):
     """
@@ -18,12 +22,36 @@ def bin2hex(bin_data):
     """
     return "0x" + binascii.hexlify(bin_data).decode()
 
+# The payload of the input being handled is usually decoded several times
+# (routing, ABI decoding, logging), so the last decoded payload is cached.
+_cached_hex = None
+_cached_bin = None
+
+def payload_bytes(hx):
+    """
+    Converts a payload hex string to bytes, reusing the previous result when
+    the same payload is decoded again.
+    """
+    global _cached_hex, _cached_bin
+    if hx is not _cached_hex and hx != _cached_hex:
+        with profile.stage("hex_decode", len(hx)):
+            _cached_bin = hex2bin(hx)
+        _cached_hex = hx
+    return _cached_bin
+
+def decode_payload(hx):
+    """
+    Converts a payload hex string to a read-only memoryview, without copying
+    the cached decoded bytes.
+    """
+    return memoryview(payload_bytes(hx))
+
 def hex2str(hx):
     """
     Converts a hex string to a string (assuming UTF-8 encoding).
     """
     try:
-        bin_data = hex2bin(hx)
+        bin_data = payload_bytes(hx)
         return bin_data.decode('utf-8')
     except ValueError as e:
         raise ValueError("Invalid hex string") from e
@@ -58,3 +86,117 @@ def pad_bytes_right(bin_data, size):
     Pads binary data to the specified size, padding on the right.
     """
     return bin_data.ljust(size, b'\x00')
+
+def addresses2hex(bin_data, offset=0, count=1, stride=20):
+    """
+    Converts `count` 20-byte addresses found every `stride` bytes from
+    `offset` to '0x' prefixed hex strings, hex-encoding the region once.
+    """
+    end = offset + stride * (count - 1) + 20
+    if count < 0 or end > len(bin_data):
+        raise ValueError("Address region out of bounds")
+    hx = binascii.hexlify(memoryview(bin_data)[offset:end]).decode()
+    return ["0x" + hx[2*i:2*i+40] for i in range(0, stride * count, stride)]
+
+def words2ints(bin_data, offset=0, count=None):
+    """
+    Converts consecutive 32-byte big-endian words to ints.
+    """
+    if count is None:
+        count = (len(bin_data) - offset) // 32
+    end = offset + 32 * count
+    if count < 0 or end > len(bin_data):
+        raise ValueError("Word region out of bounds")
+    if isinstance(bin_data, memoryview):
+        # Slicing bytes is cheaper than creating memoryview slices.
+        bin_data = bin_data[offset:end].tobytes()
+        offset, end = 0, 32 * count
+    from_bytes = int.from_bytes
+    return [from_bytes(bin_data[o:o+32], 'big') for o in range(offset, end, 32)]
+
+def ints2words(values):
+    """
+    Converts ints to consecutive 32-byte big-endian words.
+    """
+    return b"".join([value.to_bytes(32, 'big') for value in values])
+
+class Uint256Column:
+    """
+    Column of uint256 values kept as contiguous 32-byte big-endian words.
+
+    Values are only converted when asked for. When every value fits in 64
+    bits they are read into an array('Q') in one pass, which sums and
+    iterates without building a big int per element.
+    """
+
+    __slots__ = ("words", "_uint64")
+
+    def __init__(self, words):
+        if len(words) % 32:
+            raise ValueError("Word buffer size is not a multiple of 32")
+        self.words = bytes(words)
+        self._uint64 = None
+
+    def __len__(self):
+        return len(self.words) // 32
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Uint256Column index out of range")
+        return int.from_bytes(self.words[32*index:32*index+32], 'big')
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def uint64(self):
+        """
+        Returns the values as an array('Q'), or None if any of them does not
+        fit in 64 bits.
+        """
+        if self._uint64 is None:
+            quads = array('Q', self.words)
+            if sys.byteorder == 'little':
+                quads.byteswap()
+            # Every word is 4 quads, the first 3 must be zero.
+            high = quads[0::4]
+            high.extend(quads[1::4])
+            high.extend(quads[2::4])
+            if high.tobytes() != bytes(8 * len(high)):
+                self._uint64 = False
+            else:
+                self._uint64 = quads[3::4]
+        return self._uint64 or None
+
+    def tolist(self):
+        values = self.uint64()
+        if values is not None:
+            return values.tolist()
+        return words2ints(self.words)
+
+    def sum(self):
+        values = self.uint64()
+        return sum(values if values is not None else words2ints(self.words))
+
+def group_sums(keys, values):
+    """
+    Sums `values` per key, for two Uint256Columns of the same length.
+    Returns a dict from key to total.
+    """
+    if len(keys) != len(values):
+        raise ValueError("Columns have different lengths")
+    key_values = keys.uint64()
+    if key_values is None:
+        key_values = keys.tolist()
+    value_values = values.uint64()
+    if value_values is None:
+        value_values = values.tolist()
+    # Batches rarely repeat an id, in which case the dict is built in C.
+    totals = dict(zip(key_values, value_values))
+    if len(totals) == len(key_values):
+        return totals
+    totals = dict.fromkeys(totals, 0)
+    for key, value in zip(key_values, value_values):
+        totals[key] += value
+    return totals
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# rollups.message refuses to load without a server URL; tests that talk to
+# a server start a stub and point the module at it.
+os.environ.setdefault("ROLLUP_HTTP_SERVER_URL", "http://tests.invalid")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,188 @@
+import json
+import random
+
+import pytest
+from replay.stub import RollupStub, StubAdapter
+from rollups import asset, message
+
+SENDER = "0x" + "da" * 20
+RECEIVER = "0x" + "11" * 20
+TOKEN = "0x" + "22" * 20
+
+# Expected payloads, one ABI word per line.
+ZERO_12 = "00" * 12
+
+def test_ether_withdrawal_voucher():
+    voucher = asset.ether_withdrawal_voucher(SENDER, RECEIVER, 10**18)
+    assert voucher == {
+        "destination": SENDER,
+        "payload": "0x522f6815"
+            + ZERO_12 + "11" * 20
+            + "0000000000000000000000000000000000000000000000000de0b6b3a7640000",
+    }
+
+def test_erc20_transfer_voucher():
+    voucher = asset.erc20_transfer_voucher(RECEIVER, TOKEN, 255)
+    assert voucher == {
+        "destination": TOKEN,
+        "payload": "0xa9059cbb"
+            + ZERO_12 + "11" * 20
+            + "00000000000000000000000000000000000000000000000000000000000000ff",
+    }
+
+def test_erc721_safe_transfer_voucher():
+    voucher = asset.erc721_safe_transfer_voucher(SENDER, RECEIVER, TOKEN, 2**256 - 1)
+    assert voucher == {
+        "destination": TOKEN,
+        "payload": "0x42842e0e"
+            + ZERO_12 + "da" * 20
+            + ZERO_12 + "11" * 20
+            + "ff" * 32,
+    }
+
+def test_erc1155_safe_transfer_from_voucher():
+    voucher = asset.erc1155_safe_transfer_from_voucher(SENDER, RECEIVER, TOKEN, 7, 3, b"\xab" * 33)
+    assert voucher == {
+        "destination": TOKEN,
+        "payload": "0xf242432a"
+            + ZERO_12 + "da" * 20
+            + ZERO_12 + "11" * 20
+            + "0000000000000000000000000000000000000000000000000000000000000007"
+            + "0000000000000000000000000000000000000000000000000000000000000003"
+            + "00000000000000000000000000000000000000000000000000000000000000a0"
+            + "0000000000000000000000000000000000000000000000000000000000000021"
+            + "ab" * 32
+            + "ab" + "00" * 31,
+    }
+
+def test_erc1155_safe_batch_transfer_from_voucher():
+    voucher = asset.erc1155_safe_batch_transfer_from_voucher(SENDER, RECEIVER, TOKEN, [1, 2], [10, 20], b"\x01\x02")
+    assert voucher == {
+        "destination": TOKEN,
+        "payload": "0x2eb2c2d6"
+            + ZERO_12 + "da" * 20
+            + ZERO_12 + "11" * 20
+            + "00000000000000000000000000000000000000000000000000000000000000a0"
+            + "0000000000000000000000000000000000000000000000000000000000000100"
+            + "0000000000000000000000000000000000000000000000000000000000000160"
+            + "0000000000000000000000000000000000000000000000000000000000000002"
+            + "0000000000000000000000000000000000000000000000000000000000000001"
+            + "0000000000000000000000000000000000000000000000000000000000000002"
+            + "0000000000000000000000000000000000000000000000000000000000000002"
+            + "000000000000000000000000000000000000000000000000000000000000000a"
+            + "0000000000000000000000000000000000000000000000000000000000000014"
+            + "0000000000000000000000000000000000000000000000000000000000000002"
+            + "0102" + "00" * 30,
+    }
+
+def test_empty_batch_voucher():
+    voucher = asset.erc1155_safe_batch_transfer_from_voucher(SENDER, RECEIVER, TOKEN, [], [], b"")
+    assert voucher["payload"] == ("0x2eb2c2d6"
+        + ZERO_12 + "da" * 20
+        + ZERO_12 + "11" * 20
+        + "00000000000000000000000000000000000000000000000000000000000000a0"
+        + "00000000000000000000000000000000000000000000000000000000000000c0"
+        + "00000000000000000000000000000000000000000000000000000000000000e0"
+        + "00" * 32 * 3)
+
+def reference_batch_payload(sender, receiver, token_ids, amounts, data):
+    # The word-by-word encoding the builders used before _AbiWriter, with
+    # the selector prefix and the right padding of `data` fixed.
+    def word(value):
+        return value.to_bytes(32, byteorder="big")
+    ids_position = 160
+    amounts_position = ids_position + 32 + len(token_ids) * 32
+    data_position = amounts_position + 32 + len(amounts) * 32
+    payload = bytes.fromhex(sender[2:]).rjust(32, b"\0") + bytes.fromhex(receiver[2:]).rjust(32, b"\0")
+    payload += word(ids_position) + word(amounts_position) + word(data_position)
+    payload += word(len(token_ids))
+    for token_id in token_ids:
+        payload += word(token_id)
+    payload += word(len(amounts))
+    for amount in amounts:
+        payload += word(amount)
+    payload += word(len(data)) + data + b"\0" * (-len(data) % 32)
+    return "0x2eb2c2d6" + payload.hex()
+
+@pytest.mark.parametrize("count", [0, 1, 100])
+@pytest.mark.parametrize("data_size", [0, 31, 64, 65])
+def test_batch_voucher_matches_reference(count, data_size):
+    rng = random.Random(count * 100 + data_size)
+    token_ids = [rng.randrange(2**256) for _ in range(count)]
+    amounts = [rng.randrange(2**64) for _ in range(count)]
+    data = rng.randbytes(data_size)
+    voucher = asset.erc1155_safe_batch_transfer_from_voucher(SENDER, RECEIVER, TOKEN, token_ids, amounts, data)
+    assert voucher["payload"] == reference_batch_payload(SENDER, RECEIVER, token_ids, amounts, data)
+
+def test_ether_deposit():
+    deposit = asset.decode_ether_deposit("0x" + "33" * 20 + "00" * 31 + "05" + "beef")
+    assert (deposit.depositor, deposit.amount, deposit.data) == ("0x" + "33" * 20, 5, b"\xbe\xef")
+
+def test_erc20_deposit():
+    deposit = asset.decode_erc20_deposit("0x01" + "22" * 20 + "33" * 20 + "00" * 30 + "0100")
+    assert (deposit.depositor, deposit.token_address, deposit.amount, deposit.data) == ("0x" + "33" * 20, TOKEN, 256, b"")
+
+def test_erc721_deposit():
+    deposit = asset.decode_erc721_deposit("0x" + "22" * 20 + "33" * 20 + "00" * 31 + "09" + "ff")
+    assert (deposit.depositor, deposit.token_address, deposit.token_id, deposit.data) == ("0x" + "33" * 20, TOKEN, 9, b"\xff")
+
+def test_erc1155_single_deposit():
+    deposit = asset.decode_erc1155_single_deposit(
+        "0x" + "22" * 20 + "33" * 20
+        + "00" * 31 + "04"
+        + "00" * 31 + "06"
+        + "0000000000000000000000000000000000000000000000000000000000000040"
+        + "0000000000000000000000000000000000000000000000000000000000000060"
+        + "0000000000000000000000000000000000000000000000000000000000000000"
+        + "0000000000000000000000000000000000000000000000000000000000000001"
+        + "aa" + "00" * 31)
+    assert (deposit.depositor, deposit.token_address, deposit.token_id, deposit.amount) == ("0x" + "33" * 20, TOKEN, 4, 6)
+    assert (deposit.base_layer_data, deposit.exec_layer_data) == (b"", b"\xaa")
+
+def test_erc1155_batch_deposit():
+    payload = ("0x" + "22" * 20 + "33" * 20
+        + "0000000000000000000000000000000000000000000000000000000000000080"
+        + "00000000000000000000000000000000000000000000000000000000000000e0"
+        + "0000000000000000000000000000000000000000000000000000000000000140"
+        + "0000000000000000000000000000000000000000000000000000000000000160"
+        + "0000000000000000000000000000000000000000000000000000000000000002"
+        + "0000000000000000000000000000000000000000000000000000000000000001"
+        + "0000000000000000000000000000000000000000000000000000000000000002"
+        + "0000000000000000000000000000000000000000000000000000000000000002"
+        + "000000000000000000000000000000000000000000000000000000000000000a"
+        + "0000000000000000000000000000000000000000000000000000000000000014"
+        + "0000000000000000000000000000000000000000000000000000000000000000"
+        + "0000000000000000000000000000000000000000000000000000000000000002"
+        + "bbcc" + "00" * 30)
+    deposit = asset.decode_erc1155_batch_deposit(payload)
+    assert (deposit.depositor, deposit.token_address) == ("0x" + "33" * 20, TOKEN)
+    assert (list(deposit.token_ids), list(deposit.amounts)) == ([1, 2], [10, 20])
+    assert (deposit.base_layer_data, deposit.exec_layer_data) == (b"", b"\xbb\xcc")
+    columns = asset.decode_erc1155_batch_deposit_columns(payload)
+    assert (columns.token_ids.tolist(), columns.amounts.tolist()) == ([1, 2], [10, 20])
+
+def test_output_request_bodies():
+    bodies = []
+
+    class Recorder(StubAdapter):
+        def send(self, request, **kwargs):
+            bodies.append((request.path_url, request.body))
+            return super().send(request, **kwargs)
+
+    previous_url = message.rollup_server
+    message.close_session()
+    message.rollup_server = "http://stub.invalid"
+    message.get_session().mount("http://", Recorder(RollupStub([])))
+    try:
+        with message.OutputBuffer() as outputs:
+            outputs.add_notice("0x7b7d")
+            outputs.add_voucher(TOKEN, "0xa9059cbb")
+            outputs.add_report("0x00")
+    finally:
+        message.close_session()
+        message.rollup_server = previous_url
+    assert [(path, json.loads(body)) for path, body in bodies] == [
+        ("/notice", {"payload": "0x7b7d"}),
+        ("/voucher", {"destination": TOKEN, "payload": "0xa9059cbb"}),
+        ("/report", {"payload": "0x00"}),
+    ]
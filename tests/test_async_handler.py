@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+import pytest
+
+from handler.async_handler import AsyncHandler, AsyncRollupClient
+from rollups.scheduler import Backoff
+from replay.stub import RollupStub
+from replay.workload import Inputs
+from rollups.util import str2hex
+
+SENDER = "0x" + "11" * 20
+
+class StubHttpServer:
+    """asyncio HTTP/1.1 server answering from a RollupStub.
+
+    After every `close_every` responses the connection is closed, either
+    announced with "Connection: close" or silently between two responses.
+    """
+
+    def __init__(self, stub, close_every=None, announce=True):
+        self.stub = stub
+        self.close_every = close_every
+        self.announce = announce
+        self.connections = 0
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.url = "http://127.0.0.1:%d" % self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        served = 0
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = json.loads(await reader.readexactly(int(headers["content-length"])))
+                endpoint = request_line.split()[1].decode().rsplit("/", 1)[-1]
+                status, response = self.stub.post(endpoint, body)
+                data = json.dumps(response).encode() if response is not None else b""
+                served += 1
+                closing = self.close_every is not None and served % self.close_every == 0
+                head = f"HTTP/1.1 {status} OK\r\nContent-Length: {len(data)}\r\n"
+                if closing and self.announce:
+                    head += "Connection: close\r\n"
+                writer.write(head.encode() + b"\r\n" + data)
+                await writer.drain()
+                if closing:
+                    return
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def advance_inputs(count):
+    inputs = Inputs()
+    return [inputs.advance(SENDER, str2hex(json.dumps({"n": n}))) for n in range(count)]
+
+def echo_handler(client):
+    handler = AsyncHandler(client=client, backoff=Backoff(0, 0))
+
+    def echo(metadata, payload):
+        handler.send_notice(str2hex(json.dumps(payload)))
+        handler.send_report(str2hex("done"))
+
+    handler.advance_handler.add_sender_route(SENDER, echo)
+    return handler
+
+async def replay(close_every=None, announce=True, count=20):
+    stub = RollupStub(advance_inputs(count))
+    async with StubHttpServer(stub, close_every, announce) as server:
+        handler = echo_handler(AsyncRollupClient(server.url))
+        await handler.run_async(count)
+        connections = server.connections
+        # Report the status of the last input.
+        await handler.client.post("finish", {"status": "accept"})
+        await handler.client.close()
+    return stub, connections
+
+def check_outputs(stub, count):
+    notices = [output for output in stub.outputs if output["type"] == "notice"]
+    assert [output["input"] for output in notices] == list(range(count))
+    assert stub.statuses == ["accept"] * count
+
+def test_keep_alive():
+    stub, connections = asyncio.run(replay())
+    check_outputs(stub, 20)
+    assert connections == 1
+
+@pytest.mark.parametrize("close_every", [1, 2, 5])
+def test_reconnects_after_connection_close(close_every):
+    stub, connections = asyncio.run(replay(close_every, announce=True))
+    check_outputs(stub, 20)
+    assert connections > 1
+
+def test_reconnects_after_idle_close():
+    # The server drops the connection after each /finish round trip that
+    # left nothing in flight, like a keep-alive timeout.
+    stub, connections = asyncio.run(replay(close_every=3, announce=False))
+    check_outputs(stub, 20)
+    assert connections > 1
+
+def test_connection_refused_fails_requests():
+    async def main():
+        server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        client = AsyncRollupClient(f"http://127.0.0.1:{port}")
+        with pytest.raises(Exception):
+            await client.post("finish", {"status": "accept"})
+    asyncio.run(main())
+
+def test_outputs_do_not_leak_into_next_input():
+    async def main():
+        stub = RollupStub(advance_inputs(2))
+        async with StubHttpServer(stub) as server:
+            handler = AsyncHandler(client=AsyncRollupClient(server.url), backoff=Backoff(0, 0))
+            leftovers = []
+
+            def failing(metadata, payload):
+                leftovers.append(len(handler._outputs))
+                handler.send_notice(str2hex("partial"))
+                if payload["n"] == 0:
+                    raise ValueError("rejected")
+
+            handler.advance_handler.add_sender_route(SENDER, failing)
+            await handler.run_async(2)
+            assert leftovers == [0, 0]
+        return stub
+    stub = asyncio.run(main())
+    assert stub.statuses == ["reject"]
@@ -0,0 +1,93 @@
+import pytest
+
+from handler.cache import InspectCache, StateVersions
+
+def test_hit_until_tag_bumped():
+    versions = StateVersions()
+    cache = InspectCache(versions, max_bytes=1000)
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return "result %d" % len(computed)
+
+    assert cache.cached("route", {"id": 1}, [("user", 1)], compute) == "result 1"
+    assert cache.cached("route", {"id": 1}, [("user", 1)], compute) == "result 1"
+    versions.bump(("user", 2))
+    assert cache.cached("route", {"id": 1}, [("user", 1)], compute) == "result 1"
+    assert (cache.hits, cache.misses) == (2, 1)
+    versions.bump(("user", 1))
+    assert cache.cached("route", {"id": 1}, [("user", 1)], compute) == "result 2"
+    assert cache.stats()["entries"] == 1
+
+def test_payload_key_is_normalized():
+    cache = InspectCache(StateVersions())
+    cache.put(cache.key("route", {"a": 1, "b": 2}), [], "value")
+    assert cache.get(cache.key("route", {"b": 2, "a": 1})) == "value"
+    assert cache.get(cache.key("other", {"a": 1, "b": 2})) is None
+
+def test_value_computed_before_a_bump_is_stale():
+    versions = StateVersions()
+    cache = InspectCache(versions)
+    stamp = versions.clock
+    versions.bump("claims")
+    cache.put("key", ["claims"], "old", stamp)
+    assert cache.get("key") is None
+
+def test_bump_all_invalidates_everything():
+    versions = StateVersions()
+    cache = InspectCache(versions)
+    cache.put("a", [("user", 1)], "1")
+    cache.put("b", [], "2")
+    versions.bump_all()
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert len(cache) == 0 and cache.size == 0
+
+def test_lru_eviction_under_budget():
+    cache = InspectCache(StateVersions(), max_bytes=10)
+    cache.put("a", [], "aaaa")
+    cache.put("b", [], "bbbb")
+    assert cache.get("a") == "aaaa"
+    cache.put("c", ("c1", "c2"), ("cc", "cc"))
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa" and cache.get("c") == ("cc", "cc")
+    assert cache.size == 8
+
+def test_value_over_budget_is_not_cached():
+    cache = InspectCache(StateVersions(), max_bytes=10)
+    cache.put("a", [], "aaaa")
+    cache.put("big", [], "x" * 11)
+    assert cache.get("big") is None
+    assert cache.get("a") == "aaaa"
+    cache.put("a", [], ("x" * 6, "x" * 6))
+    assert cache.get("a") is None and cache.size == 0
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_versions_are_pruned(cached):
+    versions = StateVersions()
+    cache = InspectCache(versions)
+    if cached:
+        versions.bump(("user", "kept"))
+        cache.put("key", [("user", "kept")], "value")
+    for claim_id in range(10 * StateVersions.min_prune):
+        versions.bump(("claims", claim_id))
+    assert len(versions) <= StateVersions.min_prune
+    if cached:
+        assert cache.get("key") == "value"
+        versions.bump(("user", "kept"))
+        assert cache.get("key") is None
+
+def test_pruning_drops_stale_results():
+    versions = StateVersions()
+    cache = InspectCache(versions)
+    versions.bump(("user", 1))
+    cache.put("stale", [("user", 1), ("user", 2)], "value")
+    cache.put("fresh", [("user", 1)], "value")
+    versions.bump(("user", 2))
+    versions.prune()
+    assert len(versions) == 0
+    assert cache.get("stale") is None
+    assert cache.get("fresh") == "value"
+    versions.bump(("user", 1))
+    assert cache.get("fresh") is None
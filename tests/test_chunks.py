@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import random
+import struct
+import tracemalloc
+
+import pytest
+
+import model
+from model import snapshot
+from processor import chunk_store, processor
+from rollups.util import bin2hex
+
+SENDER = "0x" + "0f" * 20
+
+def frames(data, chunk_size=64):
+    compressed = gzip.compress(data, mtime=0)
+    last = (len(compressed) - 1) // chunk_size
+    return [
+        bin2hex(struct.pack(">II", index, last) + compressed[index * chunk_size:(index + 1) * chunk_size])
+        for index in range(last + 1)
+    ]
+
+DATA = b"a,b,c\n" + b"".join(b"%d,,%d\n" % (i, i * 7) for i in range(200))
+
+def test_resent_frame_is_dropped():
+    upload = model.DataChunks()
+    upload_frames = frames(DATA)
+    assert processor.update_data_chunks(upload, upload_frames[0], SENDER)
+    assert not processor.update_data_chunks(upload, upload_frames[0], SENDER)
+    for frame in upload_frames[1:]:
+        assert processor.update_data_chunks(upload, frame, SENDER)
+    assert processor.compose_data_from_chunks(upload) == DATA
+
+def test_same_data_uploaded_twice():
+    upload = model.DataChunks()
+    upload_frames = frames(DATA)
+    for _ in range(2):
+        applied = [processor.update_data_chunks(upload, frame, SENDER) for frame in upload_frames]
+        assert all(applied)
+        assert processor.compose_data_from_chunks(upload) == DATA
+        processor.release_data_chunks(upload)
+
+def test_same_data_in_two_uploads_at_once():
+    first, second = model.DataChunks(), model.DataChunks()
+    upload_frames = frames(DATA)
+    for frame in upload_frames:
+        assert processor.update_data_chunks(first, frame, SENDER)
+        assert processor.update_data_chunks(second, frame, SENDER)
+    assert processor.compose_data_from_chunks(second) == DATA
+
+def test_replaced_frame_is_applied():
+    upload = model.DataChunks()
+    upload_frames = frames(DATA)
+    other = frames(DATA.replace(b"a,b,c", b"x,y,z"))
+    assert processor.update_data_chunks(upload, other[0], SENDER)
+    assert processor.update_data_chunks(upload, upload_frames[0], SENDER)
+    for frame in upload_frames[1:]:
+        processor.update_data_chunks(upload, frame, SENDER)
+    assert processor.compose_data_from_chunks(upload) == DATA
+
+def test_applied_frames_survive_snapshots():
+    upload = model.DataChunks()
+    upload_frames = frames(DATA)
+    processor.update_data_chunks(upload, upload_frames[0], SENDER)
+    restored = snapshot.decode_data_chunks(snapshot.encode_data_chunks(upload))
+    assert not processor.update_data_chunks(restored, upload_frames[0], SENDER)
+    assert processor.update_data_chunks(restored, upload_frames[1], SENDER)
+
+def reassemble(upload_frames, order, max_output=256 * 1024):
+    reassembler = processor.ChunkReassembler(max_output=max_output)
+    pieces = []
+    for index in order:
+        reassembler.add_chunk_hex(upload_frames[index])
+        pieces.extend(reassembler.pieces())
+    assert reassembler.complete
+    return b"".join(pieces)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_reassembler_out_of_order(seed):
+    rng = random.Random(seed)
+    data = rng.randbytes(5000) + DATA * 20
+    upload_frames = frames(data, chunk_size=rng.choice([16, 100, 1000]))
+    order = list(range(len(upload_frames)))
+    rng.shuffle(order)
+    assert reassemble(upload_frames, order, max_output=rng.choice([1, 333, 1 << 20])) == data
+
+def test_reassembler_multi_member():
+    data = DATA * 50
+    compressed = processor.compress_data_parallel(data, workers=2, block_size=1000)
+    last = (len(compressed) - 1) // 64
+    upload_frames = [
+        bin2hex(struct.pack(">II", index, last) + compressed[index * 64:(index + 1) * 64])
+        for index in range(last + 1)
+    ]
+    assert reassemble(upload_frames, reversed(range(len(upload_frames)))) == data
+
+def compressed_frames(compressed, chunk_size=64):
+    last = (len(compressed) - 1) // chunk_size
+    return [
+        bin2hex(struct.pack(">II", index, last) + compressed[index * chunk_size:(index + 1) * chunk_size])
+        for index in range(last + 1)
+    ]
+
+@pytest.mark.parametrize("padding", [1, 16, 200])
+def test_reassembler_skips_trailing_padding(padding):
+    compressed = gzip.compress(DATA, mtime=0) + b"\0" * padding
+    assert gzip.decompress(compressed) == DATA
+    assert reassemble(compressed_frames(compressed), range(len(compressed_frames(compressed)))) == DATA
+    upload = model.DataChunks()
+    for frame in compressed_frames(compressed):
+        processor.update_data_chunks(upload, frame, SENDER)
+    assert processor.compose_data_from_chunks(upload) == DATA
+    assert processor.get_data_chunks_digest(upload) == hashlib.sha256(DATA).digest()
+
+def test_reassembler_padding_between_members():
+    compressed = gzip.compress(DATA, mtime=0) + b"\0" * 100 + gzip.compress(b"tail", mtime=0) + b"\0" * 3
+    assert reassemble(compressed_frames(compressed, 16), range(len(compressed_frames(compressed, 16)))) == DATA + b"tail"
+
+def test_reassembler_rejects_leading_padding():
+    upload_frames = compressed_frames(b"\0" * 4 + gzip.compress(DATA, mtime=0))
+    with pytest.raises(ValueError):
+        reassemble(upload_frames, range(len(upload_frames)))
+
+def test_reassembler_duplicate_chunk():
+    upload_frames = frames(DATA)
+    reassembler = processor.ChunkReassembler()
+    reassembler.add_chunk_hex(upload_frames[1])
+    with pytest.raises(ValueError, match="already received"):
+        reassembler.add_chunk_hex(upload_frames[1])
+    reassembler.add_chunk_hex(upload_frames[0])
+    with pytest.raises(ValueError, match="already received"):
+        reassembler.add_chunk_hex(upload_frames[0])
+
+def test_reassembler_truncated_stream():
+    upload_frames = frames(DATA)
+    reassembler = processor.ChunkReassembler()
+    for frame in upload_frames[:-1]:
+        reassembler.add_chunk_hex(frame)
+    last, total, data = processor.parse_chunk(upload_frames[-1])
+    reassembler.add_chunk(last, bytes(data[:-4]))
+    with pytest.raises(ValueError, match="truncated"):
+        b"".join(reassembler.pieces())
+
+def test_upload_out_of_order_with_duplicates():
+    rng = random.Random(1)
+    upload_frames = frames(DATA, chunk_size=32)
+    sent = upload_frames + rng.sample(upload_frames, 5)
+    rng.shuffle(sent)
+    upload = model.DataChunks()
+    for frame in sent:
+        processor.update_data_chunks(upload, frame, SENDER)
+    assert processor.compose_data_from_chunks(upload) == DATA
+    assert processor.get_data_chunks_digest(upload) == hashlib.sha256(DATA).digest()
+
+def test_upload_missing_chunk():
+    upload = model.DataChunks()
+    upload_frames = frames(DATA, chunk_size=32)
+    for frame in upload_frames[:3] + upload_frames[4:]:
+        processor.update_data_chunks(upload, frame, SENDER)
+    with pytest.raises(ValueError, match="Wrong number of chunks"):
+        processor.compose_data_from_chunks(upload)
+    with pytest.raises(ValueError, match="Wrong number of chunks"):
+        processor.iter_data_from_chunks(upload)
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_prepared_data_uses_level(workers):
+    data = random.Random(2).randbytes(20000) + DATA * 100
+    sizes = {}
+    for level in (0, 1, 9):
+        upload_frames = processor.prepare_data_to_send(data, 4096, workers, level)
+        upload = model.DataChunks()
+        for frame in upload_frames:
+            processor.update_data_chunks(upload, frame, SENDER)
+        assert processor.compose_data_from_chunks(upload) == data
+        sizes[level] = sum(len(frame) for frame in upload_frames)
+    assert sizes[0] > sizes[1] > sizes[9]
+
+def test_shuffled_spilled_upload_memory(monkeypatch, tmp_path):
+    monkeypatch.setattr(chunk_store, "spill_size", 1024 * 1024)
+    monkeypatch.setattr(chunk_store, "data_dir", str(tmp_path))
+    data = random.Random(3).randbytes(6 * 1024 * 1024)
+    upload_frames = frames(data, chunk_size=256 * 1024)
+    upload = model.DataChunks()
+    tracemalloc.start()
+    try:
+        for frame in reversed(upload_frames):
+            processor.update_data_chunks(upload, frame, SENDER)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert isinstance(upload.chunks_data, chunk_store.MmapChunkStore)
+    assert processor.get_data_chunks_digest(upload) == hashlib.sha256(data).digest()
+    # A few frames at a time, not the whole upload.
+    assert peak < 2 * 1024 * 1024
+    processor.release_data_chunks(upload)
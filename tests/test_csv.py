@@ -0,0 +1,72 @@
+import csv
+import io
+import random
+
+import pytest
+
+from processor import processor
+
+def reference_stats(text, nil_fields=()):
+    # csv.reader over the whole text, as csv_blank_cell_percentage used to
+    # score it.
+    nil_fields = {field.lower() for field in nil_fields}
+    total_cells = 0
+    empty_cells = 0
+    column_blanks = []
+    rows = csv.reader(io.StringIO(text))
+    next(rows, None)
+    for record in rows:
+        for i, value in enumerate(record):
+            total_cells += 1
+            if value == "" or value.lower() in nil_fields:
+                empty_cells += 1
+                column_blanks.extend([0] * (i + 1 - len(column_blanks)))
+                column_blanks[i] += 1
+    if total_cells == 0:
+        return 0, column_blanks
+    return 1000000 * (total_cells - empty_cells) // total_cells, column_blanks
+
+def stats(data, nil_fields=(), **kwargs):
+    score, column_blanks = processor.csv_blank_cell_stats(data, list(nil_fields), **kwargs)
+    while column_blanks and column_blanks[-1] == 0:
+        column_blanks = column_blanks[:-1]
+    return score, list(column_blanks)
+
+CASES = {
+    "plain": "a,b,c\n1,2,3\n4,5,6\n",
+    "blanks": "a,b,c\n1,,3\n,,\n4,5,\n",
+    "no trailing newline": "a,b\n1,\n,2",
+    "empty rows": "a,b\n\n1,\n\n\n,2\n\n",
+    "ragged rows": "a,b,c\n1\n1,,2,,3\n,\n",
+    "crlf": "a,b\r\n1,\r\n,2\r\n",
+    "quoted": 'a,b,c\n"x,y",,"z"\n"",1,""\n',
+    "quoted newline": 'a,b\n"line\none",\n,"two\r\nlines"\n3,4\n',
+    "quoted late": "a,b\n" + "1,2\n" * 50 + '"q",\n' + ",3\n" * 50,
+    "header only": "a,b,c\n",
+    "empty": "",
+    "unicode": "nome,valor\nJoão,\nNULL,ção\n",
+}
+
+@pytest.mark.parametrize("name", sorted(CASES))
+@pytest.mark.parametrize("block_size", [1 << 20, 7, 1])
+def test_matches_csv_reader(name, block_size):
+    text = CASES[name]
+    assert stats(text.encode(), block_size=block_size) == reference_stats(text)
+    nil_fields = ["null", "N/A"]
+    assert stats(text.encode(), nil_fields, block_size=block_size) == reference_stats(text, nil_fields)
+
+def test_nil_fields_ignore_case():
+    text = "a,b,c\nNULL,n/a,x\nnull,N/A,Null\n"
+    assert stats(text.encode(), ["Null", "n/A"]) == reference_stats(text, ["Null", "n/A"]) == (166666, [2, 2, 1])
+
+def test_random_files_in_pieces():
+    rng = random.Random(0)
+    cells = ["", "1", "NULL", "x y", '"a,b"', '"c\nd"', '""']
+    for _ in range(50):
+        width = rng.randrange(1, 6)
+        rows = [",".join(rng.choice(cells) for _ in range(rng.choice([width, width, rng.randrange(1, 6)]))) for _ in range(rng.randrange(30))]
+        text = "\n".join(["h"] + rows) + rng.choice(["", "\n", "\r\n"])
+        data = text.encode()
+        cuts = sorted(rng.randrange(len(data) + 1) for _ in range(3))
+        pieces = [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+        assert stats(pieces, ["null"], block_size=rng.choice([5, 64, 1 << 20])) == reference_stats(text, ["null"])
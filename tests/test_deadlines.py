@@ -0,0 +1,117 @@
+import pytest
+
+import dapp_asst
+import model
+from replay.apps import reset_state
+
+CLAIMANT = "0x" + "11" * 20
+DISPUTER = "0x" + "22" * 20
+
+@pytest.fixture(autouse=True)
+def state():
+    reset_state()
+    yield
+    reset_state()
+
+def open_claim(claim_id, timestamp):
+    claim = model.Claim(model.pack_address(CLAIMANT), None, 1, timestamp, model.Status.OPEN, None)
+    return dapp_asst.add_claim(claim_id, claim)
+
+def dispute(claim_id, timestamp):
+    return dapp_asst.update_claim(claim_id, status=model.Status.DISPUTING, disputing_user_address=model.pack_address(DISPUTER), last_edited=timestamp)
+
+def test_open_claim_is_finalized_at_timeout():
+    open_claim(1, 100)
+    deadline = 100 + dapp_asst.claim_timeout
+    assert dapp_asst.expire_claims(deadline - 1) == []
+    assert dapp_asst.claims[1].status == model.Status.OPEN
+    assert dapp_asst.expire_claims(deadline) == [1]
+    assert dapp_asst.claims[1].status == model.Status.FINALIZED
+    assert dapp_asst.claims[1].last_edited == deadline
+    assert dapp_asst.expire_claims(deadline + 1000) == []
+
+def test_claims_expire_in_deadline_order():
+    open_claim(1, 300)
+    open_claim(2, 100)
+    open_claim(3, 200)
+    assert dapp_asst.expire_claims(250 + dapp_asst.claim_timeout) == [2, 3]
+    assert dapp_asst.claims[1].status == model.Status.OPEN
+
+@pytest.mark.parametrize("outcome", [model.Status.VALIDATED, model.Status.CONTRADICTED])
+def test_dispute_is_resolved_at_timeout(outcome):
+    calls = []
+
+    def resolver(claim_id, claim):
+        calls.append((claim_id, claim.status))
+        return outcome
+
+    dapp_asst.dispute_resolver = resolver
+    open_claim(1, 100)
+    dispute(1, 110)
+    deadline = 110 + dapp_asst.dispute_timeout
+    assert dapp_asst.expire_claims(deadline - 1) == []
+    assert dapp_asst.claims[1].status == model.Status.DISPUTING
+    assert dapp_asst.expire_claims(deadline) == [1]
+    assert calls == [(1, model.Status.DISPUTING)]
+    assert dapp_asst.claims[1].status == outcome
+    assert dapp_asst.claims[1].last_edited == deadline
+
+def test_undecided_dispute_stays_disputing():
+    open_claim(1, 100)
+    dispute(1, 110)
+    assert dapp_asst.expire_claims(10 ** 6) == [1]
+    assert dapp_asst.claims[1].status == model.Status.DISPUTING
+    assert len(dapp_asst.deadlines) == 0
+
+    dapp_asst.dispute_resolver = lambda claim_id, claim: None
+    open_claim(2, 100)
+    dispute(2, 110)
+    assert dapp_asst.expire_claims(10 ** 6) == [2]
+    assert dapp_asst.claims[2].status == model.Status.DISPUTING
+
+def test_invalid_resolution_is_rejected():
+    dapp_asst.dispute_resolver = lambda claim_id, claim: model.Status.FINALIZED
+    open_claim(1, 100)
+    dispute(1, 110)
+    with pytest.raises(ValueError):
+        dapp_asst.expire_claims(10 ** 6)
+
+def test_dispute_cancels_open_deadline():
+    dapp_asst.dispute_resolver = lambda claim_id, claim: model.Status.VALIDATED
+    open_claim(1, 100)
+    dispute(1, 100 + dapp_asst.claim_timeout - 1)
+    # The claim deadline passed but the dispute deadline did not.
+    assert dapp_asst.expire_claims(100 + dapp_asst.claim_timeout) == []
+    assert dapp_asst.claims[1].status == model.Status.DISPUTING
+
+def test_edited_claim_does_not_expire_early():
+    open_claim(1, 100)
+    dapp_asst.update_claim(1, value=2, last_edited=120)
+    assert dapp_asst.expire_claims(100 + dapp_asst.claim_timeout) == []
+    assert dapp_asst.claims[1].status == model.Status.OPEN
+    assert dapp_asst.expire_claims(120 + dapp_asst.claim_timeout) == [1]
+    assert dapp_asst.claims[1].status == model.Status.FINALIZED
+
+def test_settled_claim_has_no_deadline():
+    open_claim(1, 100)
+    dapp_asst.update_claim(1, status=model.Status.VALIDATED, last_edited=110)
+    assert dapp_asst.expire_claims(10 ** 6) == []
+    assert dapp_asst.claims[1].status == model.Status.VALIDATED
+
+def test_value_edits_keep_a_single_deadline():
+    calls = []
+    dapp_asst.dispute_resolver = lambda claim_id, claim: calls.append(claim_id) or model.Status.VALIDATED
+    open_claim(1, 100)
+    dispute(1, 110)
+    dapp_asst.update_claim(1, value=2)
+    dapp_asst.update_claim(1, value=3)
+    assert len(dapp_asst.deadlines) == 2
+    assert dapp_asst.expire_claims(1000) == [1]
+    assert calls == [1]
+
+def test_claim_scheduled_twice_with_the_same_token_expires_once():
+    open_claim(1, 100)
+    dapp_asst.update_claim(1, last_edited=105)
+    dapp_asst.update_claim(1, last_edited=100)
+    assert dapp_asst.expire_claims(1000) == [1]
+    assert dapp_asst.claims[1].status == model.Status.FINALIZED
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+import dapp_asst
+import model
+from replay.apps import reset_state
+from rollups.message import MessageException
+from rollups.util import hex2bin
+
+USER = "0x" + "11" * 20
+
+@pytest.fixture
+def reports(monkeypatch):
+    reset_state()
+    sent = []
+
+    def send_report(report):
+        sent.append(hex2bin(report.payload).decode())
+        return object()
+
+    monkeypatch.setattr(dapp_asst, "send_report", send_report)
+    yield sent
+    reset_state()
+
+@pytest.mark.parametrize("payload_map, message", [
+    ({}, "ShowUser: Not enough parameters, you must provide string 'id'"),
+    ({"id": USER}, "ShowUser: User doesn't exist"),
+    ({"id": "not an address"}, "ShowUser: User doesn't exist"),
+])
+def test_show_user_errors_are_hex(reports, payload_map, message):
+    with pytest.raises(MessageException, match=message):
+        dapp_asst.show_user(payload_map)
+    assert reports == [message]
+
+def test_show_user_report_is_hex_json(reports):
+    dapp_asst.get_user(USER).total_claims = 2
+    dapp_asst.show_user({"id": USER})
+    assert json.loads("".join(reports))["totalClaims"] == 2
+
+def test_get_claim_list_report_is_hex_json(reports):
+    dapp_asst.add_claim(7, model.Claim(model.pack_address(USER), None, 5, 100, model.Status.OPEN, None))
+    dapp_asst.get_claim_list({"user": USER})
+    assert json.loads("".join(reports)) == {"claims": [{"id": 7, "status": "open", "value": 5}], "cursor": None}
@@ -0,0 +1,47 @@
+import pytest
+
+import model
+from rollups import asset, ledger
+from rollups.ledger import ETHER, Ledger, LedgerException
+
+ALICE = "0x" + "a1" * 20
+BOB = "0x" + "b0" * 20
+TOKEN = "0x" + "22" * 20
+DAPP = "0x" + "da" * 20
+
+def test_pack_address_is_model_pack_address():
+    assert ledger.pack_address("0x" + "A1" * 20) is model.pack_address(ALICE)
+    assert ledger.pack_address(model.pack_address(ALICE)) is model.pack_address(ALICE)
+
+@pytest.mark.parametrize("address", ["0x1234", "0x" + "zz" * 20, b"\x00" * 19])
+def test_invalid_address(address):
+    with pytest.raises(LedgerException):
+        ledger.pack_address(address)
+    with pytest.raises(LedgerException):
+        Ledger().credit(address, ETHER, 1)
+
+def test_owner_balances():
+    balances = Ledger()
+    balances.credit(ALICE, ETHER, 5)
+    balances.credit(ALICE, TOKEN, 3, token_id=7)
+    balances.credit(BOB, TOKEN, 1)
+    assert balances.owner_balances(ALICE) == {("0x" + "00" * 20, None): 5, (TOKEN, 7): 3}
+
+def test_transaction_rolls_back():
+    balances = Ledger()
+    balances.credit(ALICE, TOKEN, 10)
+    with pytest.raises(LedgerException):
+        balances.transfer_many([(ALICE, BOB, TOKEN, 6), (ALICE, BOB, TOKEN, 6)])
+    assert (balances.balance(ALICE, TOKEN), balances.balance(BOB, TOKEN)) == (10, 0)
+    balances.transfer(ALICE, BOB, TOKEN, 10)
+    assert (balances.balance(ALICE, TOKEN), balances.balance(BOB, TOKEN)) == (0, 10)
+    assert len(balances) == 1
+
+def test_batch_deposit_and_withdrawal():
+    balances = Ledger()
+    balances.deposit(asset.Erc1155BatchDeposit(ALICE, TOKEN, [1, 2], [10, 20], b"", b""))
+    voucher = balances.withdraw_erc1155_batch(DAPP, ALICE, TOKEN, [1, 2], [10, 20])
+    assert voucher == asset.erc1155_safe_batch_transfer_from_voucher(DAPP, ALICE, TOKEN, [1, 2], [10, 20], b"")
+    assert len(balances) == 0
+    with pytest.raises(LedgerException):
+        balances.withdraw_erc1155_batch(DAPP, ALICE, TOKEN, [1], [1])
@@ -0,0 +1,113 @@
+import io
+import json
+import logging
+
+import pytest
+
+from rollups import log
+from rollups.log import CompactFormatter, LogLevel, PayloadSampler
+
+@pytest.fixture
+def root():
+    root = logging.getLogger()
+    handlers, level, handler = root.handlers[:], root.level, log._handler
+    root.handlers = []
+    log._handler = None
+    yield root
+    root.handlers = handlers
+    root.setLevel(level)
+    log._handler = handler
+
+def handlers(root):
+    # Leaves out the handlers pytest adds to capture logs.
+    return [handler for handler in root.handlers if type(handler) is logging.StreamHandler]
+
+def record(message, *args, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 1, message, args, None)
+
+@pytest.mark.parametrize("level, expected", [
+    (LogLevel.DEBUG, logging.DEBUG),
+    (LogLevel.TRACE, log.TRACE),
+    (LogLevel.NONE, logging.CRITICAL + 10),
+    ("debug", logging.DEBUG),
+    (" Warning ", logging.WARNING),
+    ("trace", log.TRACE),
+    ("warn", logging.WARNING),
+    ("10", 10),
+    ("25", 25),
+    (30, 30),
+])
+def test_to_logging_level(level, expected):
+    assert log.to_logging_level(level) == expected
+
+def test_unknown_level():
+    with pytest.raises(ValueError, match="Unknown log level"):
+        log.to_logging_level("loud")
+
+def test_payload_is_truncated_when_formatted():
+    value = {"payload": "0x" + "ab" * 100, "items": ["x" * 5, b"y" * 20], "n": 1}
+    assert str(log.payload("z" * 30, limit=10)) == "zzzzzzzzzz...(+20)"
+    assert log.payload(value, limit=8).__json__() == {
+        "payload": "0xababab...(+194)",
+        "items": ["xxxxx", "b'yyyyyyyy'...(+12)"],
+        "n": 1,
+    }
+    assert str(log.payload("short")) == "short"
+
+def test_payload_is_not_formatted_when_dropped(monkeypatch):
+    calls = []
+    truncate = log._truncate
+    monkeypatch.setattr(log, "_truncate", lambda value, limit: calls.append(value) or truncate(value, limit))
+    logger = logging.getLogger("test.lazy")
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    try:
+        logger.debug("dropped %s", log.payload("a" * 1000))
+        assert calls == [] and stream.getvalue() == ""
+        logger.info("kept %s", log.payload("a" * 1000, limit=4))
+    finally:
+        logger.removeHandler(handler)
+    assert calls == ["a" * 1000]
+    assert stream.getvalue() == "kept aaaa...(+996)\n"
+
+def test_sampler_keeps_one_payload_record_out_of_every():
+    sampler = PayloadSampler(every=3)
+    kept = [sampler.filter(record("input %s", log.payload(n))) for n in range(7)]
+    assert kept == [True, False, False, True, False, False, True]
+    assert sampler.filter(record("no payload %s", 1))
+    assert sampler.filter(record("no arguments"))
+    assert all(PayloadSampler(every=1).filter(record("%s", log.payload(n))) for n in range(3))
+
+def test_compact_formatter():
+    entry = json.loads(CompactFormatter().format(record("input %d: %s", 3, log.payload("0x" + "00" * 10, limit=6), level=logging.WARNING)))
+    assert entry["l"] == "W" and entry["n"] == "test"
+    assert entry["m"] == "input 3: <p>"
+    assert entry["p"] == "0x0000...(+16)"
+    entry = json.loads(CompactFormatter().format(record("%s %s", log.payload(1), log.payload([2]))))
+    assert entry["p"] == [1, [2]]
+    entry = json.loads(CompactFormatter().format(record("plain %d", 5)))
+    assert entry["m"] == "plain 5" and "p" not in entry
+
+def test_configure_from_env(root, monkeypatch):
+    monkeypatch.setenv("DAPP_LOG_LEVEL", "10")
+    monkeypatch.setenv("DAPP_LOG_FORMAT", "compact")
+    stream = io.StringIO()
+    log.configure(level=LogLevel.ERROR, stream=stream)
+    assert root.level == logging.DEBUG
+    logging.getLogger("test.env").debug("value %s", log.payload("x"))
+    assert json.loads(stream.getvalue())["p"] == "x"
+
+def test_configure_defaults_and_later_calls(root, monkeypatch):
+    monkeypatch.delenv("DAPP_LOG_LEVEL", raising=False)
+    monkeypatch.delenv("DAPP_LOG_FORMAT", raising=False)
+    stream = io.StringIO()
+    log.configure(stream=stream, default_level=LogLevel.WARNING)
+    assert root.level == logging.WARNING and handlers(root) == [log._handler]
+    logging.getLogger("test.text").warning("hello %s", log.payload("y"))
+    assert stream.getvalue() == "[WARNING] test.text: hello y\n"
+    log.configure(level="info", compact=True)
+    assert root.level == logging.INFO and handlers(root) == [log._handler]
+    assert isinstance(log._handler.formatter, CompactFormatter)
@@ -0,0 +1,114 @@
+import json
+import random
+
+import pytest
+
+import model
+from rollups import pager
+from rollups.pager import ReportPager, iter_json, send_json
+from rollups.util import hex2bin
+
+def text(value):
+    return "".join(iter_json(value))
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, -7, 2**80, 1.5, "", "plain", "quote \" and \\ and \n", "ção ✓ 😀",
+    [], {}, [1, [2, [3, {}]], None],
+    {"a": 1, "b": [True, None], "c": {"d": "e"}},
+    {1: "int key", 2.5: "float key", True: "bool key", None: "null key"},
+])
+def test_matches_json_dumps(value):
+    assert text(value) == json.dumps(value)
+
+def test_random_documents():
+    rng = random.Random(0)
+
+    def document(depth):
+        kind = rng.randrange(6 if depth < 4 else 3)
+        if kind == 0:
+            return rng.randrange(-10**6, 10**6)
+        if kind == 1:
+            return "".join(rng.choice("ab\"\\\n é") for _ in range(rng.randrange(8)))
+        if kind == 2:
+            return rng.choice([None, True, False, 0.25])
+        if kind == 3:
+            return [document(depth + 1) for _ in range(rng.randrange(5))]
+        return {f"k{n}": document(depth + 1) for n in range(rng.randrange(5))}
+
+    for _ in range(200):
+        value = document(0)
+        assert text(value) == json.dumps(value)
+
+def test_generators_and_bytes():
+    assert text({"ids": (n for n in range(3)), "data": b"\x01\xff"}) == '{"ids": [0, 1, 2], "data": "0x01ff"}'
+    assert text(iter(())) == "[]"
+
+def test_json_hooks():
+    user = model.User()
+    user.open_claims[3] = None
+    user.total_claims = 1
+    claim = model.SimplifiedClaim(id=3, status=model.Status.OPEN, value=9)
+    document = {"user": user, "claims": [claim, claim], "status": model.Status(model.Status.DISPUTING)}
+    assert json.loads(text(document)) == {
+        "user": json.loads(user.__json__()),
+        "claims": [{"id": 3, "status": "open", "value": 9}] * 2,
+        "status": "disputing",
+    }
+
+def test_not_serializable():
+    with pytest.raises(TypeError):
+        text({"a": object()})
+    with pytest.raises(TypeError):
+        text({(1, 2): "tuple key"})
+
+def collect(value, page_size):
+    pages = []
+    count = send_json(value, pages.append, page_size)
+    assert count == len(pages)
+    return pages
+
+@pytest.mark.parametrize("page_size", [1, 7, 64, 1 << 20])
+def test_pages_concatenate_to_the_document(page_size):
+    value = {"claims": [{"id": n, "note": "ção" * (n % 5)} for n in range(500)]}
+    pages = collect(value, page_size)
+    data = [hex2bin(page) for page in pages]
+    assert all(len(page) == page_size for page in data[:-1])
+    assert 0 < len(data[-1]) <= page_size
+    assert b"".join(data).decode() == json.dumps(value)
+
+def test_document_of_exactly_one_page():
+    value = "x" * 30
+    pages = collect(value, len(json.dumps(value)))
+    assert len(pages) == 1 and hex2bin(pages[0]).decode() == json.dumps(value)
+
+def test_large_writes_are_split(monkeypatch):
+    monkeypatch.setattr(pager, "_write_size", 3)
+    pages = collect(["a" * 100, "b" * 10], 16)
+    assert b"".join(map(hex2bin, pages)).decode() == json.dumps(["a" * 100, "b" * 10])
+
+def test_no_last_page_when_encoding_raises(monkeypatch):
+    monkeypatch.setattr(pager, "_write_size", 1)
+    pages = []
+
+    def document():
+        yield "x" * 40
+        raise RuntimeError("failed while encoding")
+
+    with pytest.raises(RuntimeError):
+        send_json(document(), pages.append, 16)
+    # Only the pages filled before the error were sent, never a partial one.
+    assert [len(hex2bin(page)) for page in pages] == [16, 16]
+
+def test_pager_context_manager():
+    pages = []
+    with ReportPager(pages.append, 4) as report:
+        report.write("abcdefghij")
+        report.write(b"kl")
+    assert [hex2bin(page) for page in pages] == [b"abcd", b"efgh", b"ijkl"]
+    assert (report.pages, report.size) == (3, 12)
+    pages.clear()
+    with pytest.raises(ValueError):
+        with ReportPager(pages.append, 4) as report:
+            report.write("abcdef")
+            raise ValueError
+    assert pages == ["0x61626364"]
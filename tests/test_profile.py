@@ -0,0 +1,141 @@
+import json
+
+import pytest
+
+from handler.handler import Handler
+from rollups import profile
+from rollups.util import hex2bin, str2hex
+
+@pytest.fixture
+def profiling(monkeypatch):
+    monkeypatch.setattr(profile, "enabled", False)
+    monkeypatch.setattr(profile, "alloc_every", 0)
+    monkeypatch.setattr(profile, "sample_every", 1)
+    monkeypatch.setattr(profile, "_stats", {})
+    profile.enable()
+    yield profile
+    profile.disable()
+
+def test_nothing_recorded_while_disabled(monkeypatch):
+    monkeypatch.setattr(profile, "enabled", False)
+    monkeypatch.setattr(profile, "_stats", {})
+
+    @profile.timed("test.disabled_func")
+    def func(value):
+        return value * 2
+
+    with profile.stage("test.disabled", bytes_in=10) as stage:
+        stage.bytes_out = 5
+    assert func(2) == 4
+    assert profile.snapshot() == {}
+    assert "test.disabled" not in profile._stats
+    assert profile._stats["test.disabled_func"].calls == 0
+
+def test_stage_counts_calls_and_bytes(profiling):
+    for size in (10, 20, 30):
+        with profiling.stage("test.stage", bytes_in=size) as stage:
+            stage.bytes_out = size // 10
+    stats = profiling.snapshot()["test.stage"]
+    assert (stats["calls"], stats["timed_calls"]) == (3, 3)
+    assert (stats["bytes_in"], stats["bytes_out"]) == (60, 6)
+
+def test_stage_records_failed_calls(profiling):
+    with pytest.raises(KeyError):
+        with profiling.stage("test.failing"):
+            raise KeyError
+    assert profiling.snapshot()["test.failing"]["timed_calls"] == 1
+
+def test_timed_wraps_the_function(profiling):
+    @profiling.timed("test.timed")
+    def double(value):
+        """Doubles."""
+        if value is None:
+            raise ValueError
+        return value * 2
+
+    assert [double(n) for n in range(4)] == [0, 2, 4, 6]
+    with pytest.raises(ValueError):
+        double(None)
+    assert (double.__name__, double.__doc__) == ("double", "Doubles.")
+    stats = profiling.snapshot()["test.timed"]
+    assert (stats["calls"], stats["timed_calls"]) == (5, 5)
+
+def test_fixed_sampling_cadence(profiling, monkeypatch):
+    monkeypatch.setattr(profile, "sample_every", 4)
+
+    @profiling.timed("test.sampled_func")
+    def func():
+        pass
+
+    profiling.reset()
+    for _ in range(10):
+        func()
+        with profiling.stage("test.sampled"):
+            pass
+    for name in ("test.sampled", "test.sampled_func"):
+        stats = profiling.snapshot()[name]
+        # Calls 0, 4 and 8 are timed.
+        assert (stats["calls"], stats["timed_calls"]) == (10, 3)
+
+@pytest.mark.parametrize("elapsed, every", [(1e-3, 1), (3e-5, 4), (1e-7, profile.MAX_SAMPLE_EVERY)])
+def test_adaptive_sampling_cadence(monkeypatch, elapsed, every):
+    monkeypatch.setattr(profile, "sample_every", 0)
+    stats = profile.StageStats()
+    for _ in range(255):
+        stats.add(elapsed)
+    assert stats.every == 1
+    stats.add(elapsed)
+    assert stats.every == every
+
+def test_histogram_percentiles(profiling):
+    for _ in range(98):
+        profiling.record("test.latency", 10e-6)
+    profiling.record("test.latency", 100e-6)
+    profiling.record("test.latency", 5e-3, bytes_in=7)
+    stats = profiling.snapshot()["test.latency"]
+    # Percentiles are the upper bounds of power-of-two microsecond buckets.
+    assert stats["p50_us"] == 16
+    assert stats["p99_us"] == 128
+    assert profiling._stats["test.latency"].percentile(1.0) == pytest.approx(5e-3)
+    assert stats["max_us"] == pytest.approx(5000)
+    assert stats["histogram_us"] == {"16": 98, "128": 1, "8192": 1}
+    assert stats["bytes_in"] == 7
+
+def test_reset_keeps_stats_objects(profiling):
+    @profiling.timed("test.reset")
+    def func():
+        pass
+
+    func()
+    stats = profiling._stats["test.reset"]
+    profiling.reset()
+    assert profiling._stats["test.reset"] is stats
+    assert profiling.snapshot() == {}
+    func()
+    assert profiling.snapshot()["test.reset"]["calls"] == 1
+
+def test_allocation_sampling(profiling):
+    profiling.enable(allocations=1)
+    with profiling.stage("test.alloc"):
+        data = [bytes(1000) for _ in range(100)]
+    del data
+    stats = profiling.snapshot()["test.alloc"]
+    assert stats["alloc_samples"] == 1
+    assert stats["alloc_peak_max"] >= 100 * 1000
+
+def test_profile_route(profiling, monkeypatch):
+    handler = Handler()
+    handler.add_profile_route()
+    reports = []
+    monkeypatch.setattr(handler, "send_report", lambda payload_hex: reports.append(json.loads(hex2bin(payload_hex))))
+    with profiling.stage("test.route"):
+        pass
+
+    assert handler.handle_inspect({"payload": str2hex(json.dumps({"method": "profile"}))}) == "accept"
+    assert reports[-1]["enabled"] is True
+    assert reports[-1]["stages"]["test.route"]["calls"] == 1
+    assert reports[-1]["stages"]["route.report_profile"]["calls"] == 1
+
+    assert handler.handle_inspect({"payload": str2hex(json.dumps({"method": "profile", "reset": True}))}) == "accept"
+    assert "test.route" in reports[-1]["stages"]
+    assert "test.route" not in profiling.snapshot()
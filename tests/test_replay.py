@@ -0,0 +1,39 @@
+"""Replays the workloads in tests/golden and compares the outputs with the recorded ones.
+
+After an intended change to the workloads or their outputs, re-record them with
+
+    REPLAY_RECORD=1 python -m pytest -q tests/test_replay.py
+"""
+import os
+
+import pytest
+
+from replay import workload
+from replay.engine import compare_outputs, load_app, replay
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "golden")
+
+# Small, seeded versions of the benchmark workloads.
+WORKLOADS = {
+    "deposits": lambda: workload.portal_deposits(40, seed=1),
+    "uploads": lambda: workload.chunked_uploads(3, rows=120, chunk_size=512, seed=1, shuffle=True, resend=0.3),
+    "claims": lambda: workload.claim_lifecycle(80, users=10, dispute_rate=0.3, inspect_every=8, seed=1),
+}
+
+RECORD = bool(os.getenv("REPLAY_RECORD"))
+
+def path(name):
+    return os.path.join(GOLDEN, name)
+
+@pytest.mark.parametrize("http", [False, True])
+@pytest.mark.parametrize("name", sorted(WORKLOADS))
+def test_outputs_match_golden(name, http):
+    if RECORD and not http:
+        workload.write_jsonl(path(f"{name}.jsonl"), WORKLOADS[name]())
+    result = replay(workload.read_jsonl(path(f"{name}.jsonl")), load_app("replay.apps:benchmark_handler"), http=http)
+    assert result.errors == []
+    if RECORD and not http:
+        workload.write_jsonl(path(f"{name}.golden.jsonl"), result.outputs)
+    golden = workload.read_jsonl(path(f"{name}.golden.jsonl"))
+    assert golden
+    assert compare_outputs(result.outputs, golden) == []
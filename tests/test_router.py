@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from handler.handler import NetworkAddresses, RoutesAdvanceHandler, RoutesInspectHandler
+from rollups.message import Metadata
+from rollups.util import bin2hex, str2hex
+
+PORTAL = "0x" + "aa" * 20
+ALICE = "0x" + "a1" * 20
+BOB = "0x" + "b0" * 20
+
+def metadata(sender):
+    return Metadata(sender, 0, 0, 0, 0)
+
+def recorder(name, calls):
+    def handle(*args):
+        calls.append((name, args[-1]))
+        return name
+    return handle
+
+@pytest.fixture
+def calls():
+    return []
+
+@pytest.fixture
+def router(calls):
+    router = RoutesAdvanceHandler()
+    router.add_sender_route("0x" + "AA" * 20, recorder("portal", calls))
+    router.add_selector_route("0xa9059cbb", recorder("transfer", calls))
+    router.add_selector_route(b"\x01\x02\x03\x04", recorder("alice transfer", calls), sender=ALICE)
+    router.add_method_route("claim", recorder("claim", calls))
+    router.add_method_route("claim", recorder("alice claim", calls), sender=ALICE)
+    router.set_default(recorder("default", calls))
+    return router
+
+def json_hex(value):
+    return str2hex(json.dumps(value))
+
+def test_sender_route_takes_every_input(router, calls):
+    for payload in (json_hex({"method": "claim"}), "0xa9059cbb", "0x"):
+        assert router.handle(metadata(PORTAL), payload) == "portal"
+    assert calls == [("portal", json_hex({"method": "claim"})), ("portal", "0xa9059cbb"), ("portal", "0x")]
+
+def test_sender_specific_routes_take_precedence(router, calls):
+    assert router.handle(metadata(ALICE), json_hex({"method": "claim", "id": 1})) == "alice claim"
+    assert router.handle(metadata("0x" + "A1" * 20), json_hex({"method": "claim"})) == "alice claim"
+    assert router.handle(metadata(BOB), json_hex({"method": "claim"})) == "claim"
+    assert router.handle(metadata(ALICE), "0x01020304ff") == "alice transfer"
+    assert router.handle(metadata(BOB), "0x01020304ff") == "default"
+    # Alice still reaches the routes registered for any sender.
+    assert router.handle(metadata(ALICE), "0xa9059cbb00") == "transfer"
+
+def test_handler_arguments(router, calls):
+    router.handle(metadata(BOB), json_hex({"method": "claim", "id": 1}))
+    router.handle(metadata(BOB), "0xa9059cbb0001")
+    router.handle(metadata(BOB), "0xdeadbeef")
+    assert calls == [
+        ("claim", {"method": "claim", "id": 1}),
+        ("transfer", b"\xa9\x05\x9c\xbb\x00\x01"),
+        ("default", "0xdeadbeef"),
+    ]
+
+@pytest.mark.parametrize("payload", [
+    json_hex({"method": "unknown"}),
+    json_hex({"method": ["claim"]}),
+    json_hex({"method": {"name": "claim"}}),
+    json_hex({"method": None}),
+    json_hex({"id": 1}),
+    json_hex([1, 2]),
+    str2hex("{not json"),
+    "0x0102",
+    "0x",
+])
+def test_unmatched_inputs_go_to_default(router, calls, payload):
+    assert router.handle(metadata(ALICE), payload) == "default"
+    assert calls == [("default", payload)]
+
+def test_no_default_route():
+    router = RoutesAdvanceHandler()
+    with pytest.raises(ValueError, match="No route"):
+        router.handle(metadata(BOB), json_hex({"method": ["claim"]}))
+
+def test_invalid_selector():
+    with pytest.raises(ValueError):
+        RoutesAdvanceHandler().add_selector_route("0x0102", lambda metadata, payload: None)
+
+def test_portal_routes(calls):
+    addresses = NetworkAddresses(*("0x" + f"{n:02x}" * 20 for n in range(1, 7)))
+    router = RoutesAdvanceHandler()
+    router.add_portal_routes(addresses, ether=recorder("ether", calls), erc1155_batch=recorder("batch", calls))
+    assert router.handle(metadata(addresses.ether_portal_address), "0x00") == "ether"
+    assert router.handle(metadata(addresses.erc1155_batch_portal_address), "0x00") == "batch"
+    with pytest.raises(ValueError):
+        router.handle(metadata(addresses.erc20_portal_address), "0x00")
+
+def test_many_routes(calls):
+    router = RoutesAdvanceHandler()
+    for n in range(60):
+        router.add_method_route(f"method{n}", recorder(f"method{n}", calls))
+        router.add_selector_route(bin2hex(n.to_bytes(4, "big")), recorder(f"selector{n}", calls))
+    for n in range(60):
+        assert router.handle(metadata(BOB), json_hex({"method": f"method{n}"})) == f"method{n}"
+        assert router.handle(metadata(BOB), bin2hex(n.to_bytes(4, "big"))) == f"selector{n}"
+
+def test_inspect_routes(calls):
+    router = RoutesInspectHandler()
+    router.add_route("show_user", recorder("show_user", calls))
+    assert router.handle(json_hex({"method": "show_user", "id": 1})) == "show_user"
+    assert calls == [("show_user", {"method": "show_user", "id": 1})]
+    for payload in (json_hex({"method": ["show_user"]}), json_hex({"method": {}}), "0x00"):
+        with pytest.raises(ValueError, match="No route"):
+            router.handle(payload)
+    router.set_default(recorder("default", calls))
+    assert router.handle(json_hex({"method": ["show_user"]})) == "default"
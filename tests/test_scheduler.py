@@ -0,0 +1,46 @@
+import pytest
+
+from rollups import scheduler
+from rollups.scheduler import Backoff, RequestLoop
+
+class Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+def test_backoff_grows_to_maximum():
+    backoff = Backoff(initial=0.01, maximum=0.1, jitter=0)
+    assert [backoff.next_delay() for _ in range(6)] == pytest.approx([0.01, 0.02, 0.04, 0.08, 0.1, 0.1])
+    backoff.reset()
+    assert backoff.next_delay() == 0.01
+
+def test_backoff_jitter_only_shortens():
+    backoff = Backoff(initial=0.1, maximum=0.1, jitter=0.5)
+    delays = [backoff.next_delay() for _ in range(100)]
+    assert all(0.05 <= delay <= 0.1 for delay in delays)
+
+def test_default_cap_bounds_idle_latency(monkeypatch):
+    monkeypatch.delenv("ROLLUP_IDLE_BACKOFF_MAX", raising=False)
+    backoff = Backoff.from_env()
+    assert max(backoff.next_delay() for _ in range(50)) <= 0.1
+    monkeypatch.setenv("ROLLUP_IDLE_BACKOFF_MAX", "2.5")
+    assert Backoff.from_env().maximum == 2.5
+
+@pytest.mark.parametrize("arguments", [(-1, 1), (0.5, 0.1)])
+def test_invalid_bounds(arguments):
+    with pytest.raises(ValueError):
+        Backoff(*arguments)
+
+def test_input_resets_backoff(monkeypatch):
+    responses = [Response(202)] * 5 + [Response(200, {"request_type": "advance_state", "data": {}})] + [Response(202)] * 2
+    monkeypatch.setattr(scheduler, "send_post", lambda endpoint, data: responses.pop(0))
+    sleeps = []
+    loop = RequestLoop({"advance_state": lambda data: "accept"}, backoff=Backoff(jitter=0), sleep=sleeps.append)
+    loop.run(1)
+    loop.poll()
+    loop.poll()
+    assert sleeps == pytest.approx([0.01, 0.02, 0.04, 0.08, 0.1, 0.01, 0.02])
+    assert loop.stats() == {"idlePolls": 7, "processedInputs": 1, "processedByType": {"advance_state": 1}}
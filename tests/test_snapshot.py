@@ -0,0 +1,76 @@
+import dapp_asst
+import model
+from model import snapshot
+from replay.apps import benchmark_handler
+from replay.engine import replay
+from replay.workload import claim_lifecycle
+
+def claim(user_byte, status, last_edited, value=0):
+    return model.Claim(model.pack_address(bytes([user_byte]) * 20), None, value, last_edited, status, None)
+
+def test_replay_state_round_trip(tmp_path):
+    handler = benchmark_handler()
+    result = replay(claim_lifecycle(200, seed=1), {"advance_state": handler.handle_advance, "inspect_state": handler.handle_inspect})
+    assert not result.errors
+    users = dict(dapp_asst.users)
+    manager = snapshot.SnapshotManager(str(tmp_path), dapp_asst.users, dapp_asst.claims, every=1)
+    manager.write(10)
+
+    restored_users = {}
+    restored_claims = model.ClaimStore()
+    assert snapshot.SnapshotManager(str(tmp_path), restored_users, restored_claims).restore() == 10
+    assert restored_users.keys() == users.keys()
+    assert sum(len(user.open_claims) for user in restored_users.values()) == sum(len(user.open_claims) for user in users.values())
+    for address, user in restored_users.items():
+        assert user.__json__() == users[address].__json__()
+        for claim_id, open_claim in user.open_claims.items():
+            assert open_claim is restored_claims[claim_id]
+        for claim_id, disputed in user.open_disputes.items():
+            assert disputed is restored_claims[claim_id]
+
+def test_delta_round_trip(tmp_path):
+    users, claims = {}, model.ClaimStore()
+    manager = snapshot.SnapshotManager(str(tmp_path), users, claims, every=1, full_every=10)
+    user = model.User()
+    users[model.pack_address(b"\x01" * 20)] = user
+    claims.add(1, claim(1, model.Status.OPEN, 100))
+    user.open_claims[1] = claims[1]
+    manager.write(1)
+    claims.update(1, status=model.Status.DISPUTING, last_edited=200)
+    claims.add(2, claim(1, model.Status.OPEN, 150))
+    user.open_claims[2] = claims[2]
+    manager.mark_user(model.pack_address(b"\x01" * 20))
+    manager.write(2)
+
+    restored_users, restored_claims = {}, model.ClaimStore()
+    snapshot.SnapshotManager(str(tmp_path), restored_users, restored_claims).restore()
+    assert restored_claims.list(status=model.Status.DISPUTING) == ([1], None)
+    restored_user = restored_users[model.pack_address(b"\x01" * 20)]
+    assert list(restored_user.open_claims) == [1, 2]
+    assert restored_user.open_claims[2] is restored_claims[2]
+
+def test_load_replaces_existing_claims():
+    claims = model.ClaimStore()
+    claims.load([(claim_id, claim(claim_id % 3, model.Status.OPEN, 1000 - claim_id)) for claim_id in range(10)])
+    # Reload some ids with other statuses, users and times.
+    claims.load([(claim_id, claim(9, model.Status.FINALIZED, claim_id)) for claim_id in (7, 2, 5)])
+    assert claims.list(status=model.Status.OPEN) == ([0, 1, 3, 4, 6, 8, 9], None)
+    assert claims.list(status=model.Status.FINALIZED) == ([2, 5, 7], None)
+    assert claims.list(user=model.pack_address(b"\x09" * 20)) == ([2, 5, 7], None)
+    assert claims.list(user=model.pack_address(b"\x02" * 20)) == ([8], None)
+    assert [item[1] for item in claims.list_edited()[0]][:3] == [2, 5, 7]
+    assert len(claims) == 10
+
+def test_load_with_repeated_ids():
+    claims = model.ClaimStore()
+    claims.load([
+        (5, claim(1, model.Status.OPEN, 50)),
+        (1, claim(1, model.Status.OPEN, 10)),
+        (3, claim(1, model.Status.OPEN, 30)),
+        (5, claim(2, model.Status.FINALIZED, 5)),
+    ])
+    assert claims.list(status=model.Status.OPEN) == ([1, 3], None)
+    assert claims.list(status=model.Status.FINALIZED) == ([5], None)
+    assert claims.list(user=model.pack_address(b"\x01" * 20)) == ([1, 3], None)
+    assert claims.list_edited()[0] == [(5, 5), (10, 1), (30, 3)]
+    assert list(claims) == [1, 3, 5]
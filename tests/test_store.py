@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+import model
+from model import store
+
+def address(n):
+    return model.pack_address(bytes([n]) * 20)
+
+def random_store(seed=0, count=500):
+    rng = random.Random(seed)
+    claims = model.ClaimStore()
+    for claim_id in range(count):
+        claims.add(claim_id, model.Claim(address(rng.randrange(5)), None, 0, claim_id, rng.randrange(1, 7), None))
+    for _ in range(count):
+        claims.update(rng.randrange(count), status=rng.randrange(1, 7), last_edited=count + rng.randrange(1000))
+    return claims
+
+def collect(claims, **filters):
+    ids, cursor = claims.list(limit=7, **filters)
+    while cursor is not None:
+        page, cursor = claims.list(cursor=cursor, limit=7, **filters)
+        ids += page
+    return ids
+
+@pytest.mark.parametrize("limit", [0, -1, True, 2.5, "10", None])
+def test_invalid_limits(limit):
+    claims = random_store(count=10)
+    with pytest.raises(ValueError):
+        claims.list(limit=limit)
+    with pytest.raises(ValueError):
+        claims.list_edited(limit=limit)
+
+def test_limit_is_clamped():
+    claims = random_store(count=store.max_page_size + 50)
+    page, cursor = claims.list(limit=store.max_page_size * 10)
+    assert len(page) == store.max_page_size and cursor == page[-1]
+    page, cursor = claims.list_edited(limit=store.max_page_size * 10)
+    assert len(page) == store.max_page_size and cursor == page[-1]
+
+def test_status_and_user_index():
+    claims = random_store()
+    for status in range(1, 7):
+        for user in range(5):
+            expected = [claim_id for claim_id, claim in claims.items() if claim.status == status and claim.user_address == address(user)]
+            assert collect(claims, status=status, user=address(user)) == expected
+            assert claims.count(status=status, user=address(user)) == len(expected)
+    for claim_id in list(claims)[::3]:
+        claims.remove(claim_id)
+    expected = [claim_id for claim_id, claim in claims.items() if claim.status == 2 and claim.user_address == address(1)]
+    assert collect(claims, status=model.Status(2), user=address(1)) == expected
+
+def test_status_from_name():
+    assert model.Status.from_name("Disputing") == model.Status.DISPUTING
+    with pytest.raises(ValueError):
+        model.Status.from_name("lost")